@@ -0,0 +1,34 @@
+"""
+Compare rendering of a POST form page with both hidden inputs forms.
+
+Run from repository root::
+
+    PYTHONPATH=.:example DJANGO_SETTINGS_MODULE=tests.settings \
+        python benchmarks/post_forms.py
+"""
+
+import timeit
+
+import django
+
+django.setup()
+
+from getpaid.post_forms import (  # noqa: E402
+    HiddenInputsPostForm,
+    PaymentHiddenInputsPostForm,
+)
+from getpaid.utils import load_template  # noqa: E402
+
+FIELDS = {f"field_{i}": f'value <{i}> & "quoted"' for i in range(20)}
+NUMBER = 50
+
+
+def measure(form_class):
+    template = load_template(("getpaid_dummy/payment_post_form.html",))
+    timer = timeit.Timer(lambda: template.render({"form": form_class(FIELDS)}))
+    return min(timer.repeat(number=NUMBER, repeat=5)) / NUMBER
+
+
+if __name__ == "__main__":
+    for form_class in (HiddenInputsPostForm, PaymentHiddenInputsPostForm):
+        print(f"{form_class.__name__}: {measure(form_class) * 1e6:.0f} us/page")
@@ -1,12 +1,13 @@
 import logging
+import time
 import uuid
 from decimal import Decimal
-from importlib import import_module
 from typing import List, Optional, Union
 
 import swapper
+from asgiref.sync import sync_to_async
 from django import forms
-from django.db import models
+from django.db import models, router
 from django.db.transaction import atomic
 from django.forms import BaseForm
 from django.http import HttpRequest, HttpResponse
@@ -22,14 +23,29 @@ from django_fsm import (
     transition,
 )
 
+from getpaid.archive import is_enabled as archive_enabled
 from getpaid.exceptions import ChargeFailure, GetPaidException
+from getpaid.history import discard_transitions, flush_transitions
+from getpaid.locking import copy_state, run_transition
+from getpaid.managers import PaymentManager
+from getpaid.paywall_log import OUTGOING, paywall_log
 from getpaid.processor import BaseProcessor
 from getpaid.registry import registry
+from getpaid.rollups import STATE_FIELDS as ROLLUP_STATE_FIELDS
+from getpaid.rollups import get_contribution as get_rollup_contribution
+from getpaid.rollups import get_day
+from getpaid.rollups import is_enabled as rollups_enabled
+from getpaid.rollups import rebuild_rollups, update_rollups
+from getpaid.summary import STATE_FIELDS as SUMMARY_STATE_FIELDS
+from getpaid.summary import get_contribution
+from getpaid.summary import is_enabled as summary_enabled
+from getpaid.summary import rebuild_order_summaries, update_order_summary
 from getpaid.types import BuyerInfo, ChargeResponse
 from getpaid.types import FraudStatus as fs
-from getpaid.types import ItemInfo
+from getpaid.types import ItemInfo, PaymentIntent
 from getpaid.types import PaymentStatus as ps
 from getpaid.types import PaymentStatusResponse, RestfulResult
+from getpaid.utils import get_intent_url, import_by_path
 
 logger = logging.getLogger(__name__)
 
@@ -71,10 +87,37 @@ class AbstractOrder(models.Model):
         You can raise :class:`~django.forms.ValidationError` if you want more
         verbose error message.
         """
-        if self.payments.exclude(status=ps.FAILED).exists():
+        summary = self.get_payment_summary()
+        if summary is not None:
+            exists = summary.has_non_failed_payments
+        else:
+            exists = self.payments.exclude(status=ps.FAILED).exists()
+            if not exists and archive_enabled():
+                exists = self.get_archived_payments().exclude(status=ps.FAILED).exists()
+        if exists:
             raise forms.ValidationError(_("Non-failed Payments exist for this Order."))
         return True
 
+    def get_payment_summary(self):
+        """
+        Return :class:`~getpaid.models.OrderPaymentSummary` of this Order
+        or None if ``ORDER_PAYMENT_SUMMARY`` is disabled or there is no summary.
+        """
+        if not summary_enabled():
+            return None
+        try:
+            return self.payment_summary
+        except models.ObjectDoesNotExist:
+            return None
+
+    def get_archived_payments(self):
+        """
+        Queryset of :class:`~getpaid.models.ArchivedPayment` of this Order.
+        """
+        from getpaid.models import ArchivedPayment
+
+        return ArchivedPayment.objects.filter(order_id=self.pk)
+
     def get_items(self) -> List[ItemInfo]:
         """
         There are backends that require some sort of item list to be attached
@@ -122,6 +165,7 @@ class AbstractPayment(ConcurrentTransitionMixin, models.Model):
         verbose_name=_("order"),
         on_delete=models.CASCADE,
         related_name="payments",
+        db_index=False,
     )
     amount_required = models.DecimalField(
         _("amount required"),
@@ -137,13 +181,12 @@ class AbstractPayment(ConcurrentTransitionMixin, models.Model):
         _("status"),
         choices=ps.CHOICES,
         default=ps.NEW,
-        db_index=True,
         protected=True,
     )
-    backend = models.CharField(_("backend"), max_length=100, db_index=True)
+    backend = models.CharField(_("backend"), max_length=100)
     created_on = models.DateTimeField(_("created on"), auto_now_add=True, db_index=True)
     last_payment_on = models.DateTimeField(
-        _("paid on"), blank=True, null=True, default=None, db_index=True
+        _("paid on"), blank=True, null=True, default=None
     )
     amount_locked = models.DecimalField(
         _("amount paid"),
@@ -160,13 +203,13 @@ class AbstractPayment(ConcurrentTransitionMixin, models.Model):
         help_text=_("Amount actually paid."),
     )
     refunded_on = models.DateTimeField(
-        _("refunded on"), blank=True, null=True, default=None, db_index=True
+        _("refunded on"), blank=True, null=True, default=None
     )
     amount_refunded = models.DecimalField(
         _("amount refunded"), decimal_places=4, max_digits=20, default=0
     )
     external_id = models.CharField(
-        _("external id"), max_length=64, blank=True, db_index=True, default=""
+        _("external id"), max_length=64, blank=True, default=""
     )
     description = models.CharField(
         _("description"), max_length=128, blank=True, default=""
@@ -176,11 +219,12 @@ class AbstractPayment(ConcurrentTransitionMixin, models.Model):
         max_length=20,
         choices=fs.CHOICES,
         default=fs.UNKNOWN,
-        db_index=True,
         protected=True,
     )
     fraud_message = models.TextField(_("fraud message"), blank=True)
 
+    objects = PaymentManager()
+
     _processor = None
 
     class Meta:
@@ -188,10 +232,125 @@ class AbstractPayment(ConcurrentTransitionMixin, models.Model):
         ordering = ["-created_on"]
         verbose_name = _("Payment")
         verbose_name_plural = _("Payments")
+        # Composite indexes follow the queries getpaid runs, partial ones are
+        # skipped by databases that don't support them (e.g. MySQL).
+        # Names are fixed as only one concrete Payment model is installed.
+        indexes = [
+            # AbstractOrder.is_ready_for_payment, also serves the FK
+            models.Index(fields=["order", "status"], name="getpaid_payment_order_idx"),
+            # status filters, optionally per backend, in creation order
+            models.Index(
+                fields=["status", "backend", "created_on"],
+                name="getpaid_payment_status_idx",
+            ),
+            # polling of unfinished payments per backend
+            models.Index(
+                fields=["backend", "created_on"],
+                condition=models.Q(status__in=list(ps.active)),
+                name="getpaid_payment_active_idx",
+            ),
+            # callback lookups by paywall's id
+            models.Index(
+                fields=["external_id", "backend"], name="getpaid_payment_ext_idx"
+            ),
+            # payments waiting for manual fraud verification
+            models.Index(
+                fields=["created_on"],
+                condition=models.Q(fraud_status=fs.CHECK.value),
+                name="getpaid_payment_fraud_idx",
+            ),
+        ]
 
     def __str__(self):
         return "Payment #{self.id}".format(self=self)
 
+    def _update_initial_state(self):
+        # called by ConcurrentTransitionMixin after loading and saving
+        # (runs in __init__ - reading a deferred field here would recurse)
+        super()._update_initial_state()
+        deferred = self.get_deferred_fields()
+        self._summary_state = self._rollup_state = None
+        if summary_enabled() and deferred.isdisjoint(SUMMARY_STATE_FIELDS):
+            self._summary_state = get_contribution(self)
+        if rollups_enabled() and deferred.isdisjoint(ROLLUP_STATE_FIELDS):
+            self._rollup_state = get_rollup_contribution(self)
+
+    def _get_values(self, *names):
+        # deferred fields can't be read: django-fsm's refresh_from_db recurses
+        deferred = self.get_deferred_fields().intersection(names)
+        values = {name: self.__dict__.get(name) for name in names}
+        if deferred:
+            values.update(
+                type(self)._base_manager.filter(pk=self.pk).values(*deferred).get()
+            )
+        return [values[name] for name in names]
+
+    def _update_derived(self, adding, summary_before, rollup_before):
+        # unknown state (deferred fields, settings changed) - rebuild instead
+        if summary_enabled():
+            after = self._summary_state
+            if after is not None and (adding or summary_before is not None):
+                update_order_summary(summary_before, after)
+            else:
+                order_ids = set(self._get_values("order_id"))
+                if summary_before is not None:
+                    order_ids.add(summary_before.order_id)
+                rebuild_order_summaries(order_ids)
+        if rollups_enabled():
+            after = self._rollup_state
+            if after is not None and (adding or rollup_before is not None):
+                update_rollups(rollup_before, after)
+            else:
+                created_on, backend = self._get_values("created_on", "backend")
+                keys = {(get_day(created_on), backend)}
+                if rollup_before is not None:
+                    keys.add((rollup_before.day, rollup_before.backend))
+                for day, backend in keys:
+                    rebuild_rollups(days=[day], backends=[backend])
+
+    def save(self, *args, **kwargs):
+        if getattr(self, "is_archived", False):
+            raise GetPaidException("Archived payments are read-only.")
+        track_summary = summary_enabled()
+        track_rollups = rollups_enabled()
+        pending = self.__dict__.get("_pending_transitions")
+        if not track_summary and not track_rollups and not pending:
+            return super().save(*args, **kwargs)
+        adding = self._state.adding
+        before = None if adding else self._summary_state
+        rollup_before = None if adding else self._rollup_state
+        using = kwargs.get("using") or router.db_for_write(type(self), instance=self)
+        with atomic(using=using):
+            super().save(*args, **kwargs)
+            if track_summary or track_rollups:
+                self._update_derived(adding, before, rollup_before)
+            if pending:
+                flush_transitions([self])
+
+    def delete(self, *args, **kwargs):
+        track_summary = summary_enabled()
+        track_rollups = rollups_enabled()
+        if not track_summary and not track_rollups:
+            return super().delete(*args, **kwargs)
+        using = kwargs.get("using") or router.db_for_write(type(self), instance=self)
+        with atomic(using=using):
+            # load deferred fields needed for a rebuild while the row exists
+            order_id, created_on, backend = self._get_values(
+                "order_id", "created_on", "backend"
+            )
+            result = super().delete(*args, **kwargs)
+            if track_summary:
+                if self._summary_state is not None:
+                    update_order_summary(self._summary_state, None)
+                else:
+                    rebuild_order_summaries([order_id])
+            if track_rollups:
+                if self._rollup_state is not None:
+                    update_rollups(self._rollup_state, None)
+                else:
+                    rebuild_rollups(days=[get_day(created_on)], backends=[backend])
+        return result
+
     # First some helpful properties and internals
 
     @property
@@ -215,10 +374,57 @@ class AbstractPayment(ConcurrentTransitionMixin, models.Model):
             processor = registry[self.backend]
         else:
             # last resort if backend has been removed from INSTALLED_APPS
-            module = import_module(self.backend)
-            processor = getattr(module, "PaymentProcessor")
+            processor = import_by_path(f"{self.backend}.PaymentProcessor")
         return processor(self)
 
+    def _call_processor(self, action: str, *args, **kwargs):
+        """
+        Call processor's method, recording it in paywall log if enabled.
+        """
+        method = getattr(self.processor, action)
+        if not paywall_log.enabled:
+            return method(*args, **kwargs)
+        started = time.monotonic()
+        try:
+            result = method(*args, **kwargs)
+        except Exception as e:
+            paywall_log.record(**self._get_log_data(action, started, kwargs, error=e))
+            raise
+        paywall_log.record(**self._get_log_data(action, started, kwargs, result))
+        return result
+
+    async def _acall_processor(self, action: str, *args, **kwargs):
+        """
+        Async version of :meth:`_call_processor`.
+        """
+        method = getattr(self.processor, action)
+        if not paywall_log.enabled:
+            return await method(*args, **kwargs)
+        started = time.monotonic()
+        try:
+            result = await method(*args, **kwargs)
+        except Exception as e:
+            await paywall_log.arecord(
+                **self._get_log_data(action, started, kwargs, error=e)
+            )
+            raise
+        await paywall_log.arecord(**self._get_log_data(action, started, kwargs, result))
+        return result
+
+    def _get_log_data(self, action, started, kwargs, response=None, error=None):
+        return dict(
+            direction=OUTGOING,
+            action=action,
+            payment_id=self.pk,
+            backend=self.backend,
+            duration=time.monotonic() - started,
+            request_data={
+                k: v for k, v in kwargs.items() if k not in ("request", "view")
+            },
+            response=response,
+            error=error,
+        )
+
     # Then some customization enablers
 
     def get_unique_id(self) -> str:
@@ -277,6 +483,12 @@ class AbstractPayment(ConcurrentTransitionMixin, models.Model):
         """
         return self.processor.handle_paywall_callback(request, **kwargs)
 
+    async def ahandle_paywall_callback(self, request, **kwargs) -> HttpResponse:
+        """
+        Async version of :meth:`handle_paywall_callback`.
+        """
+        return await self.processor.ahandle_paywall_callback(request, **kwargs)
+
     def fetch_status(self) -> PaymentStatusResponse:
         """
         Interfaces processor's ``fetch_payment_status``.
@@ -284,15 +496,60 @@ class AbstractPayment(ConcurrentTransitionMixin, models.Model):
         Used during 'PULL' flow. Fetches status from paywall and proposes a callback
         depending on the response.
         """
-        return self.processor.fetch_payment_status()
+        return self._call_processor("fetch_payment_status")
+
+    async def afetch_status(self) -> PaymentStatusResponse:
+        """
+        Async version of :meth:`fetch_status`.
+        """
+        return await self._acall_processor("afetch_payment_status")
 
-    @atomic
     def fetch_and_update_status(self) -> PaymentStatusResponse:
         """
         Used during 'PULL' flow to automatically fetch and update
         Payment's status.
+
+        Status is fetched outside of transaction, the update is done
+        according to ``TRANSITION_LOCKING`` setting.
         """
         status_report = self.fetch_status()
+        return self.store_status_report(status_report)
+
+    async def afetch_and_update_status(self) -> PaymentStatusResponse:
+        """
+        Async version of :meth:`fetch_and_update_status`. Only the database
+        part runs in a worker thread.
+        """
+        status_report = await self.afetch_status()
+        return await sync_to_async(self.store_status_report)(status_report)
+
+    def store_status_report(
+        self, status_report: PaymentStatusResponse
+    ) -> PaymentStatusResponse:
+        """
+        Apply status report in a transaction, retrying on conflicts.
+        See :func:`getpaid.locking.run_transition`.
+        """
+        payment, status_report = run_transition(
+            type(self)._default_manager.all(),
+            self.pk,
+            # fresh copy for each attempt
+            lambda payment: payment.apply_status_report(dict(status_report)),
+            payment=self,
+        )
+        if payment is not self:
+            copy_state(payment, self)
+            # transitions of failed attempts were not saved
+            discard_transitions(self)
+        return status_report
+
+    def apply_status_report(
+        self, status_report: PaymentStatusResponse, save: bool = True
+    ) -> PaymentStatusResponse:
+        """
+        Run the callback proposed by the status report and save the Payment.
+        With ``save=False`` the caller is responsible for saving the changes.
+        """
         callback_name = status_report.get("callback")
         if callback_name:
             callback = getattr(self, callback_name)
@@ -300,8 +557,9 @@ class AbstractPayment(ConcurrentTransitionMixin, models.Model):
             try:
                 if can_proceed(callback):
                     status_report["callback_result"] = callback(amount=amount)
-                    self.save()
-                    status_report["saved"] = True
+                    if save:
+                        self.save()
+                        status_report["saved"] = True
                 else:
                     logger.debug(
                         f"Cannot run fetch+update callback {callback_name}.",
@@ -342,7 +600,31 @@ class AbstractPayment(ConcurrentTransitionMixin, models.Model):
         Interfaces processor's
         :meth:`~getpaid.processor.BaseProcessor.prepare_transaction`.
         """
-        return self.processor.prepare_transaction(request=request, view=None, **kwargs)
+        return self._call_processor(
+            "prepare_transaction", request=request, view=None, **kwargs
+        )
+
+    async def aprepare_transaction(
+        self,
+        request: Optional[HttpRequest] = None,
+        view: Optional[View] = None,
+        **kwargs,
+    ) -> HttpResponse:
+        """
+        Async version of :meth:`prepare_transaction`.
+        """
+        return await self._acall_processor(
+            "aprepare_transaction", request=request, view=view, **kwargs
+        )
+
+    def prepare_payment_intent(
+        self, request: Optional[HttpRequest] = None, **kwargs
+    ) -> PaymentIntent:
+        """
+        Interfaces processor's
+        :meth:`~getpaid.processor.BaseProcessor.prepare_payment_intent`.
+        """
+        return self._call_processor("prepare_payment_intent", request=request, **kwargs)
 
     def prepare_transaction_for_rest(
         self,
@@ -353,7 +635,15 @@ class AbstractPayment(ConcurrentTransitionMixin, models.Model):
         """
         Helper function returning data as dict to better integrate with
         Django REST Framework.
+
+        If the processor supports
+        :meth:`~getpaid.processor.BaseProcessor.prepare_payment_intent`, the
+        data is built from the intent and ``result`` is None.
         """
+        if self.processor.has_payment_intent():
+            return self._get_intent_result(
+                self.prepare_payment_intent(request=request, **kwargs)
+            )
         result = self.prepare_transaction(request=request, view=view, **kwargs)
         data = {"status_code": result.status_code, "result": result}
         if result.status_code == 200:
@@ -368,7 +658,7 @@ class AbstractPayment(ConcurrentTransitionMixin, models.Model):
                         "help_text": field.help_text,
                         "required": field.required,
                     }
-                    for name, field in result.context_data["form"].fields
+                    for name, field in result.context_data["form"].fields.items()
                 ],
             }
         elif result.status_code == 302:
@@ -377,6 +667,34 @@ class AbstractPayment(ConcurrentTransitionMixin, models.Model):
             data["message"] = result.content
         return data
 
+    def _get_intent_result(self, intent: PaymentIntent) -> RestfulResult:
+        if intent["method"] == "GET":
+            return {
+                "status_code": 302,
+                "result": None,
+                "intent": intent,
+                "target_url": get_intent_url(intent),
+            }
+        return {
+            "status_code": 200,
+            "result": None,
+            "intent": intent,
+            "target_url": intent["target_url"],
+            "form": {
+                "fields": [
+                    {
+                        "name": name,
+                        "value": value,
+                        "label": name,
+                        "widget": "HiddenInput",
+                        "help_text": "",
+                        "required": True,
+                    }
+                    for name, value in intent["fields"].items()
+                ]
+            },
+        }
+
     @transition(field=status, source=ps.NEW, target=ps.PREPARED)
     def confirm_prepared(self, **kwargs) -> None:
         """
@@ -401,11 +719,32 @@ class AbstractPayment(ConcurrentTransitionMixin, models.Model):
         """
         Interfaces processor's :meth:`~getpaid.processor.BaseProcessor.charge`.
         """
+        amount = self._get_charge_amount(amount)
+        result = self._call_processor("charge", amount=amount, **kwargs)
+        return self._apply_charge_result(amount, result)
+
+    async def acharge(
+        self, amount: Optional[Union[Decimal, float, int]] = None, **kwargs
+    ) -> ChargeResponse:
+        """
+        Async version of :meth:`charge`.
+        """
+        amount = self._get_charge_amount(amount)
+        result = await self._acall_processor("acharge", amount=amount, **kwargs)
+        return await sync_to_async(atomic(self._apply_charge_result))(amount, result)
+
+    def _get_charge_amount(
+        self, amount: Optional[Union[Decimal, float, int]] = None
+    ) -> Union[Decimal, float, int]:
         if amount is None:
             amount = self.amount_locked
         if amount > self.amount_locked:
             raise ValueError("Cannot charge more than locked value.")
-        result = self.processor.charge(amount=amount, **kwargs)
+        return amount
+
+    def _apply_charge_result(
+        self, amount: Union[Decimal, float, int], result: ChargeResponse
+    ) -> ChargeResponse:
         if "amount_charged" in result or result.get("success", False):
             self.amount_paid = result.get("amount_charged", amount)
             self.amount_locked -= self.amount_paid
@@ -478,7 +817,7 @@ class AbstractPayment(ConcurrentTransitionMixin, models.Model):
         """
         self.amount_refunded = self.amount_locked
         self.amount_locked = 0
-        return self.processor.release_lock(**kwargs)
+        return self._call_processor("release_lock", **kwargs)
 
     @transition(field=status, source=[ps.PAID, ps.PARTIAL], target=ps.REFUND_STARTED)
     def start_refund(
@@ -491,14 +830,14 @@ class AbstractPayment(ConcurrentTransitionMixin, models.Model):
             amount = self.amount_paid
         if amount > self.amount_paid:
             raise ValueError("Cannot refund more than amount paid.")
-        return self.processor.start_refund(amount=amount, **kwargs)
+        return self._call_processor("start_refund", amount=amount, **kwargs)
 
     @transition(field=status, source=ps.REFUND_STARTED, target=ps.PARTIAL)
     def cancel_refund(self, **kwargs) -> bool:
         """
         Interfaces processor's :meth:`~getpaid.processor.BaseProcessor.charge`.
         """
-        return self.processor.cancel_refund()
+        return self._call_processor("cancel_refund")
 
     @transition(field=status, source=ps.REFUND_STARTED, target=ps.PARTIAL)
     def confirm_refund(
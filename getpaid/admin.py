@@ -1,12 +1,61 @@
 from django.contrib import admin
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.translation import gettext_lazy as _
 
-from . import models
+from . import archive, models
+from .pagination import EstimatedCountPaginator, KeysetChangeList
+
+
+class ExactSearchMixin:
+    """
+    Search by exact values of :attr:`exact_search_fields`, so that lookups
+    use indexes. Whitespace separated terms are alternatives. Terms starting
+    with :attr:`broad_search_prefix` use regular ``search_fields`` instead.
+    """
+
+    #: Fields compared with the whole term; a term that isn't a valid value
+    #: of a field (e.g. not a UUID) is not compared with that field.
+    exact_search_fields = ("pk", "external_id", "order")
+    broad_search_prefix = "~"
+    search_help_text = _(
+        "Exact payment id, external id or order id. "
+        "Prefix with ~ to search for parts of them."
+    )
+
+    def get_exact_search_query(self, term: str) -> Q:
+        opts = self.model._meta
+        query = Q()
+        for name in self.exact_search_fields:
+            field = opts.pk if name == "pk" else opts.get_field(name)
+            field = getattr(field, "target_field", field)
+            try:
+                value = field.to_python(term)
+            except ValidationError:
+                continue
+            query |= Q(**{name: value})
+        return query
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if search_term.startswith(self.broad_search_prefix):
+            return super().get_search_results(
+                request, queryset, search_term[len(self.broad_search_prefix) :]
+            )
+        if not search_term:
+            return queryset, False
+        query = Q()
+        for term in search_term.split():
+            query |= self.get_exact_search_query(term)
+        if not query:
+            return queryset.none(), False
+        return queryset.filter(query), False
 
 
 # Payment model is used here directly so that this PaymentAdmin does not show
 # if Payment is swapped.
 @admin.register(models.Payment)
-class PaymentAdmin(admin.ModelAdmin):
+class PaymentAdmin(ExactSearchMixin, admin.ModelAdmin):
     list_display = (
         "id",
         "order_id",
@@ -18,5 +67,57 @@ class PaymentAdmin(admin.ModelAdmin):
         "last_payment_on",
         "amount_paid",
     )
-    search_fields = ("id", "order_id")
+    search_fields = ("id", "external_id", "order__pk")
     date_hierarchy = "created_on"
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    change_list_template = "admin/getpaid/keyset_change_list.html"
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if hasattr(queryset, "for_profile"):
+            queryset = queryset.for_profile("admin")
+        return queryset
+
+    def get_object(self, request, object_id, from_field=None):
+        obj = super().get_object(request, object_id, from_field)
+        if obj is None and from_field is None:
+            try:
+                obj = archive.get_archived(pk=object_id)
+            except (ValueError, ValidationError):
+                obj = None
+        return obj
+
+    def has_change_permission(self, request, obj=None):
+        if getattr(obj, "is_archived", False):
+            return False
+        return super().has_change_permission(request, obj)
+
+    def has_delete_permission(self, request, obj=None):
+        if getattr(obj, "is_archived", False):
+            return False
+        return super().has_delete_permission(request, obj)
+
+
+@admin.register(models.ArchivedPayment)
+class ArchivedPaymentAdmin(ExactSearchMixin, admin.ModelAdmin):
+    list_display = (
+        "id",
+        "order_id",
+        "status",
+        "backend",
+        "external_id",
+        "created_on",
+        "archived_on",
+    )
+    search_fields = ("id", "external_id", "order__pk")
+    date_hierarchy = "created_on"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
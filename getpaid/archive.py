@@ -0,0 +1,127 @@
+"""
+Archive of terminal payments (:class:`~getpaid.models.ArchivedPayment`).
+
+``getpaid_archive`` moves old ``PAID``, ``REFUNDED`` and ``FAILED`` payments
+out of the payments table in batches, each in its own transaction, so an
+interrupted run can simply be started again. With ``PAYMENT_ARCHIVE``
+enabled, lookups made by :class:`~getpaid.views.FallbackView`, the admin and
+:meth:`~getpaid.models.AbstractOrder.is_ready_for_payment` fall back to
+the archive. Archived payments are read-only.
+"""
+
+from datetime import datetime
+from typing import Iterable, Iterator, Optional
+
+import swapper
+from django.conf import settings
+from django.core import serializers
+from django.db.models import QuerySet
+from django.db.transaction import atomic
+
+from getpaid.summary import is_enabled as summary_enabled
+from getpaid.summary import rebuild_order_summaries
+from getpaid.types import PaymentStatus as ps
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def is_enabled() -> bool:
+    return getattr(settings, "GETPAID", {}).get("PAYMENT_ARCHIVE", False)
+
+
+def archive_payment(payment):
+    from getpaid.models import ArchivedPayment
+
+    return ArchivedPayment(
+        id=payment.pk,
+        order_id=payment.order_id,
+        backend=payment.backend,
+        external_id=payment.external_id,
+        status=payment.status,
+        currency=payment.currency,
+        amount_required=payment.amount_required,
+        amount_locked=payment.amount_locked,
+        amount_paid=payment.amount_paid,
+        amount_refunded=payment.amount_refunded,
+        created_on=payment.created_on,
+        data=serializers.serialize("json", [payment]),
+    )
+
+
+def restore(archived):
+    """
+    Build Payment instance from archived row. The instance is marked with
+    ``is_archived`` and refuses to be saved.
+    """
+    payment = next(serializers.deserialize("json", archived.data)).object
+    payment._state.adding = False
+    payment._state.db = archived._state.db
+    payment.is_archived = True
+    return payment
+
+
+def archive_payments(
+    before: datetime,
+    statuses: Optional[Iterable[str]] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    queryset: Optional[QuerySet] = None,
+) -> Iterator[int]:
+    """
+    Move payments created before ``before`` in one of terminal ``statuses``
+    to the archive. Yields number of payments moved in each batch.
+    Archived payments still count towards order summaries, which are rebuilt
+    for each batch.
+    """
+    from getpaid.models import ArchivedPayment
+
+    if queryset is None:
+        queryset = swapper.load_model("getpaid", "Payment")._default_manager.all()
+    statuses = list(statuses or ps.terminal)
+    if set(statuses) - set(ps.terminal):
+        raise ValueError("Only payments in terminal statuses can be archived.")
+    queryset = queryset.filter(status__in=statuses, created_on__lt=before)
+    last_pk = None
+    while True:
+        batch = queryset.order_by("pk")
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        pks = list(batch.values_list("pk", flat=True)[:batch_size])
+        if not pks:
+            return
+        last_pk = pks[-1]
+        with atomic(using=queryset.db):
+            # status is checked again under lock
+            payments = list(queryset.filter(pk__in=pks).select_for_update())
+            ArchivedPayment.objects.bulk_create(
+                [archive_payment(p) for p in payments], ignore_conflicts=True
+            )
+            queryset.filter(pk__in=[p.pk for p in payments]).delete()
+            if summary_enabled():
+                rebuild_order_summaries({p.order_id for p in payments})
+        yield len(payments)
+
+
+def get_archived(**lookup):
+    """
+    Restored payment matching lookup (on ``pk``, ``external_id``, ``backend``,
+    ``order`` or ``status``) or None.
+    """
+    from getpaid.models import ArchivedPayment
+
+    if not is_enabled():
+        return None
+    archived = ArchivedPayment.objects.filter(**lookup).first()
+    return restore(archived) if archived is not None else None
+
+
+def get_payment(queryset: QuerySet, **lookup):
+    """
+    ``queryset.get(**lookup)`` falling back to the archive.
+    """
+    try:
+        return queryset.get(**lookup)
+    except queryset.model.DoesNotExist:
+        payment = get_archived(**lookup)
+        if payment is None:
+            raise
+        return payment
@@ -11,12 +11,11 @@ import os
 from urllib.parse import urljoin
 
 import requests
-from django.http import HttpResponse, HttpResponseRedirect
-from django.template.response import TemplateResponse
+from django.http import HttpResponse
 from django.urls import reverse, reverse_lazy
 from django_fsm import can_proceed
 
-from getpaid.post_forms import PaymentHiddenInputsPostForm
+from getpaid.post_forms import HiddenInputsPostForm
 from getpaid.processor import BaseProcessor
 from getpaid.status import PaymentStatus as ps
 
@@ -33,8 +32,8 @@ class PaymentProcessor(BaseProcessor):
     ok_statuses = [200]
     method = "REST"  # Supported modes: REST, POST, GET
     confirmation_method = "PUSH"  # PUSH or PULL
-    post_form_class = PaymentHiddenInputsPostForm
-    post_template_name = "dummy/payment_post_form.html"
+    post_form_class = HiddenInputsPostForm
+    post_template_name = "getpaid_dummy/payment_post_form.html"
     _token = None
     standard_url = reverse_lazy("paywall:gateway")
     api_url = reverse_lazy("paywall:api_register")
@@ -77,7 +76,7 @@ class PaymentProcessor(BaseProcessor):
         return {k: str(v) for k, v in params.items()}
 
     # Specifics
-    def prepare_transaction(self, request, view=None, **kwargs):
+    def prepare_payment_intent(self, request=None, **kwargs):
         target_url = self.get_paywall_baseurl(request)
         params = self.get_params()
         method = self.get_paywall_method()
@@ -86,22 +85,28 @@ class PaymentProcessor(BaseProcessor):
             if response.status_code in self.ok_statuses:
                 self.payment.confirm_prepared()
                 self.payment.save()
-            return HttpResponseRedirect(response.json()["url"])
+            return {"target_url": response.json()["url"], "method": "GET", "fields": {}}
         elif method == "POST":
             self.payment.confirm_prepared()
             self.payment.save()
-            form = self.get_form(params)
-            return TemplateResponse(
-                request=request,
-                template=self.get_template_names(view=view),
-                context={"form": form, "paywall_url": target_url},
-            )
+            return {"target_url": target_url, "method": "POST", "fields": params}
         else:
             # GET payments are a bit tricky. You can either confirm payment as
             # prepared here, or on successful return from paywall.
             self.payment.confirm_prepared()
             self.payment.save()
-            return HttpResponseRedirect(target_url)
+            return {"target_url": target_url, "method": "GET", "fields": {}}
+
+    def prepare_transaction(self, request, view=None, **kwargs):
+        intent = self.prepare_payment_intent(request, **kwargs)
+        return self.get_intent_response(intent, request=request, view=view)
+
+    @classmethod
+    def get_callback_external_id(cls, request, **kwargs):
+        try:
+            return json.loads(request.body).get("paymentId")
+        except (ValueError, AttributeError):
+            return None
 
     def handle_paywall_callback(self, request, **kwargs):
         new_status = json.loads(request.body).get("new_status")
@@ -1,4 +1,5 @@
 from django.urls import path
+from django.views.decorators.csrf import csrf_exempt
 
 from . import views
 
@@ -7,7 +8,7 @@ app_name = "dummy"
 urlpatterns = [
     path(
         "callback/",
-        views.CallbackView.as_view(),
+        csrf_exempt(views.CallbackView.as_view()),
         name="callback",
     ),
 ]
@@ -0,0 +1,310 @@
+import hashlib
+import json
+import logging
+from datetime import timedelta
+from functools import partial
+from io import BytesIO
+from typing import List, Optional
+
+import swapper
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.db import IntegrityError, connection
+from django.db.models import F
+from django.db.transaction import atomic
+from django.http import HttpRequest, QueryDict
+from django.utils.timezone import now
+
+from getpaid.locking import run_transition
+from getpaid.managers import get_payment_queryset
+from getpaid.models import CallbackFingerprint, QueuedCallback
+from getpaid.types import QueuedCallbacksResult
+
+logger = logging.getLogger(__name__)
+
+META_KEYS = ("CONTENT_TYPE", "CONTENT_LENGTH", "QUERY_STRING", "REMOTE_ADDR")
+
+DEFAULT_LOOKUP_TTL = 3600
+#: Seconds a claimed callback is hidden from other workers.
+DEFAULT_CLAIM_TIMEOUT = 300
+#: Seconds before the first retry of a failed callback.
+DEFAULT_RETRY_DELAY = 30
+
+
+def enqueue_callback(request: HttpRequest, pk) -> QueuedCallback:
+    """
+    Store raw callback request for later processing.
+    """
+    meta = {
+        key: value
+        for key, value in request.META.items()
+        if (key in META_KEYS or key.startswith("HTTP_")) and isinstance(value, str)
+    }
+    return QueuedCallback.objects.create(
+        payment_id=pk,
+        method=request.method,
+        path=request.path,
+        meta=json.dumps(meta),
+        body=request.body,
+    )
+
+
+def build_request(entry: QueuedCallback) -> HttpRequest:
+    """
+    Recreate the request from stored callback, so that it can be passed to
+    :meth:`~getpaid.processor.BaseProcessor.handle_paywall_callback`.
+    """
+    body = bytes(entry.body)
+    request = HttpRequest()
+    request.method = entry.method
+    request.path = request.path_info = entry.path
+    request.META = json.loads(entry.meta)
+    request.GET = QueryDict(request.META.get("QUERY_STRING", ""))
+    request._set_content_type_params(request.META)
+    request._body = body
+    request._stream = BytesIO(body)
+    return request
+
+
+def claim_callbacks(
+    batch_size: int = 100,
+    max_attempts: int = 5,
+    claim_timeout: float = DEFAULT_CLAIM_TIMEOUT,
+) -> List[QueuedCallback]:
+    """
+    Take due callbacks for processing, counting it as an attempt. Claimed
+    callbacks are hidden from other workers for ``claim_timeout`` seconds,
+    so callbacks of a crashed worker are picked up again later. Callbacks
+    out of attempts are given up.
+    """
+    claimed_on = now()
+    with atomic():
+        due = QueuedCallback.objects.filter(next_attempt_on__lte=claimed_on)
+        given_up = due.filter(attempts__gte=max_attempts).update(next_attempt_on=None)
+        if given_up:
+            logger.error("Gave up %d queued callbacks out of attempts.", given_up)
+        entries = due.filter(attempts__lt=max_attempts)
+        if connection.features.has_select_for_update_skip_locked:
+            entries = entries.select_for_update(skip_locked=True)
+        entries = list(entries.order_by("id")[:batch_size])
+        QueuedCallback.objects.filter(id__in=[e.id for e in entries]).update(
+            attempts=F("attempts") + 1,
+            next_attempt_on=claimed_on + timedelta(seconds=claim_timeout),
+        )
+    for entry in entries:
+        entry.attempts += 1
+    return entries
+
+
+def _handle_callback(entry, request: HttpRequest, ttl, payment) -> None:
+    processor = payment.processor
+    if not processor.verify_callback(request, processor.backend_config):
+        raise ValueError("Callback failed verification.")
+    fingerprint = None
+    if ttl:
+        fingerprint = get_callback_fingerprint(request, payment.pk, payment.backend)
+    # queued duplicate of an already handled callback is just dropped
+    if fingerprint is None or not is_callback_fingerprint_registered(fingerprint, ttl):
+        response = payment.handle_paywall_callback(request)
+        if response.status_code >= 400:
+            raise ValueError(f"Callback answered with {response}.")
+        if fingerprint is not None:
+            remember_payment_backend(payment.pk, payment.backend, ttl)
+            register_callback_fingerprint(fingerprint, ttl)
+    entry.delete()
+
+
+def _retry_later(entry, error: Exception, max_attempts: int, retry_delay: float):
+    entry.last_error = repr(error)
+    if entry.attempts < max_attempts:
+        delay = retry_delay * 2 ** (entry.attempts - 1)
+        entry.next_attempt_on = now() + timedelta(seconds=delay)
+    else:
+        entry.next_attempt_on = None
+        logger.error(
+            "Gave up queued callback.",
+            extra={"callback_id": entry.id, "payment_id": entry.payment_id},
+        )
+    entry.save(update_fields=["last_error", "next_attempt_on"])
+
+
+def process_callbacks(
+    batch_size: int = 100,
+    max_attempts: int = 5,
+    retry_delay: float = DEFAULT_RETRY_DELAY,
+    claim_timeout: float = DEFAULT_CLAIM_TIMEOUT,
+) -> QueuedCallbacksResult:
+    """
+    Handle one batch of queued callbacks claimed with :func:`claim_callbacks`.
+    Each callback is handled in its own transaction with
+    :func:`~getpaid.locking.run_transition`, so ``TRANSITION_LOCKING`` applies
+    as in the callback views, and is deleted in the same transaction. Failed
+    callbacks are retried after ``retry_delay`` seconds (doubled after each
+    attempt) and given up after ``max_attempts``. With
+    ``CALLBACK_DEDUPLICATION_TTL`` set, handled callbacks are remembered by
+    their fingerprint and repeated deliveries are dropped.
+
+    Several workers can run concurrently on databases supporting
+    ``SELECT ... FOR UPDATE SKIP LOCKED``.
+    """
+    Payment = swapper.load_model("getpaid", "Payment")
+    queryset = get_payment_queryset(Payment, "callback")
+    ttl = _get_setting("CALLBACK_DEDUPLICATION_TTL")
+    result = {"processed": 0, "failed": 0}
+    entries = claim_callbacks(batch_size, max_attempts, claim_timeout)
+    payments = queryset.in_bulk({e.payment_id for e in entries})
+    for entry in entries:
+        try:
+            payment, _ = run_transition(
+                queryset,
+                entry.payment_id,
+                partial(_handle_callback, entry, build_request(entry), ttl),
+                payments.get(entry.payment_id),
+            )
+        except Exception as e:
+            logger.warning(
+                "Could not process queued callback.",
+                exc_info=True,
+                extra={"callback_id": entry.id, "payment_id": entry.payment_id},
+            )
+            # in-memory state may be out of sync with database now
+            payments.pop(entry.payment_id, None)
+            _retry_later(entry, e, max_attempts, retry_delay)
+            result["failed"] += 1
+        else:
+            payments[entry.payment_id] = payment
+            result["processed"] += 1
+    return result
+
+
+def prune_dead_callbacks(days: float) -> int:
+    """
+    Remove given up callbacks received more than ``days`` ago.
+    """
+    deleted, _ = QueuedCallback.objects.filter(
+        next_attempt_on__isnull=True, received_on__lt=now() - timedelta(days=days)
+    ).delete()
+    return deleted
+
+
+def get_callback_fingerprint(request: HttpRequest, pk, backend: str = "") -> str:
+    """
+    Hash of backend, payment pk and request body. JSON bodies are normalized
+    so that formatting and key order don't matter.
+    """
+    body = request.body
+    if request.content_type == "application/json":
+        try:
+            body = json.dumps(
+                json.loads(body), sort_keys=True, separators=(",", ":")
+            ).encode()
+        except ValueError:
+            pass
+    digest = hashlib.sha256(f"{backend}\0{pk}\0".encode())
+    digest.update(body)
+    return digest.hexdigest()
+
+
+def register_callback_fingerprint(fingerprint: str, ttl: float) -> bool:
+    """
+    Remember the fingerprint. Returns ``False`` if the same fingerprint has
+    already been registered within last ``ttl`` seconds.
+    """
+    received_on = now()
+    try:
+        with atomic():
+            CallbackFingerprint.objects.create(
+                fingerprint=fingerprint, received_on=received_on
+            )
+        return True
+    except IntegrityError:
+        # expired, but not yet pruned
+        return bool(
+            CallbackFingerprint.objects.filter(
+                fingerprint=fingerprint,
+                received_on__lt=received_on - timedelta(seconds=ttl),
+            ).update(received_on=received_on)
+        )
+
+
+def is_callback_fingerprint_registered(fingerprint: str, ttl: float) -> bool:
+    """
+    Check if the fingerprint has been registered within last ``ttl`` seconds.
+    """
+    return CallbackFingerprint.objects.filter(
+        fingerprint=fingerprint, received_on__gte=now() - timedelta(seconds=ttl)
+    ).exists()
+
+
+def prune_callback_fingerprints(ttl: float) -> int:
+    """
+    Remove fingerprints older than ``ttl`` seconds.
+    """
+    deleted, _ = CallbackFingerprint.objects.filter(
+        received_on__lt=now() - timedelta(seconds=ttl)
+    ).delete()
+    return deleted
+
+
+def _get_setting(name, default=None):
+    return getattr(settings, "GETPAID", {}).get(name, default)
+
+
+def _lookup_key(backend: str, external_id: str) -> str:
+    digest = hashlib.sha256(f"{backend}\0{external_id}".encode()).hexdigest()
+    return f"getpaid:external_id:{digest}"
+
+
+def _lookup_cache():
+    return caches[_get_setting("CALLBACK_LOOKUP_CACHE", DEFAULT_CACHE_ALIAS)]
+
+
+def get_payment_pk(backend: str, external_id: str):
+    """
+    Primary key of the payment of ``backend`` with given ``external_id``,
+    or None. Found keys are cached for ``CALLBACK_LOOKUP_TTL`` seconds, so
+    repeated callbacks only need to fetch the payment by pk.
+    """
+    ttl = _get_setting("CALLBACK_LOOKUP_TTL", DEFAULT_LOOKUP_TTL)
+    key = _lookup_key(backend, external_id)
+    if ttl:
+        pk = _lookup_cache().get(key)
+        if pk is not None:
+            return pk
+    Payment = swapper.load_model("getpaid", "Payment")
+    pks = list(
+        Payment._default_manager.filter(
+            external_id=external_id, backend=backend
+        ).values_list("pk", flat=True)[:1]
+    )
+    if not pks:
+        return None
+    if ttl:
+        _lookup_cache().set(key, pks[0], ttl)
+    return pks[0]
+
+
+def _backend_key(pk) -> str:
+    return f"getpaid:payment_backend:{pk}"
+
+
+def remember_payment_backend(pk, backend: str, ttl: float) -> None:
+    """
+    Cache payment's backend, so that a repeated callback can be fingerprinted
+    without loading the payment.
+    """
+    _lookup_cache().set(_backend_key(pk), backend, ttl)
+
+
+def get_payment_backend(pk) -> Optional[str]:
+    """
+    Backend cached by :func:`remember_payment_backend` or None.
+    """
+    return _lookup_cache().get(_backend_key(pk))
+
+
+def forget_payment_pk(backend: str, external_id: str) -> None:
+    """
+    Drop cached result of :func:`get_payment_pk`, eg. when the payment is gone.
+    """
+    _lookup_cache().delete(_lookup_key(backend, external_id))
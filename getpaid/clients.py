@@ -0,0 +1,138 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = 32
+DEFAULT_KEEPALIVE = 300
+
+
+def _freeze(value: Any) -> Hashable:
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, set):
+        return frozenset(_freeze(v) for v in value)
+    hash(value)  # raise TypeError early for unhashable leaves
+    return value
+
+
+def _close(client: object) -> None:
+    close = getattr(client, "close", None)
+    if callable(close):
+        try:
+            close()
+        except Exception:  # pragma: no cover
+            logger.exception("Error while closing pooled client.")
+
+
+class ClientPool:
+    """
+    Process-wide store of long-lived gateway clients.
+
+    Clients are keyed by backend path, client class and client params, so
+    processors for the same backend share one warm client (and the
+    connections it keeps) - so pooled clients must be thread-safe. Clients
+    idle for longer than ``keepalive`` seconds are replaced, least recently
+    used ones are dropped when the pool exceeds ``max_size``. Dropped clients
+    are not closed, as processors may still use them; they're released with
+    the last reference. The pool empties itself after fork so that child
+    processes never share sockets with their parent.
+    """
+
+    def __init__(
+        self, max_size: Optional[int] = None, keepalive: Optional[float] = None
+    ) -> None:
+        self._max_size = max_size
+        self._keepalive = keepalive
+        self._clients = OrderedDict()
+        self._lock = threading.RLock()
+        self._pid = os.getpid()
+
+    @property
+    def max_size(self) -> int:
+        if self._max_size is not None:
+            return self._max_size
+        return getattr(settings, "GETPAID", {}).get(
+            "CLIENT_POOL_MAX_SIZE", DEFAULT_MAX_SIZE
+        )
+
+    @property
+    def keepalive(self) -> float:
+        if self._keepalive is not None:
+            return self._keepalive
+        return getattr(settings, "GETPAID", {}).get(
+            "CLIENT_POOL_KEEPALIVE", DEFAULT_KEEPALIVE
+        )
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def _check_pid(self) -> None:
+        pid = os.getpid()
+        if pid != self._pid:
+            # Forked: connections belong to the parent, just forget them.
+            self._clients = OrderedDict()
+            self._pid = pid
+
+    def get(self, backend: str, client_class: Callable, params: dict) -> object:
+        """
+        Return pooled client for given backend, creating it when needed.
+        """
+        try:
+            key = (backend, client_class, _freeze(params))
+        except TypeError:
+            return client_class(**params)
+
+        with self._lock:
+            self._check_pid()
+            entry = self._clients.get(key)
+            if entry is not None:
+                client, last_used = entry
+                if time.monotonic() - last_used <= self.keepalive:
+                    return self._store(key, client)
+        # slow handshakes must not block other backends
+        client = client_class(**params)
+        with self._lock:
+            self._check_pid()
+            entry = self._clients.get(key)
+            if entry is not None and entry[1] > time.monotonic() - self.keepalive:
+                # built concurrently by another thread, share that one
+                _close(client)
+                client = entry[0]
+            return self._store(key, client)
+
+    def _store(self, key: Hashable, client: object) -> object:
+        self._clients.pop(key, None)
+        self._clients[key] = (client, time.monotonic())
+        while len(self._clients) > self.max_size:
+            self._clients.popitem(last=False)
+        return client
+
+    def clear(self, backend: Optional[str] = None) -> None:
+        """
+        Drop pooled clients - all or just for given backend.
+        """
+        with self._lock:
+            self._check_pid()
+            for key in list(self._clients):
+                if backend is None or key[0] == backend:
+                    del self._clients[key]
+
+
+client_pool = ClientPool()
+
+
+@receiver(setting_changed)
+def clear_client_pool(setting, **kwargs):
+    if setting in ("GETPAID", "GETPAID_BACKEND_SETTINGS"):
+        client_pool.clear()
@@ -0,0 +1,134 @@
+import threading
+from types import MappingProxyType
+from typing import Any, Mapping, Optional, Tuple, Type
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from getpaid.utils import import_by_path
+
+#: Settings holding dotted paths that must be importable.
+PATH_SETTINGS = ("CLIENT_CLASS", "POST_FORM_CLASS")
+
+#: Backend settings holding keys for callback signatures, in order of priority.
+SIGNATURE_KEY_SETTINGS = ("signature_keys", "second_key")
+
+
+class BackendConfig:
+    """
+    Read-only snapshot of settings for one backend: its entry in
+    ``GETPAID_BACKEND_SETTINGS`` with ``GETPAID`` as fallback.
+    Shared by all processor instances of the backend.
+
+    Keys for callback signatures (backend's ``signature_keys`` or
+    ``second_key``) are prepared once as :attr:`signature_keys`.
+    """
+
+    __slots__ = ("path", "backend", "defaults", "signature_keys", "_resolved")
+
+    def __init__(
+        self, path: str, backend: Mapping[str, Any], defaults: Mapping[str, Any]
+    ) -> None:
+        self.path = path
+        self.backend = MappingProxyType(dict(backend))
+        self.defaults = MappingProxyType(dict(defaults))
+        resolved = dict(defaults)
+        resolved.update((k, v) for k, v in backend.items() if v is not None)
+        self._resolved = resolved
+        self.signature_keys = self._get_signature_keys()
+
+    def _get_signature_keys(self) -> Tuple[bytes, ...]:
+        for name in SIGNATURE_KEY_SETTINGS:
+            keys = self.backend.get(name)
+            if keys:
+                if isinstance(keys, (str, bytes)):
+                    keys = [keys]
+                return tuple(k.encode() if isinstance(k, str) else k for k in keys)
+        return ()
+
+    def get_setting(self, name: str, default: Optional[Any] = None) -> Any:
+        """
+        Backend's value, else ``default``, else the global one.
+        See :meth:`getpaid.processor.BaseProcessor.get_setting`.
+        """
+        if default is None or name in self.backend:
+            return self._resolved.get(name)
+        return default
+
+    def validate(self, processor_class: Optional[Type] = None) -> None:
+        """
+        Check that dotted paths can be imported and run processor's own checks.
+        """
+        validator_paths = list(self.defaults.get("VALIDATORS", []))
+        validator_paths += (
+            self.defaults.get("BACKENDS", {}).get(self.path, {}).get("VALIDATORS", [])
+        )
+        paths = [(name, self.get_setting(name)) for name in PATH_SETTINGS]
+        paths += [("VALIDATORS", path) for path in validator_paths]
+        for name, value in paths:
+            if isinstance(value, str):
+                try:
+                    import_by_path(value)
+                except ImportError as e:
+                    raise ImproperlyConfigured(
+                        f"Cannot import {name} {value!r} for backend {self.path}: {e}"
+                    )
+        if processor_class is not None:
+            processor_class.validate_config(self)
+
+
+class ConfigStore:
+    """
+    Per-process cache of :class:`BackendConfig` objects. Built when plugins
+    register and rebuilt (lazily) after settings change.
+    """
+
+    def __init__(self) -> None:
+        self._configs = {}
+        self._processors = {}
+        self._lock = threading.Lock()
+
+    def _build(
+        self, path: str, processor_class: Optional[Type] = None
+    ) -> BackendConfig:
+        config = BackendConfig(
+            path,
+            getattr(settings, "GETPAID_BACKEND_SETTINGS", {}).get(path, {}),
+            getattr(settings, "GETPAID", {}),
+        )
+        config.validate(processor_class or self._processors.get(path))
+        return config
+
+    def register(self, path: str, processor_class: Type) -> BackendConfig:
+        with self._lock:
+            config = self._build(path, processor_class)
+            self._processors[path] = processor_class
+            self._configs[path] = config
+        return config
+
+    def unregister(self, path: str) -> None:
+        with self._lock:
+            self._processors.pop(path, None)
+            self._configs.pop(path, None)
+
+    def get(self, path: str) -> BackendConfig:
+        try:
+            return self._configs[path]
+        except KeyError:
+            with self._lock:
+                config = self._configs[path] = self._build(path)
+            return config
+
+    def clear(self) -> None:
+        self._configs = {}
+
+
+backend_configs = ConfigStore()
+
+
+@receiver(setting_changed)
+def clear_backend_configs(setting, **kwargs):
+    if setting in ("GETPAID", "GETPAID_BACKEND_SETTINGS"):
+        backend_configs.clear()
@@ -22,3 +22,7 @@ class RefundFailure(CommunicationError):
 
 class CredentialsError(GetPaidException):
     pass
+
+
+class PaymentLocked(GetPaidException):
+    pass
@@ -0,0 +1,80 @@
+"""
+Payment transition history (:class:`~getpaid.models.PaymentTransition`).
+
+When ``TRANSITION_HISTORY`` is enabled, transitions of a payment are
+collected in memory as they happen and written with a single
+``bulk_create`` when the payment is saved, in the same transaction. Unsaved
+transitions are never recorded.
+"""
+
+from functools import lru_cache
+from typing import Iterable, List
+
+from django.conf import settings
+from django.dispatch import receiver
+from django.utils.timezone import now
+from django_fsm.signals import post_transition
+
+
+def _state(value) -> str:
+    return getattr(value, "value", value)
+
+
+def is_enabled() -> bool:
+    return getattr(settings, "GETPAID", {}).get("TRANSITION_HISTORY", False)
+
+
+def get_pending(payment) -> List:
+    return payment.__dict__.setdefault("_pending_transitions", [])
+
+
+@lru_cache(maxsize=None)
+def get_transition_field(model, name: str) -> str:
+    """
+    Name of the FSM field changed by transition ``name``, which is not part
+    of ``post_transition`` signal. Handles name-mangled private transitions.
+    """
+    candidates = [name] + [f"_{klass.__name__}{name}" for klass in model.__mro__]
+    for attr in candidates:
+        meta = getattr(getattr(model, attr, None), "_django_fsm", None)
+        if meta is not None:
+            return meta.field.name
+    raise ValueError(f"{model.__name__}.{name} is not a transition.")
+
+
+@receiver(post_transition)
+def collect_transition(sender, instance, name, source, target, **kwargs):
+    from getpaid.abstracts import AbstractPayment
+
+    if isinstance(instance, AbstractPayment) and is_enabled():
+        get_pending(instance).append(
+            dict(
+                name=name,
+                field=get_transition_field(type(instance), name),
+                source=_state(source),
+                target=_state(target),
+                created_on=now(),
+            )
+        )
+
+
+def flush_transitions(payments: Iterable) -> int:
+    """
+    Write collected transitions of given (saved) payments in one query.
+    """
+    from getpaid.models import PaymentTransition
+
+    objs = []
+    for payment in payments:
+        pending = payment.__dict__.pop("_pending_transitions", None) or []
+        objs += [
+            PaymentTransition(payment_id=payment.pk, backend=payment.backend, **entry)
+            for entry in pending
+        ]
+    if objs:
+        PaymentTransition.objects.bulk_create(objs)
+    return len(objs)
+
+
+def discard_transitions(payment) -> None:
+    payment.__dict__.pop("_pending_transitions", None)
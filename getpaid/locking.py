@@ -0,0 +1,123 @@
+import logging
+import time
+from typing import Any, Callable, Optional, Tuple
+
+from django.conf import settings
+from django.db import OperationalError, connections, router
+from django.db.models import QuerySet
+from django.db.transaction import atomic
+from django_fsm import ConcurrentTransition
+
+from getpaid.exceptions import PaymentLocked
+
+logger = logging.getLogger(__name__)
+
+#: Rely on ``ConcurrentTransitionMixin`` - fail on save if state changed.
+OPTIMISTIC = "optimistic"
+#: Wait for the row lock.
+LOCK = "lock"
+#: Don't wait, treat locked row as busy.
+SKIP_LOCKED = "skip_locked"
+#: Don't wait, let the database raise an error for locked row.
+NOWAIT = "nowait"
+
+MODES = (OPTIMISTIC, LOCK, SKIP_LOCKED, NOWAIT)
+
+DEFAULT_RETRIES = 3
+DEFAULT_RETRY_DELAY = 0.05
+
+
+def _get_setting(name: str, default: Any = None) -> Any:
+    return getattr(settings, "GETPAID", {}).get(name, default)
+
+
+def get_locking_mode() -> str:
+    mode = _get_setting("TRANSITION_LOCKING", OPTIMISTIC)
+    if mode not in MODES:
+        raise ValueError(f"Unknown TRANSITION_LOCKING mode: {mode!r}")
+    return mode
+
+
+def lock_queryset(queryset: QuerySet, mode: str) -> QuerySet:
+    """
+    Apply ``select_for_update`` for given mode. Options not supported by
+    the database fall back to waiting for the lock. Only payment rows are
+    locked, not rows of related models joined with ``select_related()``.
+    """
+    if mode == OPTIMISTIC:
+        return queryset
+    features = connections[router.db_for_write(queryset.model)].features
+    of = ("self",) if features.has_select_for_update_of else ()
+    if mode == SKIP_LOCKED and features.has_select_for_update_skip_locked:
+        return queryset.select_for_update(skip_locked=True, of=of)
+    if mode == NOWAIT and features.has_select_for_update_nowait:
+        return queryset.select_for_update(nowait=True, of=of)
+    return queryset.select_for_update(of=of)
+
+
+def load_payment(queryset: QuerySet, pk: Any, mode: str):
+    """
+    Get payment from queryset, locking it according to ``mode``.
+    Raises :class:`~getpaid.exceptions.PaymentLocked` if the row is busy.
+    """
+    try:
+        return lock_queryset(queryset, mode).get(pk=pk)
+    except queryset.model.DoesNotExist:
+        if mode == SKIP_LOCKED and queryset.filter(pk=pk).exists():
+            raise PaymentLocked(f"Payment {pk} is locked.")
+        raise
+    except OperationalError as e:
+        if mode == NOWAIT:
+            raise PaymentLocked(f"Payment {pk} is locked.") from e
+        raise
+
+
+def run_transition(
+    queryset: QuerySet,
+    pk: Any,
+    func: Callable,
+    payment: Optional[Any] = None,
+) -> Tuple[Any, Any]:
+    """
+    Load payment ``pk`` and call ``func(payment)`` in a transaction.
+
+    The payment is loaded according to ``TRANSITION_LOCKING`` setting. In
+    optimistic mode, given ``payment`` instance is used on first attempt.
+    Attempts failing with ``ConcurrentTransition`` or
+    :class:`~getpaid.exceptions.PaymentLocked` are retried on a freshly
+    loaded payment up to ``TRANSITION_RETRIES`` times, waiting
+    ``TRANSITION_RETRY_DELAY`` seconds (doubled after each attempt).
+
+    :return: Tuple of used payment instance and the result of ``func``.
+    """
+    mode = get_locking_mode()
+    retries = _get_setting("TRANSITION_RETRIES", DEFAULT_RETRIES)
+    delay = _get_setting("TRANSITION_RETRY_DELAY", DEFAULT_RETRY_DELAY)
+    attempt = 0
+    while True:
+        try:
+            with atomic(using=router.db_for_write(queryset.model)):
+                if mode == OPTIMISTIC and attempt == 0 and payment is not None:
+                    target = payment
+                else:
+                    target = load_payment(queryset, pk, mode)
+                return target, func(target)
+        except (ConcurrentTransition, PaymentLocked) as e:
+            if attempt >= retries:
+                raise
+            logger.debug(
+                "Payment transition conflict, retrying.",
+                extra={"payment_id": pk, "attempt": attempt, "error": repr(e)},
+            )
+            time.sleep(delay * 2**attempt)
+            attempt += 1
+
+
+def copy_state(source, target) -> None:
+    """
+    Copy field values between two instances of the same payment, bypassing
+    protection of FSM fields.
+    """
+    for field in source._meta.concrete_fields:
+        target.__dict__[field.attname] = source.__dict__[field.attname]
+    target._update_initial_state()
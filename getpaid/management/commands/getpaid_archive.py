@@ -0,0 +1,52 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.timezone import now
+
+from getpaid.archive import DEFAULT_BATCH_SIZE, archive_payments, is_enabled
+
+
+class Command(BaseCommand):
+    help = "Move old payments in terminal statuses to the archive table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=float,
+            default=None,
+            help="Archive payments older than given number of days "
+            "(default: PAYMENT_ARCHIVE_AFTER setting).",
+        )
+        parser.add_argument(
+            "--status",
+            action="append",
+            dest="statuses",
+            help="Archive payments with given terminal status "
+            "(can be used multiple times, default: all terminal statuses).",
+        )
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if not is_enabled():
+            raise CommandError(
+                "Enable PAYMENT_ARCHIVE setting first, "
+                "so that archived payments can still be found."
+            )
+        days = options["days"]
+        if days is None:
+            days = getattr(settings, "GETPAID", {}).get("PAYMENT_ARCHIVE_AFTER", 180)
+        try:
+            batches = archive_payments(
+                now() - timedelta(days=days),
+                statuses=options["statuses"],
+                batch_size=options["batch_size"],
+            )
+            moved = 0
+            for count in batches:
+                moved += count
+                if options["verbosity"] > 1:
+                    self.stdout.write(f"Archived {moved} payments so far.")
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(f"Archived {moved} payments.")
@@ -0,0 +1,88 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+
+from getpaid.callbacks import (
+    DEFAULT_CLAIM_TIMEOUT,
+    DEFAULT_RETRY_DELAY,
+    process_callbacks,
+)
+from getpaid.paywall_log import paywall_log
+
+#: Longest wait between polls after repeated failures (with --loop).
+MAX_INTERVAL = 60.0
+
+
+class Command(BaseCommand):
+    help = "Process paywall callbacks stored while QUEUE_CALLBACKS is enabled."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--max-attempts", type=int, default=5)
+        parser.add_argument(
+            "--retry-delay",
+            type=float,
+            default=DEFAULT_RETRY_DELAY,
+            help="Seconds before retrying a failed callback, doubled after "
+            "each attempt.",
+        )
+        parser.add_argument(
+            "--claim-timeout",
+            type=float,
+            default=DEFAULT_CLAIM_TIMEOUT,
+            help="Seconds after which callbacks claimed by a crashed worker "
+            "are processed again.",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling for new callbacks instead of exiting when done.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait when the queue is empty (with --loop). "
+            "Doubled after each batch with failures.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            self.process(options)
+        finally:
+            # no requests here to trigger writing of the log
+            paywall_log.flush()
+
+    def process(self, options):
+        processed = failed = 0
+        errors = 0  # batches in a row with failures
+        while True:
+            try:
+                result = process_callbacks(
+                    batch_size=options["batch_size"],
+                    max_attempts=options["max_attempts"],
+                    retry_delay=options["retry_delay"],
+                    claim_timeout=options["claim_timeout"],
+                )
+            except DatabaseError as e:
+                if not options["loop"]:
+                    raise
+                self.stderr.write(f"Could not process callbacks: {e!r}")
+                close_old_connections()
+                result = {"processed": 0, "failed": 1}
+            else:
+                processed += result["processed"]
+                failed += result["failed"]
+                paywall_log.flush_if_due()
+            more = result["processed"] + result["failed"] >= options["batch_size"]
+            if not options["loop"]:
+                if more:
+                    continue
+                break
+            errors = errors + 1 if result["failed"] else 0
+            if more and not errors:
+                continue
+            # don't hammer a failing paywall or database
+            time.sleep(min(options["interval"] * 2**errors, MAX_INTERVAL))
+        self.stdout.write(f"Processed {processed}, failed {failed}.")
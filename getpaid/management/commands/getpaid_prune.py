@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from getpaid.callbacks import prune_callback_fingerprints, prune_dead_callbacks
+from getpaid.paywall_log import paywall_log
+
+
+class Command(BaseCommand):
+    help = "Remove expired auxiliary records kept by getpaid."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--log-days",
+            type=float,
+            default=None,
+            help="Keep paywall log for given number of days "
+            "(default: PAYWALL_LOG_RETENTION setting).",
+        )
+        parser.add_argument(
+            "--callback-days",
+            type=float,
+            default=30,
+            help="Keep queued callbacks that were given up for given number "
+            "of days.",
+        )
+
+    def handle(self, *args, **options):
+        getpaid_settings = getattr(settings, "GETPAID", {})
+        ttl = getpaid_settings.get("CALLBACK_DEDUPLICATION_TTL")
+        if ttl:
+            deleted = prune_callback_fingerprints(ttl)
+            self.stdout.write(f"Removed {deleted} callback fingerprints.")
+        deleted = prune_dead_callbacks(options["callback_days"])
+        self.stdout.write(f"Removed {deleted} given up callbacks.")
+        deleted = paywall_log.prune(days=options["log_days"])
+        self.stdout.write(f"Removed {deleted} paywall log entries.")
@@ -0,0 +1,37 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from getpaid.rollups import rebuild_rollups
+
+
+def _parse_day(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Invalid day: {value!r}, use YYYY-MM-DD.")
+
+
+class Command(BaseCommand):
+    help = "Recompute daily payment rollups from payments and archived payments."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--day",
+            action="append",
+            dest="days",
+            help="Limit to given day, YYYY-MM-DD (can be used multiple times).",
+        )
+        parser.add_argument(
+            "--backend",
+            action="append",
+            dest="backends",
+            help="Limit to given backend (can be used multiple times).",
+        )
+
+    def handle(self, *args, **options):
+        days = options["days"]
+        if days is not None:
+            days = [_parse_day(day) for day in days]
+        written = rebuild_rollups(days=days, backends=options["backends"])
+        self.stdout.write(f"Rebuilt {written} payment rollups.")
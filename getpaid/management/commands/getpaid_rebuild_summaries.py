@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from getpaid.summary import rebuild_order_summaries
+
+
+class Command(BaseCommand):
+    help = "Recompute per-order payment summaries from payments."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--order",
+            action="append",
+            dest="orders",
+            help="Limit to given order id (can be used multiple times).",
+        )
+
+    def handle(self, *args, **options):
+        written = rebuild_order_summaries(options["orders"])
+        self.stdout.write(f"Rebuilt {written} order payment summaries.")
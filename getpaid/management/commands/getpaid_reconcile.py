@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from getpaid.paywall_log import paywall_log
+from getpaid.reconciliation import StatusReconciler
+
+
+class Command(BaseCommand):
+    help = "Fetch statuses of open payments from paywalls and update them in bulk."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--backend",
+            action="append",
+            dest="backends",
+            help="Limit to given backend (can be used multiple times).",
+        )
+        parser.add_argument(
+            "--status",
+            action="append",
+            dest="statuses",
+            help="Check payments with given status (can be used multiple times).",
+        )
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=8,
+            help="Maximum number of concurrent requests to paywalls.",
+        )
+
+    def handle(self, *args, **options):
+        reconciler = StatusReconciler(
+            backends=options["backends"],
+            statuses=options["statuses"],
+            batch_size=options["batch_size"],
+            max_workers=options["workers"],
+        )
+        try:
+            result = reconciler.run()
+        finally:
+            paywall_log.flush()
+        self.stdout.write(
+            "Checked {checked}, updated {updated}, skipped {skipped}, "
+            "errors {errors}.".format(**result)
+        )
@@ -0,0 +1,286 @@
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from django.db import models
+from django.db.models.functions import Coalesce
+from django.db.transaction import atomic
+from django.utils.timezone import now
+
+from getpaid import history, rollups, summary
+from getpaid.signals import post_bulk_transition
+
+
+def _state(value: Any) -> Any:
+    return getattr(value, "value", value)
+
+
+def get_bulk_transition(model, name: str) -> Tuple[str, List, Any]:
+    """
+    Read django-fsm metadata of transition ``name`` and return
+    ``(field name, source states, target state)``. Raises ``ValueError`` for
+    transitions that cannot be expressed as a single conditional UPDATE.
+    """
+    meta = getattr(getattr(model, name, None), "_django_fsm", None)
+    if meta is None:
+        raise ValueError(f"{model.__name__}.{name} is not a transition.")
+    targets = {_state(t.target) for t in meta.transitions.values()}
+    if len(targets) != 1:
+        raise ValueError(f"Transition {name} has more than one target.")
+    target = targets.pop()
+    if not isinstance(target, str):
+        raise ValueError(f"Transition {name} has a dynamic target.")
+    if any(t.conditions for t in meta.transitions.values()):
+        raise ValueError(f"Transition {name} has conditions.")
+    if {"*", "+"} & set(meta.transitions):
+        raise ValueError(f"Transition {name} has a wildcard source.")
+    sources = sorted(_state(source) for source in meta.transitions)
+    return meta.field.name, sources, target
+
+
+class PaymentQuerySet(models.QuerySet):
+    """
+    QuerySet for Payment models with named loading profiles.
+
+    A profile lists related objects used on a particular request path, so that
+    they are fetched in the same query as the payment itself.
+    Extend :attr:`profiles` in a subclass to add or change profiles.
+    """
+
+    #: Mapping of profile name to ``select_related`` lookups.
+    profiles: Dict[str, Sequence[str]] = {
+        # handle_paywall_callback, transitions and signal handlers
+        "callback": ("order",),
+        # get_return_redirect_url -> order.get_return_url()
+        "redirect": ("order",),
+        # PaymentAdmin change list and change form
+        "admin": ("order",),
+    }
+
+    def for_profile(self, name: str) -> "PaymentQuerySet":
+        try:
+            related = self.profiles[name]
+        except KeyError:
+            raise ValueError(f"Unknown loading profile: {name!r}")
+        return self.select_related(*related) if related else self
+
+    def bulk_transition(
+        self,
+        name: str,
+        notify: bool = False,
+        batch_size: Optional[int] = 1000,
+        **values,
+    ) -> int:
+        """
+        Apply transition ``name`` to all payments in this queryset that are in
+        one of its source states, using conditional UPDATE statements.
+
+        Only the state (and given ``values``) is changed - the transition
+        method itself is not called and django-fsm signals are not sent.
+        Transitions with conditions or dynamic targets are not supported.
+
+        Unless ``notify`` is set or summaries, rollups or history are enabled,
+        this is a single UPDATE. Otherwise affected payments are locked and
+        collected first and updated in batches.
+
+        :param notify: Send
+            :data:`~getpaid.signals.post_bulk_transition` once per batch.
+        :param batch_size: Number of payments updated by one statement.
+        :return: Number of affected payments.
+        """
+        field, sources, target = get_bulk_transition(self.model, name)
+        values[field] = target
+        queryset = self.filter(**{f"{field}__in": sources}).order_by()
+        if not notify and not (
+            summary.is_enabled() or rollups.is_enabled() or history.is_enabled()
+        ):
+            # nobody needs to know which payments changed
+            return queryset.update(**values)
+        with atomic(using=self.db):
+            rows = list(
+                queryset.select_for_update().values_list(
+                    "pk", "order_id", "backend", field, "created_on"
+                )
+            )
+            pks = [row[0] for row in rows]
+            size = batch_size or len(pks) or 1
+            batches = [pks[i : i + size] for i in range(0, len(pks), size)]
+            for batch in batches:
+                queryset.filter(pk__in=batch).update(**values)
+            if rows and summary.is_enabled():
+                summary.rebuild_order_summaries({row[1] for row in rows})
+            if rows and rollups.is_enabled():
+                rollups.rebuild_rollups(
+                    days={rollups.get_day(row[4]) for row in rows},
+                    backends={row[2] for row in rows},
+                )
+            if rows and history.is_enabled():
+                self._record_bulk_transition(rows, name, field, target, size)
+        if notify:
+            for batch in batches:
+                post_bulk_transition.send(
+                    sender=self.model,
+                    name=name,
+                    field=field,
+                    source=sources,
+                    target=target,
+                    pks=batch,
+                )
+        return len(pks)
+
+    def _record_bulk_transition(self, rows, name, field, target, batch_size):
+        from getpaid.models import PaymentTransition
+
+        created_on = now()
+        PaymentTransition.objects.bulk_create(
+            [
+                PaymentTransition(
+                    payment_id=pk,
+                    backend=backend,
+                    field=field,
+                    name=name,
+                    source=source,
+                    target=target,
+                    created_on=created_on,
+                )
+                for pk, _, backend, source, _ in rows
+            ],
+            batch_size=batch_size,
+        )
+
+
+PaymentManager = models.Manager.from_queryset(PaymentQuerySet)
+
+
+class PaymentRollupQuerySet(models.QuerySet):
+    """
+    Queries over :class:`~getpaid.models.PaymentRollup` rows.
+    """
+
+    def between(
+        self, start: Optional[date] = None, end: Optional[date] = None
+    ) -> "PaymentRollupQuerySet":
+        """
+        Rollups of days in ``[start, end]`` range.
+        """
+        queryset = self
+        if start is not None:
+            queryset = queryset.filter(day__gte=start)
+        if end is not None:
+            queryset = queryset.filter(day__lte=end)
+        return queryset
+
+    def totals(
+        self, group_by: Sequence[str] = ("backend", "currency", "status")
+    ) -> List[dict]:
+        """
+        Sum rollups per group. Returns dicts with ``group_by`` keys and
+        ``total_count``, ``total_required``, ``total_paid`` and
+        ``total_refunded``.
+        """
+        return list(
+            self.order_by(*group_by)
+            .values(*group_by)
+            .annotate(
+                total_count=models.Sum("count"),
+                total_required=models.Sum("amount_required"),
+                total_paid=models.Sum("amount_paid"),
+                total_refunded=models.Sum("amount_refunded"),
+            )
+        )
+
+
+class PaymentTransitionQuerySet(models.QuerySet):
+    """
+    Statistics over :class:`~getpaid.models.PaymentTransition` records,
+    computed by the database.
+    """
+
+    def between(
+        self, start: Optional[datetime] = None, end: Optional[datetime] = None
+    ) -> "PaymentTransitionQuerySet":
+        """
+        Transitions made in ``[start, end)`` range.
+        """
+        queryset = self
+        if start is not None:
+            queryset = queryset.filter(created_on__gte=start)
+        if end is not None:
+            queryset = queryset.filter(created_on__lt=end)
+        return queryset
+
+    def dwell_times(
+        self, state: str, field: str = "status", group_by: Sequence[str] = ("backend",)
+    ) -> List[dict]:
+        """
+        How long payments stayed in ``state`` before leaving it, per group.
+
+        Time of entering the state is taken from the previous transition of
+        the payment (or payment's creation). Payments still in the state are
+        not counted. Returns dicts with ``group_by`` keys and ``count``,
+        ``average`` and ``maximum`` (timedeltas).
+        """
+        previous = (
+            self.model._default_manager.filter(
+                payment_id=models.OuterRef("payment_id"),
+                field=field,
+                created_on__lt=models.OuterRef("created_on"),
+            )
+            .order_by("-created_on")
+            .values("created_on")[:1]
+        )
+        dwell = models.ExpressionWrapper(
+            models.F("created_on")
+            - Coalesce(models.Subquery(previous), models.F("payment__created_on")),
+            output_field=models.DurationField(),
+        )
+        return list(
+            self.filter(field=field, source=_state(state))
+            .annotate(dwell=dwell)
+            .order_by()
+            .values(*group_by)
+            .annotate(
+                count=models.Count("id"),
+                average=models.Avg("dwell"),
+                maximum=models.Max("dwell"),
+            )
+        )
+
+    def funnel(
+        self, states: Sequence[str], field: str = "status", group_by: Sequence[str] = ()
+    ) -> List[dict]:
+        """
+        Number of distinct payments that reached each of ``states``, per group.
+        Returns dicts with ``group_by`` keys and a ``{state: count}`` dict
+        under ``"states"``.
+        """
+        states = [_state(state) for state in states]
+        aliases = {f"state_{i}": state for i, state in enumerate(states)}
+        rows = (
+            self.filter(field=field, target__in=states)
+            .order_by()
+            .values(*group_by)
+            .annotate(
+                **{
+                    alias: models.Count(
+                        "payment_id", distinct=True, filter=models.Q(target=state)
+                    )
+                    for alias, state in aliases.items()
+                }
+            )
+        )
+        result = []
+        for row in rows:
+            counts = {state: row.pop(alias) for alias, state in aliases.items()}
+            result.append({**row, "states": counts})
+        return result
+
+
+def get_payment_queryset(model, profile: str) -> models.QuerySet:
+    """
+    Payments of given model loaded according to ``profile``. Falls back to
+    plain queryset if the model uses a manager without profiles.
+    """
+    queryset = model._default_manager.all()
+    if hasattr(queryset, "for_profile"):
+        return queryset.for_profile(profile)
+    return queryset
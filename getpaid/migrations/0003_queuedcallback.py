@@ -0,0 +1,69 @@
+# Generated by Django 4.0.10 on 2026-10-17 21:29
+
+import django.db.models.deletion
+import django.utils.timezone
+import swapper
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        swapper.dependency("getpaid", "Payment"),
+        ("getpaid", "0002_auto_20200417_2107"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="QueuedCallback",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                (
+                    "received_on",
+                    models.DateTimeField(auto_now_add=True, verbose_name="received on"),
+                ),
+                ("method", models.CharField(max_length=10, verbose_name="method")),
+                ("path", models.TextField(verbose_name="path")),
+                (
+                    "meta",
+                    models.TextField(
+                        help_text="JSON encoded.", verbose_name="request meta"
+                    ),
+                ),
+                ("body", models.BinaryField(blank=True, verbose_name="body")),
+                (
+                    "attempts",
+                    models.PositiveSmallIntegerField(
+                        default=0, verbose_name="attempts"
+                    ),
+                ),
+                ("last_error", models.TextField(blank=True, verbose_name="last error")),
+                (
+                    "next_attempt_on",
+                    models.DateTimeField(
+                        db_index=True,
+                        default=django.utils.timezone.now,
+                        help_text="Empty once the callback is given up.",
+                        null=True,
+                        verbose_name="next attempt on",
+                    ),
+                ),
+                (
+                    "payment",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        db_index=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to=swapper.get_model_name("getpaid", "Payment"),
+                        verbose_name="payment",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Queued callback",
+                "verbose_name_plural": "Queued callbacks",
+                "ordering": ["id"],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.0.10 on 2026-10-17 21:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("getpaid", "0003_queuedcallback"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CallbackFingerprint",
+            fields=[
+                (
+                    "fingerprint",
+                    models.CharField(
+                        max_length=64,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="fingerprint",
+                    ),
+                ),
+                (
+                    "received_on",
+                    models.DateTimeField(db_index=True, verbose_name="received on"),
+                ),
+            ],
+            options={
+                "verbose_name": "Callback fingerprint",
+                "verbose_name_plural": "Callback fingerprints",
+            },
+        ),
+    ]
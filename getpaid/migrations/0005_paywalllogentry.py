@@ -0,0 +1,93 @@
+# Generated by Django 4.0.10 on 2026-10-17 21:32
+
+import django.db.models.deletion
+import django.utils.timezone
+import swapper
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        swapper.dependency("getpaid", "Payment"),
+        ("getpaid", "0004_callbackfingerprint"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PaywallLogEntry",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                (
+                    "backend",
+                    models.CharField(
+                        blank=True, max_length=100, verbose_name="backend"
+                    ),
+                ),
+                (
+                    "direction",
+                    models.CharField(
+                        choices=[("in", "incoming"), ("out", "outgoing")],
+                        max_length=3,
+                        verbose_name="direction",
+                    ),
+                ),
+                ("action", models.CharField(max_length=50, verbose_name="action")),
+                (
+                    "created_on",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="created on"
+                    ),
+                ),
+                (
+                    "duration",
+                    models.PositiveIntegerField(
+                        blank=True, null=True, verbose_name="duration (ms)"
+                    ),
+                ),
+                (
+                    "status_code",
+                    models.PositiveSmallIntegerField(
+                        blank=True, null=True, verbose_name="status code"
+                    ),
+                ),
+                (
+                    "request_data",
+                    models.TextField(blank=True, verbose_name="request data"),
+                ),
+                (
+                    "response_data",
+                    models.TextField(blank=True, verbose_name="response data"),
+                ),
+                ("error", models.TextField(blank=True, verbose_name="error")),
+                (
+                    "payment",
+                    models.ForeignKey(
+                        blank=True,
+                        db_constraint=False,
+                        db_index=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to=swapper.get_model_name("getpaid", "Payment"),
+                        verbose_name="payment",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Paywall log entry",
+                "verbose_name_plural": "Paywall log entries",
+                "ordering": ["-created_on"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="paywalllogentry",
+            index=models.Index(
+                fields=["payment", "created_on"], name="getpaid_log_payment_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="paywalllogentry",
+            index=models.Index(fields=["created_on"], name="getpaid_log_created_idx"),
+        ),
+    ]
@@ -0,0 +1,136 @@
+# Generated by Django 4.0.10 on 2026-10-17 21:36
+
+import django.db.models.deletion
+import django_fsm
+import swapper
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        swapper.dependency("getpaid", "Order"),
+        ("getpaid", "0005_paywalllogentry"),
+    ]
+
+    operations = [
+        # new indexes go first, so that the foreign key is never left unindexed
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(
+                fields=["order", "status"], name="getpaid_payment_order_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(
+                fields=["status", "backend", "created_on"],
+                name="getpaid_payment_status_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(
+                condition=models.Q(
+                    status__in=[
+                        "new",
+                        "prepared",
+                        "pre-auth",
+                        "charge_started",
+                        "partially_paid",
+                        "refund_started",
+                    ]
+                ),
+                fields=["backend", "created_on"],
+                name="getpaid_payment_active_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(
+                fields=["external_id", "backend"], name="getpaid_payment_ext_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(
+                condition=models.Q(fraud_status="check"),
+                fields=["created_on"],
+                name="getpaid_payment_fraud_idx",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="payment",
+            name="order",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="payments",
+                to=swapper.get_model_name("getpaid", "Order"),
+                verbose_name="order",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="payment",
+            name="status",
+            field=django_fsm.FSMField(
+                choices=[
+                    ("new", "new"),
+                    ("prepared", "in progress"),
+                    ("pre-auth", "pre-authed"),
+                    ("charge_started", "charge process started"),
+                    ("partially_paid", "partially paid"),
+                    ("paid", "paid"),
+                    ("failed", "failed"),
+                    ("refund_started", "refund started"),
+                    ("refunded", "refunded"),
+                ],
+                default="new",
+                max_length=50,
+                protected=True,
+                verbose_name="status",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="payment",
+            name="backend",
+            field=models.CharField(max_length=100, verbose_name="backend"),
+        ),
+        migrations.AlterField(
+            model_name="payment",
+            name="last_payment_on",
+            field=models.DateTimeField(
+                blank=True, default=None, null=True, verbose_name="paid on"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="payment",
+            name="refunded_on",
+            field=models.DateTimeField(
+                blank=True, default=None, null=True, verbose_name="refunded on"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="payment",
+            name="external_id",
+            field=models.CharField(
+                blank=True, default="", max_length=64, verbose_name="external id"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="payment",
+            name="fraud_status",
+            field=django_fsm.FSMField(
+                choices=[
+                    ("unknown", "unknown"),
+                    ("accepted", "accepted"),
+                    ("rejected", "rejected"),
+                    ("check", "needs manual verification"),
+                ],
+                default="unknown",
+                max_length=20,
+                protected=True,
+                verbose_name="fraud status",
+            ),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 4.0.10 on 2026-10-17 21:43
+
+import django.db.models.deletion
+import swapper
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        swapper.dependency("getpaid", "Order"),
+        ("getpaid", "0006_payment_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OrderPaymentSummary",
+            fields=[
+                (
+                    "order",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="payment_summary",
+                        serialize=False,
+                        to=swapper.get_model_name("getpaid", "Order"),
+                        verbose_name="order",
+                    ),
+                ),
+                (
+                    "payment_count",
+                    models.PositiveIntegerField(default=0, verbose_name="payments"),
+                ),
+                (
+                    "failed_count",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="failed payments"
+                    ),
+                ),
+                (
+                    "amount_locked",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=20,
+                        verbose_name="amount locked",
+                    ),
+                ),
+                (
+                    "amount_paid",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=20,
+                        verbose_name="amount paid",
+                    ),
+                ),
+                (
+                    "amount_refunded",
+                    models.DecimalField(
+                        decimal_places=4,
+                        default=0,
+                        max_digits=20,
+                        verbose_name="amount refunded",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Order payment summary",
+                "verbose_name_plural": "Order payment summaries",
+            },
+        ),
+    ]
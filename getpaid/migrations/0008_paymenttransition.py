@@ -0,0 +1,63 @@
+# Generated by Django 4.0.10 on 2026-10-17 21:45
+
+import django.db.models.deletion
+import django.utils.timezone
+import swapper
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        swapper.dependency("getpaid", "Payment"),
+        ("getpaid", "0007_orderpaymentsummary"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PaymentTransition",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("backend", models.CharField(max_length=100, verbose_name="backend")),
+                ("field", models.CharField(max_length=20, verbose_name="field")),
+                ("name", models.CharField(max_length=50, verbose_name="transition")),
+                ("source", models.CharField(max_length=50, verbose_name="source")),
+                ("target", models.CharField(max_length=50, verbose_name="target")),
+                (
+                    "created_on",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="created on"
+                    ),
+                ),
+                (
+                    "payment",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        db_index=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to=swapper.get_model_name("getpaid", "Payment"),
+                        verbose_name="payment",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Payment transition",
+                "verbose_name_plural": "Payment transitions",
+                "ordering": ["created_on"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="paymenttransition",
+            index=models.Index(
+                fields=["payment", "field", "created_on"],
+                name="getpaid_trans_payment_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="paymenttransition",
+            index=models.Index(
+                fields=["created_on", "field"], name="getpaid_trans_created_idx"
+            ),
+        ),
+    ]
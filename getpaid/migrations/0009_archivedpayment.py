@@ -0,0 +1,110 @@
+# Generated by Django 4.0.10 on 2026-10-17 21:47
+
+import django.db.models.deletion
+import django.utils.timezone
+import swapper
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        swapper.dependency("getpaid", "Order"),
+        ("getpaid", "0008_paymenttransition"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedPayment",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(editable=False, primary_key=True, serialize=False),
+                ),
+                ("backend", models.CharField(max_length=100, verbose_name="backend")),
+                (
+                    "external_id",
+                    models.CharField(
+                        blank=True, max_length=64, verbose_name="external id"
+                    ),
+                ),
+                ("status", models.CharField(max_length=50, verbose_name="status")),
+                (
+                    "currency",
+                    models.CharField(default="", max_length=3, verbose_name="currency"),
+                ),
+                (
+                    "amount_required",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=20,
+                        verbose_name="amount required",
+                    ),
+                ),
+                (
+                    "amount_locked",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=20,
+                        verbose_name="amount locked",
+                    ),
+                ),
+                (
+                    "amount_paid",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=20,
+                        verbose_name="amount paid",
+                    ),
+                ),
+                (
+                    "amount_refunded",
+                    models.DecimalField(
+                        decimal_places=4,
+                        default=0,
+                        max_digits=20,
+                        verbose_name="amount refunded",
+                    ),
+                ),
+                ("created_on", models.DateTimeField(verbose_name="created on")),
+                (
+                    "archived_on",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="archived on"
+                    ),
+                ),
+                ("data", models.TextField(verbose_name="data")),
+                (
+                    "order",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        db_index=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to=swapper.get_model_name("getpaid", "Order"),
+                        verbose_name="order",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Archived payment",
+                "verbose_name_plural": "Archived payments",
+                "ordering": ["-created_on"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="archivedpayment",
+            index=models.Index(
+                fields=["order", "status"], name="getpaid_archive_order_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="archivedpayment",
+            index=models.Index(
+                fields=["external_id", "backend"], name="getpaid_archive_ext_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.0.10 on 2026-10-17 21:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('getpaid', '0009_archivedpayment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentRollup',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('day', models.DateField(verbose_name='day')),
+                ('backend', models.CharField(max_length=100, verbose_name='backend')),
+                ('currency', models.CharField(max_length=3, verbose_name='currency')),
+                ('status', models.CharField(max_length=50, verbose_name='status')),
+                ('count', models.IntegerField(default=0, verbose_name='count')),
+                ('amount_required', models.DecimalField(decimal_places=2, default=0, max_digits=20, verbose_name='amount required')),
+                ('amount_paid', models.DecimalField(decimal_places=2, default=0, max_digits=20, verbose_name='amount paid')),
+                ('amount_refunded', models.DecimalField(decimal_places=4, default=0, max_digits=20, verbose_name='amount refunded')),
+            ],
+            options={
+                'verbose_name': 'Payment rollup',
+                'verbose_name_plural': 'Payment rollups',
+                'ordering': ['day', 'backend', 'currency', 'status'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='paymentrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'backend', 'currency', 'status'), name='getpaid_rollup_unique'),
+        ),
+    ]
@@ -1,8 +1,307 @@
 import swapper
+from django.db import models
+from django.utils.timezone import now
+from django.utils.translation import gettext_lazy as _
 
 from .abstracts import AbstractOrder, AbstractPayment  # noqa
+from .managers import PaymentRollupQuerySet, PaymentTransitionQuerySet
 
 
 class Payment(AbstractPayment):
     class Meta(AbstractPayment.Meta):
         swappable = swapper.swappable_setting("getpaid", "Payment")
+
+
+class QueuedCallback(models.Model):
+    """
+    Raw paywall callback stored by
+    :class:`~getpaid.views.CallbackDetailView` when ``QUEUE_CALLBACKS``
+    is enabled. Processed (and removed) by ``getpaid_process_callbacks``.
+    Callbacks that failed ``--max-attempts`` times are kept with empty
+    :attr:`next_attempt_on` until removed by ``getpaid_prune``.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    payment = models.ForeignKey(
+        swapper.get_model_name("getpaid", "Payment"),
+        verbose_name=_("payment"),
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        related_name="+",
+    )
+    received_on = models.DateTimeField(_("received on"), auto_now_add=True)
+    method = models.CharField(_("method"), max_length=10)
+    path = models.TextField(_("path"))
+    meta = models.TextField(_("request meta"), help_text=_("JSON encoded."))
+    body = models.BinaryField(_("body"), blank=True)
+    attempts = models.PositiveSmallIntegerField(_("attempts"), default=0)
+    last_error = models.TextField(_("last error"), blank=True)
+    next_attempt_on = models.DateTimeField(
+        _("next attempt on"),
+        default=now,
+        null=True,
+        db_index=True,
+        help_text=_("Empty once the callback is given up."),
+    )
+
+    class Meta:
+        ordering = ["id"]
+        verbose_name = _("Queued callback")
+        verbose_name_plural = _("Queued callbacks")
+
+    def __str__(self):
+        return "Callback #{self.id} for {self.payment_id}".format(self=self)
+
+
+class CallbackFingerprint(models.Model):
+    """
+    Fingerprint of recently handled paywall callback, used to short-circuit
+    repeated deliveries when ``CALLBACK_DEDUPLICATION_TTL`` is set.
+    """
+
+    fingerprint = models.CharField(_("fingerprint"), max_length=64, primary_key=True)
+    received_on = models.DateTimeField(_("received on"), db_index=True)
+
+    class Meta:
+        verbose_name = _("Callback fingerprint")
+        verbose_name_plural = _("Callback fingerprints")
+
+    def __str__(self):
+        return self.fingerprint
+
+
+class PaywallLogEntry(models.Model):
+    """
+    Single communication with paywall - an operation called on processor
+    or a callback received from paywall. Written in batches by
+    :data:`getpaid.paywall_log.paywall_log` when ``PAYWALL_LOG`` is enabled.
+    """
+
+    INCOMING = "in"
+    OUTGOING = "out"
+    DIRECTION_CHOICES = (
+        (INCOMING, _("incoming")),
+        (OUTGOING, _("outgoing")),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    payment = models.ForeignKey(
+        swapper.get_model_name("getpaid", "Payment"),
+        verbose_name=_("payment"),
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    backend = models.CharField(_("backend"), max_length=100, blank=True)
+    direction = models.CharField(
+        _("direction"), max_length=3, choices=DIRECTION_CHOICES
+    )
+    action = models.CharField(_("action"), max_length=50)
+    created_on = models.DateTimeField(_("created on"), default=now)
+    duration = models.PositiveIntegerField(_("duration (ms)"), null=True, blank=True)
+    status_code = models.PositiveSmallIntegerField(
+        _("status code"), null=True, blank=True
+    )
+    request_data = models.TextField(_("request data"), blank=True)
+    response_data = models.TextField(_("response data"), blank=True)
+    error = models.TextField(_("error"), blank=True)
+
+    class Meta:
+        ordering = ["-created_on"]
+        verbose_name = _("Paywall log entry")
+        verbose_name_plural = _("Paywall log entries")
+        indexes = [
+            models.Index(
+                fields=["payment", "created_on"], name="getpaid_log_payment_idx"
+            ),
+            models.Index(fields=["created_on"], name="getpaid_log_created_idx"),
+        ]
+
+    def __str__(self):
+        return "{self.direction} {self.action} ({self.backend})".format(self=self)
+
+
+class OrderPaymentSummary(models.Model):
+    """
+    Totals of all payments of one order, kept up to date on every payment
+    save when ``ORDER_PAYMENT_SUMMARY`` is enabled. See :mod:`getpaid.summary`.
+    """
+
+    order = models.OneToOneField(
+        swapper.get_model_name("getpaid", "Order"),
+        verbose_name=_("order"),
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="payment_summary",
+    )
+    payment_count = models.PositiveIntegerField(_("payments"), default=0)
+    failed_count = models.PositiveIntegerField(_("failed payments"), default=0)
+    amount_locked = models.DecimalField(
+        _("amount locked"), decimal_places=2, max_digits=20, default=0
+    )
+    amount_paid = models.DecimalField(
+        _("amount paid"), decimal_places=2, max_digits=20, default=0
+    )
+    amount_refunded = models.DecimalField(
+        _("amount refunded"), decimal_places=4, max_digits=20, default=0
+    )
+
+    class Meta:
+        verbose_name = _("Order payment summary")
+        verbose_name_plural = _("Order payment summaries")
+
+    def __str__(self):
+        return "Payments of order #{self.order_id}".format(self=self)
+
+    @property
+    def has_non_failed_payments(self) -> bool:
+        return self.payment_count > self.failed_count
+
+
+class PaymentTransition(models.Model):
+    """
+    Append-only record of a single FSM transition of a payment. Written in
+    batches on payment save when ``TRANSITION_HISTORY`` is enabled.
+    See :mod:`getpaid.history`.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    payment = models.ForeignKey(
+        swapper.get_model_name("getpaid", "Payment"),
+        verbose_name=_("payment"),
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        related_name="+",
+    )
+    backend = models.CharField(_("backend"), max_length=100)
+    field = models.CharField(_("field"), max_length=20)
+    name = models.CharField(_("transition"), max_length=50)
+    source = models.CharField(_("source"), max_length=50)
+    target = models.CharField(_("target"), max_length=50)
+    created_on = models.DateTimeField(_("created on"), default=now)
+
+    objects = PaymentTransitionQuerySet.as_manager()
+
+    class Meta:
+        ordering = ["created_on"]
+        verbose_name = _("Payment transition")
+        verbose_name_plural = _("Payment transitions")
+        indexes = [
+            models.Index(
+                fields=["payment", "field", "created_on"],
+                name="getpaid_trans_payment_idx",
+            ),
+            models.Index(
+                fields=["created_on", "field"], name="getpaid_trans_created_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return "{self.source} -> {self.target} ({self.name})".format(self=self)
+
+
+class ArchivedPayment(models.Model):
+    """
+    Terminal payment moved out of the payments table by ``getpaid_archive``.
+    Columns used for lookups are copied, the whole row is kept serialized in
+    :attr:`data`. See :mod:`getpaid.archive`.
+    """
+
+    id = models.UUIDField(primary_key=True, editable=False)
+    order = models.ForeignKey(
+        swapper.get_model_name("getpaid", "Order"),
+        verbose_name=_("order"),
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        related_name="+",
+    )
+    backend = models.CharField(_("backend"), max_length=100)
+    external_id = models.CharField(_("external id"), max_length=64, blank=True)
+    status = models.CharField(_("status"), max_length=50)
+    currency = models.CharField(_("currency"), max_length=3, default="")
+    amount_required = models.DecimalField(
+        _("amount required"), decimal_places=2, max_digits=20, default=0
+    )
+    amount_locked = models.DecimalField(
+        _("amount locked"), decimal_places=2, max_digits=20, default=0
+    )
+    amount_paid = models.DecimalField(
+        _("amount paid"), decimal_places=2, max_digits=20, default=0
+    )
+    amount_refunded = models.DecimalField(
+        _("amount refunded"), decimal_places=4, max_digits=20, default=0
+    )
+    created_on = models.DateTimeField(_("created on"))
+    archived_on = models.DateTimeField(_("archived on"), default=now)
+    data = models.TextField(_("data"))
+
+    class Meta:
+        ordering = ["-created_on"]
+        verbose_name = _("Archived payment")
+        verbose_name_plural = _("Archived payments")
+        indexes = [
+            models.Index(fields=["order", "status"], name="getpaid_archive_order_idx"),
+            models.Index(
+                fields=["external_id", "backend"], name="getpaid_archive_ext_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return "Archived payment #{self.id}".format(self=self)
+
+    def restore(self):
+        """
+        Rebuild read-only Payment instance from archived data.
+        """
+        from getpaid.archive import restore
+
+        return restore(self)
+
+
+class PaymentRollup(models.Model):
+    """
+    Daily totals of payments per backend, currency and status, kept up to
+    date on every payment save when ``PAYMENT_ROLLUPS`` is enabled.
+    Payments are counted on the day they were created.
+    See :mod:`getpaid.rollups`.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    day = models.DateField(_("day"))
+    backend = models.CharField(_("backend"), max_length=100)
+    currency = models.CharField(_("currency"), max_length=3)
+    status = models.CharField(_("status"), max_length=50)
+    count = models.IntegerField(_("count"), default=0)
+    amount_required = models.DecimalField(
+        _("amount required"), decimal_places=2, max_digits=20, default=0
+    )
+    amount_paid = models.DecimalField(
+        _("amount paid"), decimal_places=2, max_digits=20, default=0
+    )
+    amount_refunded = models.DecimalField(
+        _("amount refunded"), decimal_places=4, max_digits=20, default=0
+    )
+
+    objects = PaymentRollupQuerySet.as_manager()
+
+    class Meta:
+        ordering = ["day", "backend", "currency", "status"]
+        verbose_name = _("Payment rollup")
+        verbose_name_plural = _("Payment rollups")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "backend", "currency", "status"],
+                name="getpaid_rollup_unique",
+            )
+        ]
+
+    def __str__(self):
+        return "{self.day} {self.backend} {self.currency} {self.status}".format(
+            self=self
+        )
@@ -0,0 +1,224 @@
+"""
+Admin pagination for large payment tables.
+
+:class:`KeysetChangeList` pages by ``(created_on, pk)`` instead of ``OFFSET``,
+so every page costs the same, and :class:`EstimatedCountPaginator` takes
+row counts from database statistics instead of ``COUNT(*)``.
+"""
+
+import json
+import logging
+from typing import Optional, Tuple
+
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ALL_VAR, ChangeList
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Q, QuerySet
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+logger = logging.getLogger(__name__)
+
+AFTER_VAR = "after"
+BEFORE_VAR = "before"
+
+#: Below this estimate, rows are counted exactly.
+ESTIMATE_THRESHOLD = 10000
+
+
+def _table_estimate(queryset: QuerySet) -> Optional[int]:
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    if connection.vendor == "postgresql":
+        sql = "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass"
+        params = [connection.ops.quote_name(table)]
+    elif connection.vendor == "mysql":
+        sql = (
+            "SELECT table_rows FROM information_schema.tables "
+            "WHERE table_schema = DATABASE() AND table_name = %s"
+        )
+        params = [table]
+    else:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    # PostgreSQL reports -1 for tables never analyzed
+    return row[0] if row and row[0] is not None and row[0] >= 0 else None
+
+
+def _plan_estimate(queryset: QuerySet) -> Optional[int]:
+    if connections[queryset.db].vendor != "postgresql":
+        return None
+    plan = json.loads(queryset.order_by().explain(format="json"))
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def estimate_count(
+    queryset: QuerySet, threshold: int = ESTIMATE_THRESHOLD
+) -> Tuple[int, bool]:
+    """
+    Estimate number of rows in ``queryset``.
+
+    Unfiltered querysets use table statistics (PostgreSQL, MySQL), filtered
+    ones the query planner estimate (PostgreSQL). Small or unknown estimates
+    are replaced by an exact count.
+
+    :return: Tuple of the count and whether it is an estimate.
+    """
+    try:
+        if queryset.query.where:
+            estimate = _plan_estimate(queryset)
+        else:
+            estimate = _table_estimate(queryset)
+    except DatabaseError:
+        logger.debug("Cannot estimate row count.", exc_info=True)
+        estimate = None
+    if estimate is None or estimate < threshold:
+        return queryset.count(), False
+    return estimate, True
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator using :func:`estimate_count` for large querysets.
+    """
+
+    estimate_threshold = ESTIMATE_THRESHOLD
+    is_estimate = False
+
+    @cached_property
+    def count(self) -> int:
+        count, self.is_estimate = estimate_count(
+            self.object_list, self.estimate_threshold
+        )
+        return count
+
+
+class KeysetChangeList(ChangeList):
+    """
+    ChangeList paging by ``(created_on, pk)`` with ``after``/``before``
+    cursors when the list is ordered by creation time (the default).
+
+    Other orderings and ``list_editable`` fall back to numbered pages.
+    """
+
+    keyset_field = "created_on"
+
+    def get_filters_params(self, params=None):
+        params = super().get_filters_params(params)
+        params.pop(AFTER_VAR, None)
+        params.pop(BEFORE_VAR, None)
+        return params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # sorting and filtering start from the first page
+        new_params = {AFTER_VAR: None, BEFORE_VAR: None, **(new_params or {})}
+        return super().get_query_string(new_params, remove)
+
+    def get_keyset_ordering(self) -> Optional[bool]:
+        """
+        Return True/False for descending/ascending keyset order, or None if
+        the queryset is not ordered by the keyset.
+        """
+        ordering = list(self.queryset.query.order_by)
+        if ordering == [f"-{self.keyset_field}", "-pk"]:
+            return True
+        if ordering == [self.keyset_field, "pk"]:
+            return False
+        return None
+
+    def parse_cursor(self, value: str):
+        try:
+            created_on, pk = value.rsplit(",", 1)
+            created_on = parse_datetime(created_on)
+            pk = self.lookup_opts.pk.to_python(pk)
+        except (ValueError, ValidationError):
+            created_on = None
+        if created_on is None:
+            raise IncorrectLookupParameters(f"Invalid cursor: {value!r}")
+        return created_on, pk
+
+    def get_cursor(self, obj) -> str:
+        return f"{getattr(obj, self.keyset_field).isoformat()},{obj.pk}"
+
+    def seek(self, cursor: str, lookup: str) -> QuerySet:
+        """
+        Rows past ``cursor`` in direction of ``lookup`` (``"lt"``/``"gt"``).
+        """
+        created_on, pk = self.parse_cursor(cursor)
+        field = self.keyset_field
+        # the inclusive bound lets the database start an index scan at cursor
+        return self.queryset.filter(
+            Q(**{f"{field}__{lookup}e": created_on}),
+            Q(**{f"{field}__{lookup}": created_on})
+            | Q(**{field: created_on, f"pk__{lookup}": pk}),
+        )
+
+    def get_results(self, request):
+        descending = self.get_keyset_ordering()
+        self.keyset = descending is not None and not self.list_editable
+        if not self.keyset:
+            return super().get_results(request)
+
+        paginator = self.model_admin.get_paginator(
+            request, self.queryset, self.list_per_page
+        )
+        result_count = paginator.count
+        can_show_all = result_count <= self.list_max_show_all
+        multi_page = result_count > self.list_per_page
+        after = request.GET.get(AFTER_VAR)
+        before = request.GET.get(BEFORE_VAR)
+
+        has_previous = has_next = False
+        if (self.show_all and can_show_all) or not multi_page:
+            result_list = self.queryset._clone()
+        elif before:
+            # walk backwards and restore display order
+            queryset = self.seek(before, "gt" if descending else "lt")
+            rows = list(queryset.reverse()[: self.list_per_page + 1])
+            has_previous = len(rows) > self.list_per_page
+            result_list = rows[: self.list_per_page][::-1]
+            has_next = True
+        else:
+            queryset = self.queryset
+            if after:
+                queryset = self.seek(after, "lt" if descending else "gt")
+            rows = list(queryset[: self.list_per_page + 1])
+            has_next = len(rows) > self.list_per_page
+            result_list = rows[: self.list_per_page]
+            has_previous = bool(after)
+
+        self.first_page_url = (
+            self.get_query_string() if (after or before) and has_previous else None
+        )
+        self.previous_page_url = (
+            self.get_query_string({BEFORE_VAR: self.get_cursor(result_list[0])})
+            if has_previous and result_list
+            else None
+        )
+        self.next_page_url = (
+            self.get_query_string({AFTER_VAR: self.get_cursor(result_list[-1])})
+            if has_next and result_list
+            else None
+        )
+        self.show_all_url = (
+            self.get_query_string({ALL_VAR: ""})
+            if can_show_all and not self.show_all and multi_page
+            else None
+        )
+        self.result_count = result_count
+        self.result_count_is_estimate = getattr(paginator, "is_estimate", False)
+        self.show_full_result_count = self.model_admin.show_full_result_count
+        self.full_result_count = (
+            self.root_queryset.count() if self.show_full_result_count else None
+        )
+        self.show_admin_actions = not self.show_full_result_count or bool(
+            self.full_result_count
+        )
+        self.result_list = result_list
+        self.can_show_all = can_show_all
+        self.multi_page = multi_page
+        self.paginator = paginator
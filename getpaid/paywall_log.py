@@ -0,0 +1,250 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+from typing import Any, Optional, Tuple
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import connections, router
+from django.db.transaction import atomic
+from django.dispatch import receiver
+from django.http.response import HttpResponseBase, HttpResponseRedirectBase
+from django.template.response import SimpleTemplateResponse
+from django.utils.timezone import now
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUFFER_SIZE = 100
+DEFAULT_FLUSH_INTERVAL = 5
+DEFAULT_MAX_PAYLOAD = 4096
+DEFAULT_RETENTION_DAYS = 90
+
+INCOMING = "in"
+OUTGOING = "out"
+
+
+def _get_setting(name: str, default: Any = None) -> Any:
+    return getattr(settings, "GETPAID", {}).get(name, default)
+
+
+def _truncate(text: str) -> str:
+    limit = _get_setting("PAYWALL_LOG_MAX_PAYLOAD", DEFAULT_MAX_PAYLOAD)
+    if limit and len(text) > limit:
+        return text[:limit] + "...[truncated]"
+    return text
+
+
+def describe(value: Any) -> Tuple[Optional[int], str]:
+    """
+    Turn processor's return value or an incoming request body into
+    ``(status_code, text)`` pair without rendering templates.
+    """
+    if value is None:
+        return None, ""
+    if isinstance(value, HttpResponseRedirectBase):
+        return value.status_code, value.url
+    if isinstance(value, SimpleTemplateResponse) and not value.is_rendered:
+        return value.status_code, ""
+    if isinstance(value, HttpResponseBase):
+        if value.streaming:
+            return value.status_code, ""
+        return value.status_code, value.content.decode(value.charset, "replace")
+    if isinstance(value, bytes):
+        return None, value.decode("utf-8", "replace")
+    if isinstance(value, str):
+        return None, value
+    try:
+        return None, json.dumps(value, default=str)
+    except (TypeError, ValueError):
+        return None, repr(value)
+
+
+class PaywallLog:
+    """
+    Per-process buffer of paywall communication records.
+
+    Records are kept in memory and written with a single ``bulk_create`` when
+    ``PAYWALL_LOG_BUFFER_SIZE`` records are collected or when the oldest one
+    is older than ``PAYWALL_LOG_FLUSH_INTERVAL`` seconds. Recording never
+    writes to the database: full buffers are written when the request
+    finishes, stale ones by a background thread using its own connection, so
+    the records don't depend on caller's transaction. Remaining records are
+    written at interpreter exit. Processes that exit without running
+    ``atexit`` handlers, or long running ones outside of requests, should
+    call :meth:`flush` themselves.
+    """
+
+    def __init__(self) -> None:
+        self._buffer = []
+        self._lock = threading.Lock()
+        # one flush at a time, so that exit waits for the background one
+        self._flush_lock = threading.Lock()
+        if hasattr(os, "register_at_fork"):
+            # locks may be held by threads that don't exist in the child
+            os.register_at_fork(after_in_child=self._reset_locks)
+        self._pid = os.getpid()
+        self._first_at = None
+        self._flusher = None
+
+    def _reset_locks(self) -> None:
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    @property
+    def enabled(self) -> bool:
+        return _get_setting("PAYWALL_LOG", False)
+
+    def record(self, direction: str, action: str, **kwargs) -> None:
+        """
+        Buffer a record. See :meth:`build_entry` for accepted arguments.
+        """
+        if self.enabled:
+            self._append(self.build_entry(direction, action, **kwargs))
+
+    async def arecord(self, direction: str, action: str, **kwargs) -> None:
+        """
+        Async version of :meth:`record`.
+        """
+        if self.enabled:
+            self._append(self.build_entry(direction, action, **kwargs))
+
+    def build_entry(
+        self,
+        direction: str,
+        action: str,
+        payment_id: Any = None,
+        backend: str = "",
+        duration: Optional[float] = None,
+        request_data: Any = None,
+        response: Any = None,
+        error: Optional[BaseException] = None,
+    ) -> dict:
+        status_code, response_data = describe(response)
+        return dict(
+            payment_id=payment_id,
+            backend=backend or "",
+            direction=direction,
+            action=action,
+            created_on=now(),
+            duration=None if duration is None else int(duration * 1000),
+            status_code=status_code,
+            request_data=_truncate(describe(request_data)[1]),
+            response_data=_truncate(response_data),
+            error="" if error is None else _truncate(repr(error)),
+        )
+
+    def _append(self, entry: dict) -> None:
+        with self._lock:
+            if self._pid != os.getpid():
+                # forked: parent's records and flusher are not ours
+                self._buffer = []
+                self._pid = os.getpid()
+                self._flusher = None
+            if not self._buffer:
+                self._first_at = time.monotonic()
+            self._buffer.append(entry)
+            if self._flusher is None:
+                self._flusher = threading.Thread(
+                    target=self._run_flusher, name="getpaid-paywall-log", daemon=True
+                )
+                self._flusher.start()
+
+    def is_due(self) -> bool:
+        """
+        Tell if the buffer is full or its oldest record is stale.
+        """
+        with self._lock:
+            if not self._buffer or self._pid != os.getpid():
+                return False
+            full = len(self._buffer) >= _get_setting(
+                "PAYWALL_LOG_BUFFER_SIZE", DEFAULT_BUFFER_SIZE
+            )
+            stale = time.monotonic() - self._first_at >= _get_setting(
+                "PAYWALL_LOG_FLUSH_INTERVAL", DEFAULT_FLUSH_INTERVAL
+            )
+        return full or stale
+
+    def flush_if_due(self) -> int:
+        """
+        Write buffered records if :meth:`is_due`.
+        """
+        return self.flush() if self.is_due() else 0
+
+    def _run_flusher(self) -> None:
+        while True:
+            interval = _get_setting(
+                "PAYWALL_LOG_FLUSH_INTERVAL", DEFAULT_FLUSH_INTERVAL
+            )
+            time.sleep(interval or DEFAULT_FLUSH_INTERVAL)
+            self._flush_in_background()
+
+    def _flush_in_background(self) -> None:
+        from getpaid.models import PaywallLogEntry
+
+        try:
+            self.flush_if_due()
+        finally:
+            # this thread's connection is not closed by request signals
+            connections[router.db_for_write(PaywallLogEntry)].close()
+
+    def flush(self) -> int:
+        """
+        Write buffered records to database. Returns number of written records.
+        Waits for a flush running in another thread to finish first.
+        """
+        with self._flush_lock:
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._buffer = []
+                    self._pid = os.getpid()
+                entries, self._buffer = self._buffer, []
+            if not entries:
+                return 0
+            from getpaid.models import PaywallLogEntry
+
+            try:
+                # savepoint keeps caller's transaction usable if the insert fails
+                with atomic():
+                    PaywallLogEntry.objects.bulk_create(
+                        [PaywallLogEntry(**entry) for entry in entries]
+                    )
+            except Exception:
+                logger.exception(
+                    "Could not write paywall log.", extra={"entries": len(entries)}
+                )
+                return 0
+            return len(entries)
+
+    def prune(self, days: Optional[float] = None) -> int:
+        """
+        Remove records older than ``days`` (default: ``PAYWALL_LOG_RETENTION``).
+        """
+        from getpaid.models import PaywallLogEntry
+
+        if days is None:
+            days = _get_setting("PAYWALL_LOG_RETENTION", DEFAULT_RETENTION_DAYS)
+        deleted, _ = PaywallLogEntry.objects.filter(
+            created_on__lt=now() - timedelta(days=days)
+        ).delete()
+        return deleted
+
+
+paywall_log = PaywallLog()
+
+
+@receiver(request_finished)
+def _flush_after_request(**kwargs):
+    paywall_log.flush_if_due()
+
+
+@atexit.register
+def _flush_at_exit():
+    # also waits for a background flush that may be in progress
+    paywall_log.flush()
@@ -1,4 +1,6 @@
 from django import forms
+from django.utils.functional import cached_property
+from django.utils.html import format_html_join
 
 
 class PaymentHiddenInputsPostForm(forms.Form):
@@ -9,3 +11,63 @@ class PaymentHiddenInputsPostForm(forms.Form):
             self.fields[key] = forms.CharField(
                 initial=fields[key], widget=forms.HiddenInput
             )
+
+
+class HiddenInputsPostForm:
+    """
+    Lightweight version of :class:`PaymentHiddenInputsPostForm` for paywall
+    auto-submit pages. Hidden inputs are escaped and joined directly, without
+    building form fields and rendering widget templates. Supports the usual
+    ways of rendering a form in templates (``{{ form }}``,
+    ``{{ form.as_p }}`` etc). Iterating over fields, ``form.hidden_fields``
+    and the like fall back to a regular form.
+    """
+
+    def __init__(self, fields, *args, **kwargs):
+        self.initial = dict(fields)
+
+    @cached_property
+    def form(self):
+        # only built if someone inspects the fields, eg. templates or REST helpers
+        return PaymentHiddenInputsPostForm(self.initial)
+
+    @property
+    def fields(self):
+        return self.form.fields
+
+    def __iter__(self):
+        return iter(self.form)
+
+    def __getitem__(self, name):
+        return self.form[name]
+
+    def __len__(self):
+        return len(self.initial)
+
+    def hidden_fields(self):
+        return self.form.hidden_fields()
+
+    def visible_fields(self):
+        return self.form.visible_fields()
+
+    @cached_property
+    def html(self):
+        return format_html_join(
+            "",
+            '<input type="hidden" name="{}" value="{}">',
+            (
+                (name, "" if value is None else value)
+                for name, value in self.initial.items()
+            ),
+        )
+
+    def __str__(self):
+        return self.html
+
+    def __html__(self):
+        return self.html
+
+    def render(self, *args, **kwargs):
+        return self.html
+
+    as_p = as_table = as_ul = as_div = render
@@ -1,16 +1,21 @@
+import hmac
 from abc import ABC, abstractmethod
 from decimal import Decimal
-from importlib import import_module
 from typing import TYPE_CHECKING, Any, List, Mapping, Optional, Type, Union
 
+from asgiref.sync import async_to_sync, sync_to_async
 from django.conf import settings
 from django.contrib.sites.shortcuts import get_current_site
 from django.core.exceptions import ImproperlyConfigured
 from django.forms import BaseForm
-from django.http import HttpRequest, HttpResponse
+from django.http import HttpRequest, HttpResponse, HttpResponseRedirect
+from django.template.response import TemplateResponse
 from django.views import View
 
-from getpaid.types import ChargeResponse, PaymentStatusResponse
+from getpaid.clients import client_pool
+from getpaid.conf import BackendConfig, backend_configs
+from getpaid.types import ChargeResponse, PaymentIntent, PaymentStatusResponse
+from getpaid.utils import get_intent_url, import_by_path, load_template
 
 if TYPE_CHECKING:
     from .abstracts import AbstractPayment
@@ -27,6 +32,9 @@ class BaseProcessor(ABC):
     slug = None  #: For friendly urls
     post_form_class = None
     post_template_name = None
+    #: Request header with HMAC signature of callbacks, see :meth:`verify_callback`.
+    signature_header = None
+    signature_algorithm = "sha256"  #: Digest used for callback signatures.
     client_class = None
     client = None
     #: List of potentially successful HTTP status codes returned by paywall
@@ -41,10 +49,9 @@ class BaseProcessor(ABC):
         self.context = {}  # can be used by Payment's customized methods.
         if self.slug is None:
             self.slug = self.path
-        self.config = getattr(settings, "GETPAID_BACKEND_SETTINGS", {}).get(
-            self.path, {}
-        )
-        self.optional_config = getattr(settings, "GETPAID", {})
+        self.backend_config = backend_configs.get(self.path)
+        self.config = self.backend_config.backend
+        self.optional_config = self.backend_config.defaults
         if self.client_class is not None:
             self.client = self.get_client()
 
@@ -53,13 +60,20 @@ class BaseProcessor(ABC):
         if not class_path:
             class_path = self.client_class
         if class_path and not callable(class_path):
-            module_name, _, class_name = class_path.rpartition(".")
-            module = import_module(module_name)
-            return getattr(module, class_name)
+            return import_by_path(class_path)
         return class_path
 
     def get_client(self) -> object:
-        return self.get_client_class()(**self.get_client_params())
+        """
+        Return client for paywall API. By default a new one is built for every
+        processor; set ``POOL_CLIENTS`` for backends with thread-safe clients
+        to share them through :data:`getpaid.clients.client_pool`.
+        """
+        client_class = self.get_client_class()
+        params = self.get_client_params()
+        if not self.get_setting("POOL_CLIENTS"):
+            return client_class(**params)
+        return client_pool.get(self.path, client_class, params)
 
     def get_client_params(self) -> dict:
         return {}
@@ -69,10 +83,20 @@ class BaseProcessor(ABC):
         return cls.__module__
 
     def get_setting(self, name: str, default: Optional[Any] = None) -> Any:
-        value = self.config.get(name, default)
-        if value is None:
-            value = self.optional_config.get(name, None)
-        return value
+        """
+        Get value from backend's config, falling back to ``default``
+        and then to ``GETPAID`` settings.
+        """
+        return self.backend_config.get_setting(name, default)
+
+    @classmethod
+    def validate_config(cls, config: BackendConfig) -> None:
+        """
+        (Optional)
+        Validate backend's :class:`~getpaid.conf.BackendConfig`. Called when
+        the plugin is registered and after settings change.
+        Raise :class:`~django.core.exceptions.ImproperlyConfigured` on errors.
+        """
 
     @classmethod
     def get_display_name(cls, **kwargs) -> str:
@@ -113,14 +137,22 @@ class BaseProcessor(ABC):
             raise ImproperlyConfigured("Couldn't determine template name!")
         return [template_name]
 
+    def get_post_template(self, view: Optional[View] = None, **kwargs):
+        """
+        Template of the POST form page. Unless ``DEBUG`` is on, it is loaded
+        and compiled once per set of template names (ie. per backend).
+        """
+        template_names = self.get_template_names(view=view)
+        if settings.DEBUG:
+            return template_names
+        return load_template(tuple(template_names))
+
     def get_form_class(self, **kwargs) -> Type:
         form_class_path = self.get_setting("POST_FORM_CLASS")
         if not form_class_path:
             return self.post_form_class
         if isinstance(form_class_path, str):
-            module_path, class_name = form_class_path.rsplit(".", 1)
-            module = import_module(module_path)
-            return getattr(module, class_name)
+            return import_by_path(form_class_path)
         return self.post_form_class
 
     def prepare_form_data(self, post_data: dict, **kwargs) -> Mapping[str, Any]:
@@ -156,6 +188,44 @@ class BaseProcessor(ABC):
         """
         raise NotImplementedError
 
+    def prepare_payment_intent(
+        self, request: Optional[HttpRequest] = None, **kwargs
+    ) -> PaymentIntent:
+        """
+        (Optional)
+        Register the payment with paywall like :meth:`prepare_transaction`,
+        but return :class:`~getpaid.types.PaymentIntent` instead of a response,
+        so that REST clients are served without rendering templates.
+        :meth:`prepare_transaction` can then return :meth:`get_intent_response`.
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def has_payment_intent(cls) -> bool:
+        return cls.prepare_payment_intent is not BaseProcessor.prepare_payment_intent
+
+    def get_intent_response(
+        self,
+        intent: PaymentIntent,
+        request: Optional[HttpRequest] = None,
+        view: Optional[View] = None,
+        **kwargs,
+    ) -> HttpResponse:
+        """
+        Build response sending the buyer according to ``intent`` - a redirect
+        for ``GET`` or a page with POST form.
+        """
+        if intent["method"] == "GET":
+            return HttpResponseRedirect(get_intent_url(intent))
+        return TemplateResponse(
+            request=request,
+            template=self.get_post_template(view=view),
+            context={
+                "form": self.get_form(intent["fields"]),
+                "paywall_url": intent["target_url"],
+            },
+        )
+
     def handle_paywall_callback(self, request: HttpRequest, **kwargs) -> HttpResponse:
         """
         This method handles the callback from paywall for the purpose
@@ -165,6 +235,72 @@ class BaseProcessor(ABC):
         """
         raise NotImplementedError
 
+    @classmethod
+    def get_callback_external_id(cls, request: HttpRequest, **kwargs) -> Optional[str]:
+        """
+        (Optional)
+        Extract payment's ``external_id`` from a callback request received by
+        :class:`~getpaid.views.ExternalIdCallbackView`. Implement it if
+        paywall can't send callbacks to a url containing payment's pk.
+
+        :return: External id or None if the request doesn't contain it.
+        """
+        return None
+
+    @classmethod
+    def verify_callback(
+        cls, request: HttpRequest, config: BackendConfig, **kwargs
+    ) -> bool:
+        """
+        (Optional)
+        Check authenticity of a callback. Views call it before the payment
+        is loaded whenever the backend is known from the url, so forged
+        callbacks are rejected (HTTP 403) without touching the database.
+
+        By default, if :attr:`signature_header` is set, the header must hold
+        hex-encoded HMAC of :meth:`get_signed_content` made with one of the
+        backend's :attr:`~getpaid.conf.BackendConfig.signature_keys`.
+
+        :return: False to reject the callback.
+        """
+        if cls.signature_header is None:
+            return True
+        signature = cls.get_callback_signature(request)
+        if not signature or not config.signature_keys:
+            return False
+        signature = signature.strip().lower().encode()
+        content = cls.get_signed_content(request)
+        return any(
+            hmac.compare_digest(cls.sign_content(content, key).encode(), signature)
+            for key in config.signature_keys
+        )
+
+    @classmethod
+    def get_callback_signature(cls, request: HttpRequest, **kwargs) -> Optional[str]:
+        """
+        (Optional)
+        Extract signature from a callback. By default it's the value of
+        :attr:`signature_header`.
+        """
+        if cls.signature_header is None:
+            return None
+        return request.headers.get(cls.signature_header)
+
+    @classmethod
+    def get_signed_content(cls, request: HttpRequest, **kwargs) -> bytes:
+        """
+        (Optional)
+        Part of a callback covered by its signature. By default the raw body.
+        """
+        return request.body
+
+    @classmethod
+    def sign_content(cls, content: bytes, key: bytes, **kwargs) -> str:
+        """
+        Hex-encoded HMAC of ``content`` using :attr:`signature_algorithm`.
+        """
+        return hmac.new(key, content, cls.signature_algorithm).hexdigest()
+
     def fetch_payment_status(self, **kwargs) -> PaymentStatusResponse:
         # TODO use interface annotation to specify the dict layout
         """
@@ -172,6 +308,20 @@ class BaseProcessor(ABC):
         """
         raise NotImplementedError
 
+    @classmethod
+    def fetch_payment_statuses(
+        cls, payments: List[AbstractPayment], **kwargs
+    ) -> Mapping[Any, PaymentStatusResponse]:
+        """
+        (Optional)
+        Batch version of :meth:`fetch_payment_status` used by
+        :class:`~getpaid.reconciliation.StatusReconciler`. Implement it if
+        paywall can report statuses of many payments in one call.
+
+        :return: Mapping of payment pk to its status report.
+        """
+        raise NotImplementedError
+
     def charge(
         self, amount: Optional[Union[Decimal, float, int]] = None, **kwargs
     ) -> ChargeResponse:
@@ -209,3 +359,133 @@ class BaseProcessor(ABC):
         Returns True/False if the cancel succeeded.
         """
         raise NotImplementedError
+
+    # Async counterparts. By default they run the sync methods in a worker
+    # thread so that sync-only plugins can be used from async code.
+
+    async def aprepare_transaction(
+        self, request: HttpRequest, view: Optional[View] = None, **kwargs
+    ) -> HttpResponse:
+        return await sync_to_async(self.prepare_transaction)(
+            request, view=view, **kwargs
+        )
+
+    async def aprepare_payment_intent(
+        self, request: Optional[HttpRequest] = None, **kwargs
+    ) -> PaymentIntent:
+        return await sync_to_async(self.prepare_payment_intent)(request, **kwargs)
+
+    async def ahandle_paywall_callback(
+        self, request: HttpRequest, **kwargs
+    ) -> HttpResponse:
+        return await sync_to_async(self.handle_paywall_callback)(request, **kwargs)
+
+    async def afetch_payment_status(self, **kwargs) -> PaymentStatusResponse:
+        return await sync_to_async(self.fetch_payment_status)(**kwargs)
+
+    async def acharge(
+        self, amount: Optional[Union[Decimal, float, int]] = None, **kwargs
+    ) -> ChargeResponse:
+        return await sync_to_async(self.charge)(amount=amount, **kwargs)
+
+    async def arelease_lock(self, **kwargs) -> Decimal:
+        return await sync_to_async(self.release_lock)(**kwargs)
+
+    async def astart_refund(
+        self, amount: Optional[Union[Decimal, float, int]] = None, **kwargs
+    ) -> Decimal:
+        return await sync_to_async(self.start_refund)(amount=amount, **kwargs)
+
+    async def acancel_refund(self, **kwargs) -> bool:
+        return await sync_to_async(self.cancel_refund)(**kwargs)
+
+
+class AsyncBaseProcessor(BaseProcessor):
+    """
+    Base class for plugins talking to paywall with async I/O.
+
+    Implement the ``a``-prefixed coroutines instead of their sync versions.
+    Sync methods are still available - they run the coroutines in an event
+    loop, so the plugin works under WSGI as well. Remember that ORM calls
+    (eg. ``self.payment.save()``) need to be wrapped with
+    :func:`~asgiref.sync.sync_to_async`.
+    """
+
+    @abstractmethod
+    async def aprepare_transaction(
+        self, request: HttpRequest, view: Optional[View] = None, **kwargs
+    ) -> HttpResponse:
+        """
+        Prepare Response for the view asking to prepare transaction.
+
+        :return: HttpResponse instance
+        """
+        raise NotImplementedError
+
+    async def aprepare_payment_intent(
+        self, request: Optional[HttpRequest] = None, **kwargs
+    ) -> PaymentIntent:
+        raise NotImplementedError
+
+    @classmethod
+    def has_payment_intent(cls) -> bool:
+        return (
+            cls.aprepare_payment_intent
+            is not AsyncBaseProcessor.aprepare_payment_intent
+        )
+
+    async def ahandle_paywall_callback(
+        self, request: HttpRequest, **kwargs
+    ) -> HttpResponse:
+        raise NotImplementedError
+
+    async def afetch_payment_status(self, **kwargs) -> PaymentStatusResponse:
+        raise NotImplementedError
+
+    async def acharge(
+        self, amount: Optional[Union[Decimal, float, int]] = None, **kwargs
+    ) -> ChargeResponse:
+        raise NotImplementedError
+
+    async def arelease_lock(self, **kwargs) -> Decimal:
+        raise NotImplementedError
+
+    async def astart_refund(
+        self, amount: Optional[Union[Decimal, float, int]] = None, **kwargs
+    ) -> Decimal:
+        raise NotImplementedError
+
+    async def acancel_refund(self, **kwargs) -> bool:
+        raise NotImplementedError
+
+    def prepare_transaction(
+        self, request: HttpRequest, view: Optional[View] = None, **kwargs
+    ) -> HttpResponse:
+        return async_to_sync(self.aprepare_transaction)(request, view=view, **kwargs)
+
+    def prepare_payment_intent(
+        self, request: Optional[HttpRequest] = None, **kwargs
+    ) -> PaymentIntent:
+        return async_to_sync(self.aprepare_payment_intent)(request, **kwargs)
+
+    def handle_paywall_callback(self, request: HttpRequest, **kwargs) -> HttpResponse:
+        return async_to_sync(self.ahandle_paywall_callback)(request, **kwargs)
+
+    def fetch_payment_status(self, **kwargs) -> PaymentStatusResponse:
+        return async_to_sync(self.afetch_payment_status)(**kwargs)
+
+    def charge(
+        self, amount: Optional[Union[Decimal, float, int]] = None, **kwargs
+    ) -> ChargeResponse:
+        return async_to_sync(self.acharge)(amount=amount, **kwargs)
+
+    def release_lock(self, **kwargs) -> Decimal:
+        return async_to_sync(self.arelease_lock)(**kwargs)
+
+    def start_refund(
+        self, amount: Optional[Union[Decimal, float, int]] = None, **kwargs
+    ) -> Decimal:
+        return async_to_sync(self.astart_refund)(amount=amount, **kwargs)
+
+    def cancel_refund(self, **kwargs) -> bool:
+        return async_to_sync(self.acancel_refund)(**kwargs)
@@ -0,0 +1,173 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import swapper
+from django.db import connections
+from django.db.models import QuerySet
+from django.db.transaction import atomic
+
+from getpaid import history, rollups, summary
+from getpaid.types import PaymentStatus as ps
+from getpaid.types import PaymentStatusResponse, ReconciliationResult
+
+logger = logging.getLogger(__name__)
+
+
+class StatusReconciler:
+    """
+    Fetch statuses of many open payments from their paywalls ('PULL' flow)
+    and store the results in bulk.
+
+    Payments are read in batches using keyset pagination over the primary key.
+    Within a batch, processors implementing
+    :meth:`~getpaid.processor.BaseProcessor.fetch_payment_statuses` are asked
+    once per backend, remaining payments are fetched concurrently using a
+    bounded thread pool. Proposed callbacks are run on the instances and
+    the changes are written with one ``bulk_update`` per batch - only for
+    rows whose status hasn't changed in the meantime.
+
+    Note that ``post_save`` signals are not sent for bulk-updated payments.
+    """
+
+    #: Statuses of payments that are checked by default. ``NEW`` payments
+    #: have not been sent to paywall yet.
+    statuses = tuple(s for s in ps.active if s != ps.NEW)
+
+    def __init__(
+        self,
+        queryset: Optional[QuerySet] = None,
+        backends: Optional[Iterable[str]] = None,
+        statuses: Optional[Iterable[str]] = None,
+        batch_size: int = 100,
+        max_workers: int = 8,
+    ) -> None:
+        if queryset is None:
+            queryset = swapper.load_model("getpaid", "Payment").objects.all()
+        if statuses is not None:
+            self.statuses = tuple(statuses)
+        queryset = queryset.filter(status__in=self.statuses)
+        if backends:
+            queryset = queryset.filter(backend__in=list(backends))
+        self.queryset = queryset
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self._batch_unsupported = set()
+
+    def iter_batches(self) -> Iterator[List]:
+        last_pk = None
+        while True:
+            queryset = self.queryset.order_by("pk")
+            if last_pk is not None:
+                queryset = queryset.filter(pk__gt=last_pk)
+            batch = list(queryset[: self.batch_size])
+            if not batch:
+                return
+            yield batch
+            last_pk = batch[-1].pk
+
+    def _fetch_one(self, payment) -> PaymentStatusResponse:
+        try:
+            return payment.fetch_status()
+        except Exception as e:
+            logger.warning(
+                "Could not fetch payment status.",
+                exc_info=True,
+                extra={"payment_id": payment.pk, "backend": payment.backend},
+            )
+            return {"exception": e}
+        finally:
+            connections.close_all()
+
+    def fetch_statuses(self, batch: List, executor: ThreadPoolExecutor) -> Dict:
+        reports = {}
+        pending = []
+        batch = sorted(batch, key=lambda p: p.backend)
+        for backend, payments in groupby(batch, key=lambda p: p.backend):
+            payments = list(payments)
+            if backend not in self._batch_unsupported:
+                processor_class = type(payments[0].processor)
+                try:
+                    reports.update(processor_class.fetch_payment_statuses(payments))
+                    continue
+                except NotImplementedError:
+                    self._batch_unsupported.add(backend)
+                except Exception as e:
+                    logger.warning(
+                        "Could not fetch payment statuses in batch.",
+                        exc_info=True,
+                        extra={"backend": backend},
+                    )
+                    reports.update({p.pk: {"exception": e} for p in payments})
+                    continue
+            pending.extend(payments)
+        for payment, report in zip(pending, executor.map(self._fetch_one, pending)):
+            reports[payment.pk] = report
+        return reports
+
+    def apply(self, batch: List, reports: Dict, result: ReconciliationResult) -> None:
+        fields = [f for f in batch[0]._meta.concrete_fields if not f.primary_key]
+        changed = {}
+        changed_fields = set()
+        for payment in batch:
+            report = reports.get(payment.pk)
+            if not report or "exception" in report:
+                result["errors"] += 1
+                continue
+            before = {f.attname: getattr(payment, f.attname) for f in fields}
+            try:
+                payment.apply_status_report(report, save=False)
+            except Exception:
+                logger.exception(
+                    "Could not apply payment status.", extra={"payment_id": payment.pk}
+                )
+                result["errors"] += 1
+                continue
+            if "callback_result" not in report:
+                result["skipped"] += 1
+                continue
+            changed[payment.pk] = (payment, before["status"])
+            changed_fields.update(
+                f.name
+                for f in fields
+                if getattr(payment, f.attname) != before[f.attname]
+            )
+        if not changed:
+            return
+
+        model = type(batch[0])
+        with atomic():
+            current = dict(
+                model._default_manager.select_for_update()
+                .filter(pk__in=list(changed))
+                .values_list("pk", "status")
+            )
+            to_save = []
+            for pk, (payment, status) in changed.items():
+                if current.get(pk) == status:
+                    to_save.append(payment)
+                    reports[pk]["saved"] = True
+                else:
+                    # changed meanwhile, eg. by a callback - next run will see it
+                    result["skipped"] += 1
+            if to_save and changed_fields:
+                model._default_manager.bulk_update(to_save, sorted(changed_fields))
+                if summary.is_enabled():
+                    summary.rebuild_order_summaries({p.order_id for p in to_save})
+                if rollups.is_enabled():
+                    rollups.rebuild_rollups(
+                        days={rollups.get_day(p.created_on) for p in to_save},
+                        backends={p.backend for p in to_save},
+                    )
+            history.flush_transitions(to_save)
+        result["updated"] += len(to_save)
+
+    def run(self) -> ReconciliationResult:
+        result = {"checked": 0, "updated": 0, "skipped": 0, "errors": 0}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for batch in self.iter_batches():
+                result["checked"] += len(batch)
+                reports = self.fetch_statuses(batch, executor)
+                self.apply(batch, reports, result)
+        return result
@@ -1,7 +1,11 @@
+import hashlib
 import importlib
+import json
 
 from django.urls import include, path
+from django.utils.translation import get_language
 
+from getpaid.conf import backend_configs
 from getpaid.processor import BaseProcessor
 
 
@@ -13,9 +17,18 @@ def importable(name):
         return False
 
 
+#: Catalog of unsupported currencies, shared and never cached.
+EMPTY_CATALOG = {"version": hashlib.sha256(b"[]").hexdigest()[:16], "backends": []}
+
+
 class PluginRegistry(object):
     def __init__(self):
         self._backends = {}
+        self._backends_by_slug = {}
+        self._backends_by_currency = {}
+        self._choices_by_currency = {}
+        self._catalogs = {}
+        self._urls = None
 
     def __contains__(self, item):
         return item in self._backends
@@ -34,56 +47,136 @@ class PluginRegistry(object):
         if hasattr(module_or_proc, "__base__") and issubclass(
             module_or_proc, BaseProcessor
         ):
-            self._backends[module_or_proc.slug] = module_or_proc
+            name, processor = module_or_proc.slug, module_or_proc
         else:
+            name = module_or_proc.__name__
             processor = module_or_proc.processor.PaymentProcessor
-            self._backends[module_or_proc.__name__] = processor
+        backend_configs.register(name, processor)
+        self._backends[name] = processor
+        self._build_index()
+        self.invalidate_urls()
+
+    def unregister(self, name):
+        """
+        Remove plugin registered under given name (dotted path or slug).
+        """
+        del self._backends[name]
+        backend_configs.unregister(name)
+        self._build_index()
+        self.invalidate_urls()
+
+    def _build_index(self):
+        """
+        Precompute currency-keyed lookups so that per-request calls
+        don't need to scan all registered plugins.
+        """
+        backends_by_currency = {}
+        choices_by_currency = {}
+        self._backends_by_slug = {
+            processor.slug or name: (name, processor)
+            for name, processor in self._backends.items()
+        }
+        for name, processor in self._backends.items():
+            for currency in processor.get_accepted_currencies() or []:
+                backends_by_currency.setdefault(currency, []).append(processor)
+                choices_by_currency.setdefault(currency, []).append(
+                    (name, processor.display_name)
+                )
+        self._backends_by_currency = {
+            currency: tuple(backends)
+            for currency, backends in backends_by_currency.items()
+        }
+        self._choices_by_currency = {
+            currency: tuple(choices)
+            for currency, choices in choices_by_currency.items()
+        }
+        self._catalogs = {}
+
+    def get_by_slug(self, slug):
+        """
+        Get ``(name, processor)`` of plugin with given slug.
+        Raises ``KeyError`` if there is none.
+        """
+        return self._backends_by_slug[slug]
 
     def get_choices(self, currency):
         """
         Get CHOICES for plugins that support given currency.
         """
-        currency = currency.upper()
-        return [
-            (name, p.display_name)
-            for name, p in self._backends.items()
-            if currency in p.get_accepted_currencies()
-        ]
+        return list(self._choices_by_currency.get(currency.upper(), ()))
 
     def get_backends(self, currency):
         """
         Get plugins that support given currency.
         """
-        currency = currency.upper()
-        return [
-            backend
-            for backend in self._backends.values()
-            if currency in backend.get_accepted_currencies()
-        ]
+        return list(self._backends_by_currency.get(currency.upper(), ()))
+
+    def get_catalog(self, currency=None):
+        """
+        Get serializable catalog of plugins (supporting given currency):
+        ``{"version": ..., "backends": [...]}``. Version changes with the
+        content, so it can be used as ETag. Built once per language and
+        supported currency until registration changes; unsupported currencies
+        get the shared :data:`EMPTY_CATALOG`.
+        """
+        currency = currency.upper() if currency else None
+        if currency is not None and currency not in self._backends_by_currency:
+            # don't let arbitrary input grow the cache
+            return EMPTY_CATALOG
+        key = (get_language(), currency)
+        catalog = self._catalogs.get(key)
+        if catalog is None:
+            backends = [
+                {
+                    "name": name,
+                    "slug": processor.slug or name,
+                    "display_name": str(processor.get_display_name() or name),
+                    "logo_url": processor.get_logo_url(),
+                    "currencies": sorted(
+                        c.upper() for c in processor.get_accepted_currencies() or []
+                    ),
+                }
+                for name, processor in self._backends.items()
+            ]
+            if currency is not None:
+                backends = [b for b in backends if currency in b["currencies"]]
+            content = json.dumps(backends, sort_keys=True, default=str)
+            catalog = self._catalogs[key] = {
+                "version": hashlib.sha256(content.encode()).hexdigest()[:16],
+                "backends": backends,
+            }
+        return catalog
 
     @property
     def urls(self):
         """
         Provide URL structure for all registered plugins that have urls defined.
+        Computed on first access and cached until registration changes.
+        """
+        if self._urls is None:
+            self._urls = [
+                path(
+                    "{}/".format(p.slug),
+                    include(("{}.urls".format(name), p.slug), namespace=p.slug),
+                )
+                for name, p in self._backends.items()
+                if importable("{}.urls".format(name))
+            ]
+        return list(self._urls)
+
+    def invalidate_urls(self):
+        """
+        Drop cached URL structure, eg. after plugin's urls module has changed.
         """
-        return [
-            path(
-                "{}/".format(p.slug),
-                include(("{}.urls".format(name), p.slug), namespace=p.slug),
-            )
-            for name, p in self._backends.items()
-            if importable("{}.urls".format(name))
-        ]
+        self._urls = None
 
     def get_all_supported_currency_choices(self):
         """
         Get all currencies that are supported by at least one plugin,
         in CHOICES format.
         """
-        currencies = set()
-        for backend in self._backends:
-            currencies.update(backend.accepted_currencies or [])
-        return [(c.upper(), c.upper()) for c in currencies]
+        currencies = {c.upper() for c in self._backends_by_currency}
+        return [(c, c) for c in currencies]
 
 
 registry = PluginRegistry()
@@ -0,0 +1,156 @@
+"""
+Daily payment rollups (:class:`~getpaid.models.PaymentRollup`).
+
+When ``PAYMENT_ROLLUPS`` is enabled, every save of a payment moves its
+contribution between rollup rows of the day it was created on, in the same
+transaction. Bulk operations and ``getpaid_rebuild_rollups`` recompute whole
+days from payments (including archived ones).
+"""
+
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Iterable, NamedTuple, Optional
+
+import swapper
+from django.conf import settings
+from django.db import IntegrityError, models
+from django.db.models.functions import TruncDate
+from django.db.transaction import atomic
+from django.utils import timezone
+
+AMOUNTS = ("amount_required", "amount_paid", "amount_refunded")
+
+#: Payment fields the contribution is computed from.
+STATE_FIELDS = {"created_on", "backend", "currency", "status", *AMOUNTS}
+
+
+class Contribution(NamedTuple):
+    day: date
+    backend: str
+    currency: str
+    status: str
+    amount_required: Decimal
+    amount_paid: Decimal
+    amount_refunded: Decimal
+
+    @property
+    def key(self):
+        return self[:4]
+
+
+def is_enabled() -> bool:
+    return getattr(settings, "GETPAID", {}).get("PAYMENT_ROLLUPS", False)
+
+
+def get_day(created_on: datetime) -> date:
+    """
+    Day of the rollup row, in the current time zone like ``TruncDate``.
+    """
+    if timezone.is_aware(created_on):
+        return timezone.localdate(created_on)
+    return created_on.date()
+
+
+def get_contribution(payment) -> Optional[Contribution]:
+    if payment.created_on is None:
+        return None
+    return Contribution(
+        get_day(payment.created_on),
+        payment.backend,
+        payment.currency,
+        getattr(payment.status, "value", payment.status),
+        payment.amount_required,
+        payment.amount_paid,
+        payment.amount_refunded,
+    )
+
+
+def update_rollups(
+    before: Optional[Contribution], after: Optional[Contribution]
+) -> None:
+    """
+    Apply the change of one payment's contribution to rollups.
+    ``before`` is None for new payments, ``after`` for deleted ones.
+    """
+    from getpaid.models import PaymentRollup
+
+    if before == after:
+        return
+    deltas = defaultdict(lambda: defaultdict(int))
+    for contribution, sign in ((before, -1), (after, 1)):
+        if contribution is not None:
+            delta = deltas[contribution.key]
+            delta["count"] += sign
+            for name in AMOUNTS:
+                delta[name] += sign * Decimal(getattr(contribution, name) or 0)
+    for (day, backend, currency, status), delta in deltas.items():
+        changes = {
+            name: models.F(name) + value for name, value in delta.items() if value
+        }
+        if not changes:
+            continue
+        updated = PaymentRollup.objects.filter(
+            day=day, backend=backend, currency=currency, status=status
+        ).update(**changes)
+        if not updated:
+            # new bucket or rollups not built yet for this day
+            rebuild_rollups(days=[day], backends=[backend])
+
+
+def _aggregate(queryset, days, backends):
+    queryset = queryset.order_by().annotate(day=TruncDate("created_on"))
+    if days is not None:
+        queryset = queryset.filter(day__in=days)
+    if backends is not None:
+        queryset = queryset.filter(backend__in=backends)
+    return queryset.values("day", "backend", "currency", "status").annotate(
+        payments=models.Count("pk"),
+        required=models.Sum("amount_required"),
+        paid=models.Sum("amount_paid"),
+        refunded=models.Sum("amount_refunded"),
+    )
+
+
+def rebuild_rollups(
+    days: Optional[Iterable[date]] = None, backends: Optional[Iterable[str]] = None
+) -> int:
+    """
+    Recompute rollups of given days and backends (default: all) from
+    payments and archived payments. Returns number of rows written.
+    """
+    from getpaid.models import ArchivedPayment, PaymentRollup
+
+    Payment = swapper.load_model("getpaid", "Payment")
+    days = None if days is None else list(days)
+    backends = None if backends is None else list(backends)
+    totals = {}
+    for queryset in (Payment._default_manager.all(), ArchivedPayment.objects.all()):
+        for row in _aggregate(queryset, days, backends):
+            key = (row["day"], row["backend"], row["currency"], row["status"])
+            rollup = totals.setdefault(
+                key,
+                PaymentRollup(
+                    day=key[0], backend=key[1], currency=key[2], status=key[3]
+                ),
+            )
+            rollup.count += row["payments"]
+            rollup.amount_required += row["required"] or 0
+            rollup.amount_paid += row["paid"] or 0
+            rollup.amount_refunded += row["refunded"] or 0
+    rollups = PaymentRollup.objects.all()
+    if days is not None:
+        rollups = rollups.filter(day__in=days)
+    if backends is not None:
+        rollups = rollups.filter(backend__in=backends)
+    for attempt in range(2):
+        try:
+            with atomic(using=rollups.db):
+                rollups.delete()
+                PaymentRollup.objects.bulk_create(totals.values())
+            break
+        except IntegrityError:
+            # rebuilt concurrently by another transaction - try again once
+            if attempt:
+                raise
+    return len(totals)
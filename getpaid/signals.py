@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+#: Sent by :meth:`~getpaid.managers.PaymentQuerySet.bulk_transition` for each
+#: batch of updated payments. Arguments: ``sender`` (Payment model), ``name``
+#: (transition), ``field``, ``source`` (list of states), ``target``, ``pks``.
+post_bulk_transition = Signal()
@@ -0,0 +1,137 @@
+"""
+Per-order payment totals (:class:`~getpaid.models.OrderPaymentSummary`).
+
+When ``ORDER_PAYMENT_SUMMARY`` is enabled, every save of a payment applies
+the difference between its old and new contribution to its order's summary,
+in the same transaction. Bulk operations rebuild affected summaries from
+payments and archived payments, which keep counting towards their orders.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+from typing import Dict, Iterable, NamedTuple, Optional
+
+import swapper
+from django.conf import settings
+from django.db import IntegrityError, models
+from django.db.transaction import atomic
+
+from getpaid.types import PaymentStatus as ps
+
+FIELDS = (
+    "payment_count",
+    "failed_count",
+    "amount_locked",
+    "amount_paid",
+    "amount_refunded",
+)
+
+#: Payment fields (attnames) the contribution is computed from.
+STATE_FIELDS = {"order_id", "status", "amount_locked", "amount_paid", "amount_refunded"}
+
+
+class Contribution(NamedTuple):
+    order_id: object
+    failed: bool
+    amount_locked: Decimal
+    amount_paid: Decimal
+    amount_refunded: Decimal
+
+
+def is_enabled() -> bool:
+    return getattr(settings, "GETPAID", {}).get("ORDER_PAYMENT_SUMMARY", False)
+
+
+def get_contribution(payment) -> Contribution:
+    return Contribution(
+        payment.order_id,
+        payment.status == ps.FAILED,
+        payment.amount_locked,
+        payment.amount_paid,
+        payment.amount_refunded,
+    )
+
+
+def _as_values(contribution: Contribution, sign: int) -> Dict[str, object]:
+    return {
+        "payment_count": sign,
+        "failed_count": sign if contribution.failed else 0,
+        "amount_locked": sign * Decimal(contribution.amount_locked or 0),
+        "amount_paid": sign * Decimal(contribution.amount_paid or 0),
+        "amount_refunded": sign * Decimal(contribution.amount_refunded or 0),
+    }
+
+
+def update_order_summary(
+    before: Optional[Contribution], after: Optional[Contribution]
+) -> None:
+    """
+    Apply the change of one payment's contribution to order summaries.
+    ``before`` is None for new payments, ``after`` for deleted ones.
+    """
+    if before == after:
+        return
+    deltas = defaultdict(lambda: defaultdict(int))
+    for contribution, sign in ((before, -1), (after, 1)):
+        if contribution is not None:
+            for name, value in _as_values(contribution, sign).items():
+                deltas[contribution.order_id][name] += value
+    from getpaid.models import OrderPaymentSummary as Summary
+
+    for order_id, delta in deltas.items():
+        changes = {
+            name: models.F(name) + value for name, value in delta.items() if value
+        }
+        if not changes:
+            continue
+        if not Summary.objects.filter(order_id=order_id).update(**changes):
+            # first payment of the order or summaries not built yet
+            rebuild_order_summaries([order_id])
+
+
+def rebuild_order_summaries(order_ids: Optional[Iterable] = None) -> int:
+    """
+    Recompute summaries of given orders (or all orders) from their payments
+    and archived payments. Returns number of summaries written.
+    """
+    from getpaid.models import ArchivedPayment
+    from getpaid.models import OrderPaymentSummary as Summary
+
+    Payment = swapper.load_model("getpaid", "Payment")
+    summaries = Summary.objects.all()
+    if order_ids is not None:
+        order_ids = list(order_ids)
+        summaries = summaries.filter(order_id__in=order_ids)
+    totals = {}
+    for queryset in (Payment._default_manager.all(), ArchivedPayment.objects.all()):
+        if order_ids is not None:
+            queryset = queryset.filter(order_id__in=order_ids)
+        rows = (
+            queryset.order_by()
+            .values("order_id")
+            .annotate(
+                payment_count=models.Count("pk"),
+                failed_count=models.Count("pk", filter=models.Q(status=ps.FAILED)),
+                amount_locked=models.Sum("amount_locked"),
+                amount_paid=models.Sum("amount_paid"),
+                amount_refunded=models.Sum("amount_refunded"),
+            )
+        )
+        for row in rows:
+            summary = totals.setdefault(
+                row["order_id"], Summary(order_id=row["order_id"])
+            )
+            for name in FIELDS:
+                setattr(summary, name, getattr(summary, name) + (row[name] or 0))
+    objs = list(totals.values())
+    for attempt in range(2):
+        try:
+            with atomic(using=summaries.db):
+                summaries.delete()
+                Summary.objects.bulk_create(objs)
+            break
+        except IntegrityError:
+            # created concurrently by another transaction - try again once
+            if attempt:
+                raise
+    return len(objs)
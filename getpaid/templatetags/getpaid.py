@@ -12,3 +12,12 @@ def get_backends(currency):
     This way you can use all fields to render backend chooser.
     """
     return registry.get_backends(currency)
+
+
+@register.simple_tag
+def get_backend_catalog(currency=None):
+    """
+    Get versioned catalog of backends (supporting given currency) with their
+    names, slugs, logos and currencies. See :meth:`PluginRegistry.get_catalog`.
+    """
+    return registry.get_catalog(currency)
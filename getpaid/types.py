@@ -1,6 +1,6 @@
 from decimal import Decimal
 from enum import Enum
-from typing import Any, List, Optional, Union
+from typing import Any, Dict, List, Optional, Union
 
 from django.http import HttpResponse
 
@@ -82,6 +82,20 @@ class PaymentStatus(str, Enum):
         """
         return cls.choices
 
+    @classproperty
+    def terminal(cls):
+        """
+        Statuses that are not expected to change anymore.
+        """
+        return (cls.PAID.value, cls.FAILED.value, cls.REFUNDED.value)
+
+    @classproperty
+    def active(cls):
+        """
+        Statuses of payments that still can change.
+        """
+        return tuple(s.value for s in cls if s.value not in cls.terminal)
+
 
 class BackendMethod(str, Enum):
     GET = "GET"
@@ -112,6 +126,18 @@ class PaymentStatusResponse(GetpaidInternalResponse):
     saved: Optional[bool]
 
 
+class ReconciliationResult(TypedDict):
+    checked: int
+    updated: int
+    skipped: int
+    errors: int
+
+
+class QueuedCallbacksResult(TypedDict):
+    processed: int
+    failed: int
+
+
 class ItemInfo(TypedDict):
     name: str
     quantity: int
@@ -138,9 +164,21 @@ class PaymentForm(TypedDict):
     fields: List[FormField]
 
 
+class PaymentIntent(TypedDict):
+    """
+    Where the buyer should be sent to pay. With ``GET`` method ``fields`` are
+    added to the query string, with ``POST`` they are submitted as a form.
+    """
+
+    target_url: str
+    method: str
+    fields: Dict[str, str]
+
+
 class RestfulResult(TypedDict):
     status_code: int
-    result: HttpResponse
+    result: Optional[HttpResponse]
+    intent: Optional[PaymentIntent]
     target_url: Optional[str]
     form: Optional[PaymentForm]
     message: Optional[Union[str, bytes]]
@@ -22,5 +22,16 @@ urlpatterns = [
         views.callback,
         name="callback",
     ),
+    path(
+        "callback/<slug:backend>/<uuid:pk>/",
+        views.callback,
+        name="callback-backend",
+    ),
+    path(
+        "callback/<slug:backend>/",
+        views.callback_external,
+        name="callback-external",
+    ),
+    path("backends/", views.backend_catalog, name="backend-catalog"),
     path("", include(registry.urls)),
 ]
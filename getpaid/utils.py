@@ -1,4 +1,11 @@
 import collections
+from functools import lru_cache
+from urllib.parse import urlencode
+
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.template.loader import select_template
+from django.utils.module_loading import import_string
 
 
 def update(d, u):
@@ -8,3 +15,38 @@ def update(d, u):
         else:
             d[k] = v
     return d
+
+
+@lru_cache(maxsize=None)
+def import_by_path(path):
+    """
+    Import a dotted path and return the attribute/class designated by the last
+    name in the path. Results are cached for the lifetime of the process.
+    """
+    return import_string(path)
+
+
+@lru_cache(maxsize=None)
+def load_template(names: tuple):
+    """
+    Compiled template selected from ``names``. Results are cached for the
+    lifetime of the process.
+    """
+    return select_template(list(names))
+
+
+@receiver(setting_changed)
+def clear_import_cache(**kwargs):
+    import_by_path.cache_clear()
+    load_template.cache_clear()
+
+
+def get_intent_url(intent) -> str:
+    """
+    Target url of :class:`~getpaid.types.PaymentIntent` with ``GET`` method,
+    including its fields.
+    """
+    url = intent["target_url"]
+    if not intent["fields"]:
+        return url
+    return "{}{}{}".format(url, "&" if "?" in url else "?", urlencode(intent["fields"]))
@@ -1,7 +1,7 @@
-from importlib import import_module
-
 from django.conf import settings
 
+from getpaid.utils import import_by_path
+
 
 def run_getpaid_validators(data):
     backend = data["backend"]
@@ -11,8 +11,6 @@ def run_getpaid_validators(data):
         getpaid_settings.get("BACKENDS", {}).get(backend, {}).get("VALIDATORS", [])
     )
     for path in set(global_validators).union(backend_validators):
-        module_name, validator_name = path.rsplit(".", 1)
-        module = import_module(module_name)
-        validator = getattr(module, validator_name)
+        validator = import_by_path(path)
         data = validator(data)
     return data
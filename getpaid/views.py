@@ -1,11 +1,35 @@
+import asyncio
+import time
+
 import swapper
+from asgiref.sync import sync_to_async
 from django import http
+from django.conf import settings
 from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control, patch_vary_headers
 from django.views import View
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_GET
 from django.views.generic import CreateView, RedirectView
 
+from .archive import get_payment
+from .callbacks import (
+    enqueue_callback,
+    forget_payment_pk,
+    get_callback_fingerprint,
+    get_payment_backend,
+    get_payment_pk,
+    is_callback_fingerprint_registered,
+    register_callback_fingerprint,
+    remember_payment_backend,
+)
+from .conf import backend_configs
+from .exceptions import PaymentLocked
 from .forms import PaymentMethodForm
+from .locking import OPTIMISTIC, get_locking_mode, run_transition
+from .managers import get_payment_queryset
+from .paywall_log import INCOMING, paywall_log
+from .registry import registry
 
 
 class CreatePaymentView(CreateView):
@@ -30,6 +54,58 @@ class CreatePaymentView(CreateView):
 new_payment = CreatePaymentView.as_view()
 
 
+class AsyncViewMixin:
+    """
+    Make ``as_view()`` return a coroutine function, so that class-based views
+    with ``async def`` handlers are served natively under ASGI also on Django
+    versions that don't support async class-based views out of the box.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+
+        async def async_view(request, *args, **kwargs):
+            response = view(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+            return response
+
+        async_view.view_class = view.view_class
+        async_view.view_initkwargs = view.view_initkwargs
+        async_view.__doc__ = cls.__doc__
+        async_view.__module__ = cls.__module__
+        async_view.__name__ = view.__name__
+        return async_view
+
+
+class AsyncCreatePaymentView(AsyncViewMixin, CreatePaymentView):
+    """
+    Async version of :class:`CreatePaymentView`. Communication with paywall
+    is handled by :meth:`getpaid.models.AbstractPayment.aprepare_transaction`.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    async def post(self, request, *args, **kwargs):
+        self.object = None
+        form = self.get_form()
+        if await sync_to_async(form.is_valid)():
+            return await self.form_valid(form)
+        return await sync_to_async(self.form_invalid)(form)
+
+    async def put(self, *args, **kwargs):
+        return await self.post(*args, **kwargs)
+
+    async def form_valid(self, form):
+        payment = await sync_to_async(form.save)()
+        return await payment.aprepare_transaction(request=self.request, view=self)
+
+
+new_payment_async = AsyncCreatePaymentView.as_view()
+
+
 class FallbackView(RedirectView):
     """
     This view (in form of either SuccessView or FailureView) can be used as
@@ -44,7 +120,13 @@ class FallbackView(RedirectView):
 
     def get_redirect_url(self, *args, **kwargs):
         Payment = swapper.load_model("getpaid", "Payment")
-        payment = get_object_or_404(Payment, pk=self.kwargs["pk"])
+        try:
+            # customer may come back long after the payment was archived
+            payment = get_payment(
+                get_payment_queryset(Payment, "redirect"), pk=self.kwargs["pk"]
+            )
+        except Payment.DoesNotExist:
+            raise http.Http404
 
         return payment.get_return_redirect_url(
             request=self.request, success=self.success
@@ -71,12 +153,276 @@ class CallbackDetailView(View):
     setting callback url with payment data.
     The flow is then passed to
     :meth:`getpaid.models.AbstractPayment.handle_paywall_callback`.
+
+    If ``QUEUE_CALLBACKS`` setting is enabled, the callback is only stored
+    and acknowledged immediately with :meth:`get_ack_response`.
+    If ``CALLBACK_DEDUPLICATION_TTL`` is set, repeated deliveries of the same
+    callback are acknowledged without touching the payment.
+    The payment is loaded and updated according to ``TRANSITION_LOCKING``;
+    if it stays locked, :meth:`get_busy_response` is returned.
+
+    Callbacks are checked with processor's
+    :meth:`~getpaid.processor.BaseProcessor.verify_callback` - before anything
+    else if url contains backend's slug, otherwise when the payment is loaded.
+    Rejected callbacks get :meth:`get_rejected_response`.
     """
 
-    def post(self, request, pk, *args, **kwargs):
+    payment = None
+    verified_backend = None
+
+    def get_setting(self, name, default=None):
+        return getattr(settings, "GETPAID", {}).get(name, default)
+
+    def queue_enabled(self):
+        return self.get_setting("QUEUE_CALLBACKS", False)
+
+    def get_ack_response(self, request, *args, **kwargs):
+        return http.HttpResponse("OK")
+
+    def get_busy_response(self, request, *args, **kwargs):
+        # paywalls redeliver callbacks that were not accepted
+        return http.HttpResponse("Busy", status=503)
+
+    def get_rejected_response(self, request, *args, **kwargs):
+        return http.HttpResponseForbidden("Callback rejected")
+
+    def verify_callback(self, request, backend):
+        """
+        Check callback with the processor of ``backend`` (slug) and its
+        cached config. Doesn't touch the database.
+        """
+        try:
+            name, processor = registry.get_by_slug(backend)
+        except KeyError:
+            raise http.Http404
+        if not processor.verify_callback(request, backend_configs.get(name)):
+            return False
+        self.verified_backend = name
+        return True
+
+    def verify_loaded_callback(self, request, payment):
+        if payment.backend == self.verified_backend:
+            return True
+        processor = payment.processor
+        return processor.verify_callback(request, processor.backend_config)
+
+    def get_fingerprint(self, request, pk, backend=None):
+        backend = backend or self.verified_backend or get_payment_backend(pk)
+        if backend is None:
+            return None
+        return get_callback_fingerprint(request, pk, backend)
+
+    def is_duplicate(self, request, pk):
+        ttl = self.get_setting("CALLBACK_DEDUPLICATION_TTL")
+        if not ttl:
+            return False
+        fingerprint = self.get_fingerprint(request, pk)
+        return fingerprint is not None and is_callback_fingerprint_registered(
+            fingerprint, ttl
+        )
+
+    def register_fingerprint(self, request, pk):
+        """
+        Remember successfully handled callback. Done only after handling, so
+        that deliveries arriving in the meantime are handled too and a failed
+        callback is never acknowledged. Queued callbacks are remembered by
+        :func:`~getpaid.callbacks.process_callbacks` once they are handled.
+        """
+        ttl = self.get_setting("CALLBACK_DEDUPLICATION_TTL")
+        if not ttl or self.payment is None:
+            return
+        backend = self.verified_backend or self.payment.backend
+        remember_payment_backend(pk, backend, ttl)
+        register_callback_fingerprint(self.get_fingerprint(request, pk, backend), ttl)
+
+    def can_enqueue(self, request, pk):
+        """
+        Store only callbacks that passed verification or refer to an existing
+        payment, so that the queue can't be filled with made-up callbacks.
+        """
+        if self.verified_backend is not None:
+            return True
+        Payment = swapper.load_model("getpaid", "Payment")
+        return Payment._default_manager.filter(pk=pk).exists()
+
+    def handle_callback(self, request, pk, *args, **kwargs):
+        if self.queue_enabled():
+            if not self.can_enqueue(request, pk):
+                raise http.Http404
+            enqueue_callback(request, pk)
+            return self.get_ack_response(request, *args, **kwargs)
+        return self.process_callback(request, pk, *args, **kwargs)
+
+    def process_callback(self, request, pk, *args, **kwargs):
         Payment = swapper.load_model("getpaid", "Payment")
-        payment = get_object_or_404(Payment, pk=pk)
-        return payment.handle_paywall_callback(request, *args, **kwargs)
+
+        def handle(payment):
+            self.payment = payment
+            if not self.verify_loaded_callback(request, payment):
+                return self.get_rejected_response(request, *args, **kwargs)
+            return payment.handle_paywall_callback(request, *args, **kwargs)
+
+        try:
+            _, response = run_transition(
+                get_payment_queryset(Payment, "callback"), pk, handle
+            )
+        except Payment.DoesNotExist:
+            raise http.Http404
+        except PaymentLocked:
+            return self.get_busy_response(request, *args, **kwargs)
+        return response
+
+    def get_log_data(self, request, pk, started, response=None, error=None):
+        return dict(
+            direction=INCOMING,
+            action="callback",
+            payment_id=getattr(self.payment, "pk", pk),
+            backend=getattr(self.payment, "backend", ""),
+            duration=time.monotonic() - started,
+            request_data=request.body,
+            response=response,
+            error=error,
+        )
+
+    def post(self, request, pk, *args, backend=None, **kwargs):
+        if backend is not None and not self.verify_callback(request, backend):
+            return self.get_rejected_response(request, *args, **kwargs)
+        if self.is_duplicate(request, pk):
+            return self.get_ack_response(request, *args, **kwargs)
+        started = time.monotonic()
+        try:
+            response = self.handle_callback(request, pk, *args, **kwargs)
+        except Exception as e:
+            paywall_log.record(**self.get_log_data(request, pk, started, error=e))
+            raise
+        if response.status_code < 400:
+            self.register_fingerprint(request, getattr(self.payment, "pk", pk))
+        paywall_log.record(**self.get_log_data(request, pk, started, response))
+        return response
 
 
 callback = csrf_exempt(CallbackDetailView.as_view())
+
+
+class ExternalIdCallbackView(CallbackDetailView):
+    """
+    Callback view for paywalls that can't put payment's pk in callback url.
+    The backend is given by its slug, the payment is found by ``external_id``
+    extracted by
+    :meth:`~getpaid.processor.BaseProcessor.get_callback_external_id`.
+    Found primary keys are cached (see ``CALLBACK_LOOKUP_TTL`` setting)
+    and only looked up for callbacks passing
+    :meth:`~getpaid.processor.BaseProcessor.verify_callback`.
+    """
+
+    def get_payment_pk(self, request, backend):
+        try:
+            name, processor = registry.get_by_slug(backend)
+        except KeyError:
+            raise http.Http404
+        external_id = processor.get_callback_external_id(request)
+        if not external_id:
+            raise http.Http404
+        pk = get_payment_pk(name, external_id)
+        if pk is None:
+            raise http.Http404
+        self.lookup = (name, external_id)
+        return pk
+
+    def refresh_payment_pk(self, pk):
+        """
+        Look up payment again when the cached ``pk`` is gone, eg. archived.
+        """
+        forget_payment_pk(*self.lookup)
+        fresh_pk = get_payment_pk(*self.lookup)
+        if fresh_pk is None or fresh_pk == pk:
+            raise http.Http404
+        return fresh_pk
+
+    def process_callback(self, request, pk, *args, **kwargs):
+        try:
+            return super().process_callback(request, pk, *args, **kwargs)
+        except http.Http404:
+            pk = self.refresh_payment_pk(pk)
+        return super().process_callback(request, pk, *args, **kwargs)
+
+    def post(self, request, backend, *args, **kwargs):
+        if not self.verify_callback(request, backend):
+            return self.get_rejected_response(request, *args, **kwargs)
+        pk = self.get_payment_pk(request, backend)
+        if self.queue_enabled():
+            # queued callbacks are not loaded now, don't store a dead pk
+            Payment = swapper.load_model("getpaid", "Payment")
+            if not Payment._default_manager.filter(pk=pk).exists():
+                pk = self.refresh_payment_pk(pk)
+        return super().post(request, pk, *args, **kwargs)
+
+
+callback_external = csrf_exempt(ExternalIdCallbackView.as_view())
+
+
+class AsyncCallbackDetailView(AsyncViewMixin, CallbackDetailView):
+    """
+    Async version of :class:`CallbackDetailView`.
+    """
+
+    async def handle_callback(self, request, pk, *args, **kwargs):
+        if self.queue_enabled():
+            if not await sync_to_async(self.can_enqueue)(request, pk):
+                raise http.Http404
+            await sync_to_async(enqueue_callback)(request, pk)
+            return self.get_ack_response(request, *args, **kwargs)
+        if get_locking_mode() != OPTIMISTIC:
+            # transaction can't span awaits, run whole transition in a thread
+            return await sync_to_async(self.process_callback)(
+                request, pk, *args, **kwargs
+            )
+        Payment = swapper.load_model("getpaid", "Payment")
+        self.payment = await sync_to_async(get_object_or_404)(
+            get_payment_queryset(Payment, "callback"), pk=pk
+        )
+        if not self.verify_loaded_callback(request, self.payment):
+            return self.get_rejected_response(request, *args, **kwargs)
+        return await self.payment.ahandle_paywall_callback(request, *args, **kwargs)
+
+    async def post(self, request, pk, *args, backend=None, **kwargs):
+        if backend is not None and not self.verify_callback(request, backend):
+            return self.get_rejected_response(request, *args, **kwargs)
+        if await sync_to_async(self.is_duplicate)(request, pk):
+            return self.get_ack_response(request, *args, **kwargs)
+        started = time.monotonic()
+        try:
+            response = await self.handle_callback(request, pk, *args, **kwargs)
+        except Exception as e:
+            await paywall_log.arecord(
+                **self.get_log_data(request, pk, started, error=e)
+            )
+            raise
+        if response.status_code < 400:
+            await sync_to_async(self.register_fingerprint)(request, pk)
+        await paywall_log.arecord(**self.get_log_data(request, pk, started, response))
+        return response
+
+
+callback_async = AsyncCallbackDetailView.as_view()
+callback_async.csrf_exempt = True
+
+
+def _catalog_etag(request, *args, **kwargs):
+    return registry.get_catalog(request.GET.get("currency"))["version"]
+
+
+@require_GET
+@condition(etag_func=_catalog_etag)
+def backend_catalog(request):
+    """
+    Catalog of payment backends (optionally ``?currency=XYZ``) as JSON.
+    Answers conditional requests with 304 and allows caching for
+    ``BACKEND_CATALOG_MAX_AGE`` seconds.
+    """
+    response = http.JsonResponse(registry.get_catalog(request.GET.get("currency")))
+    max_age = getattr(settings, "GETPAID", {}).get("BACKEND_CATALOG_MAX_AGE", 300)
+    patch_cache_control(response, public=True, max_age=max_age)
+    if settings.USE_I18N:
+        patch_vary_headers(response, ["Accept-Language"])
+    return response
@@ -0,0 +1,125 @@
+from urllib.parse import urlencode
+
+import pytest
+import swapper
+from django.contrib.admin import AdminSite
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.db import connection
+from django.template.loader import render_to_string
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+
+from getpaid import pagination
+from getpaid.admin import PaymentAdmin
+
+pytestmark = pytest.mark.django_db
+
+Payment = swapper.load_model("getpaid", "Payment")
+
+
+@pytest.fixture
+def model_admin():
+    model_admin = PaymentAdmin(Payment, AdminSite())
+    model_admin.list_per_page = 2
+    model_admin.list_max_show_all = 1
+    return model_admin
+
+
+@pytest.fixture
+def changelist(rf, admin_user, model_admin):
+    def get(url="/"):
+        request = rf.get(url)
+        request.user = admin_user
+        return model_admin.get_changelist_instance(request)
+
+    return get
+
+
+@pytest.fixture
+def payments(payment_factory):
+    payments = [payment_factory() for _ in range(5)]
+    # ties on created_on are resolved by pk
+    Payment.objects.filter(pk__in=[p.pk for p in payments[1:4]]).update(
+        created_on=now()
+    )
+    return list(Payment.objects.order_by("-created_on", "-pk"))
+
+
+def test_keyset_pages(changelist, payments):
+    pages = []
+    cl = changelist()
+    with CaptureQueriesContext(connection) as ctx:
+        while True:
+            pages.append(list(cl.result_list))
+            if not cl.next_page_url:
+                break
+            cl = changelist(cl.next_page_url)
+
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert [p for page in pages for p in page] == payments
+    assert not any("OFFSET" in q["sql"] for q in ctx.captured_queries)
+    assert cl.result_count == 5 and not cl.result_count_is_estimate
+
+    previous = changelist(cl.previous_page_url)
+    assert list(previous.result_list) == payments[2:4]
+    assert changelist(previous.previous_page_url).previous_page_url is None
+    assert previous.first_page_url == "?"
+
+
+def test_other_ordering_uses_numbered_pages(changelist, payments):
+    cl = changelist("/?o=3")
+    assert not cl.keyset
+    assert cl.paginator.num_pages == 3
+
+
+def test_invalid_cursor(changelist, payments):
+    with pytest.raises(IncorrectLookupParameters):
+        changelist("/?after=yesterday")
+
+
+def test_pagination_template(changelist, payments):
+    html = render_to_string(
+        "admin/getpaid/keyset_pagination.html", {"cl": changelist()}
+    )
+    assert "Next" in html and "Previous" not in html
+
+
+def test_estimate_count(monkeypatch, payment_factory):
+    payment_factory()
+    # SQLite has no usable statistics
+    assert pagination.estimate_count(Payment.objects.all()) == (1, False)
+
+    monkeypatch.setattr(pagination, "_table_estimate", lambda qs: 50000)
+    assert pagination.estimate_count(Payment.objects.all()) == (50000, True)
+    assert pagination.estimate_count(Payment.objects.all(), threshold=10**6) == (
+        1,
+        False,
+    )
+
+
+def _search(changelist, term):
+    with CaptureQueriesContext(connection) as ctx:
+        cl = changelist("/?" + urlencode({"q": term}))
+    assert not any("LIKE" in q["sql"] for q in ctx.captured_queries)
+    return {p.pk for p in cl.queryset}
+
+
+def test_exact_search(changelist, payment_factory):
+    first = payment_factory(external_id="ABC-1")
+    second = payment_factory(order=first.order)
+    other = payment_factory(external_id=str(first.order_id))
+
+    assert _search(changelist, str(first.pk)) == {first.pk}
+    assert _search(changelist, "ABC-1") == {first.pk}
+    assert _search(changelist, str(first.order_id)) == {first.pk, second.pk, other.pk}
+    assert _search(changelist, f"ABC-1 {second.pk}") == {first.pk, second.pk}
+    assert _search(changelist, str(first.pk)[:8]) == set()
+
+
+def test_broad_search(changelist, payment_factory):
+    payment = payment_factory(external_id="XYZ-1")
+    payment_factory()
+
+    cl = changelist("/?" + urlencode({"q": "~yz-"}))
+
+    assert [p.pk for p in cl.result_list] == [payment.pk]
@@ -0,0 +1,153 @@
+import json
+from datetime import timedelta
+from io import StringIO
+
+import pytest
+import swapper
+from django import forms
+from django.contrib.admin import AdminSite
+from django.core.management import CommandError, call_command
+from django.urls import reverse
+from django.utils.timezone import now
+
+from getpaid.admin import PaymentAdmin
+from getpaid.exceptions import GetPaidException
+from getpaid.models import ArchivedPayment, OrderPaymentSummary
+from getpaid.summary import rebuild_order_summaries
+from getpaid.types import PaymentStatus as ps
+
+pytestmark = pytest.mark.django_db
+
+Payment = swapper.load_model("getpaid", "Payment")
+
+
+@pytest.fixture
+def archive_enabled(settings):
+    settings.GETPAID = {"PAYMENT_ARCHIVE": True}
+
+
+def _old_payment(payment_factory, status, days=200):
+    payment = payment_factory(external_id="ext-1", custom=False)
+    if status != ps.NEW:
+        payment.confirm_prepared()
+        if status == ps.FAILED:
+            payment.fail()
+        else:
+            payment.confirm_payment()
+            payment.mark_as_paid()
+        payment.save()
+    Payment.objects.filter(pk=payment.pk).update(
+        created_on=now() - timedelta(days=days)
+    )
+    return Payment.objects.get(pk=payment.pk)
+
+
+def _archive(**kwargs):
+    out = StringIO()
+    call_command("getpaid_archive", stdout=out, **kwargs)
+    return out.getvalue()
+
+
+def test_command_requires_setting():
+    with pytest.raises(CommandError):
+        _archive()
+
+
+def test_only_old_terminal_payments_are_moved(archive_enabled, payment_factory):
+    paid = _old_payment(payment_factory, ps.PAID)
+    failed = _old_payment(payment_factory, ps.FAILED)
+    open_ = _old_payment(payment_factory, ps.NEW)
+    recent = _old_payment(payment_factory, ps.PAID, days=1)
+
+    assert "Archived 2 payments." in _archive(batch_size=1)
+
+    assert set(ArchivedPayment.objects.values_list("pk", flat=True)) == {
+        paid.pk,
+        failed.pk,
+    }
+    assert set(Payment.objects.values_list("pk", flat=True)) == {open_.pk, recent.pk}
+    # nothing left to do - running again is safe
+    assert "Archived 0 payments." in _archive()
+
+
+def test_status_must_be_terminal(archive_enabled):
+    with pytest.raises(CommandError):
+        _archive(statuses=[ps.PREPARED])
+
+
+def test_restored_payment(archive_enabled, payment_factory):
+    paid = _old_payment(payment_factory, ps.PAID)
+    _archive()
+
+    restored = ArchivedPayment.objects.get().restore()
+
+    assert isinstance(restored, Payment)
+    assert restored.is_archived
+    assert restored.pk == paid.pk
+    assert restored.status == ps.PAID
+    assert restored.amount_paid == paid.amount_paid
+    assert restored.custom is False
+    assert restored.order == paid.order
+    with pytest.raises(GetPaidException):
+        restored.save()
+
+
+def test_fallback_view_finds_archived_payment(archive_enabled, client, payment_factory):
+    paid = _old_payment(payment_factory, ps.PAID)
+    _archive()
+
+    response = client.get(reverse("getpaid:payment-success", kwargs={"pk": paid.pk}))
+
+    assert response.status_code == 302
+    assert response.url == paid.order.get_absolute_url()
+
+
+def test_callback_does_not_use_archive(archive_enabled, client, payment_factory):
+    paid = _old_payment(payment_factory, ps.PAID)
+    _archive()
+
+    response = client.post(
+        reverse("getpaid:callback", kwargs={"pk": paid.pk}),
+        data=json.dumps({"new_status": ps.PAID}),
+        content_type="application/json",
+    )
+
+    assert response.status_code == 404
+    assert not Payment.objects.filter(pk=paid.pk).exists()
+
+
+def test_order_with_archived_payment_is_not_ready(archive_enabled, payment_factory):
+    paid = _old_payment(payment_factory, ps.PAID)
+    _archive()
+
+    with pytest.raises(forms.ValidationError):
+        paid.order.is_ready_for_payment()
+
+
+def test_archived_payments_count_in_order_summary(settings, payment_factory):
+    settings.GETPAID = {"PAYMENT_ARCHIVE": True, "ORDER_PAYMENT_SUMMARY": True}
+    paid = _old_payment(payment_factory, ps.PAID)
+    order = paid.order
+    _archive()
+
+    rebuild_order_summaries([order.pk])
+
+    summary = OrderPaymentSummary.objects.get(order=order)
+    assert summary.payment_count == 1
+    assert summary.amount_paid == paid.amount_paid
+    with pytest.raises(forms.ValidationError):
+        order.is_ready_for_payment()
+
+
+def test_admin_shows_archived_payment_read_only(archive_enabled, rf, payment_factory):
+    paid = _old_payment(payment_factory, ps.PAID)
+    _archive()
+    model_admin = PaymentAdmin(Payment, AdminSite())
+    request = rf.get("/")
+
+    obj = model_admin.get_object(request, str(paid.pk))
+
+    assert obj.pk == paid.pk
+    assert not model_admin.has_change_permission(request, obj)
+    assert not model_admin.has_delete_permission(request, obj)
+    assert model_admin.get_object(request, "not-a-uuid") is None
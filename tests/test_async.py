@@ -0,0 +1,110 @@
+import json
+import os
+import uuid
+
+import pytest
+import swapper
+from asgiref.sync import async_to_sync, sync_to_async
+from django.http import HttpResponse
+from django.urls import reverse
+
+from getpaid.callbacks import process_callbacks
+from getpaid.models import CallbackFingerprint, QueuedCallback
+from getpaid.processor import AsyncBaseProcessor
+from getpaid.types import ConfirmationMethod as cm
+from getpaid.types import PaymentStatus as ps
+from getpaid.views import callback_async
+
+pytestmark = pytest.mark.django_db
+
+Payment = swapper.load_model("getpaid", "Payment")
+
+
+class AsyncPlugin(AsyncBaseProcessor):
+    display_name = "Async plugin"
+    accepted_currencies = ["EUR"]
+    slug = "async_plugin"
+
+    async def aprepare_transaction(self, request, view=None, **kwargs):
+        self.payment.confirm_prepared()
+        await sync_to_async(self.payment.save)()
+        return HttpResponse("prepared")
+
+    async def afetch_payment_status(self, **kwargs):
+        return {"callback": "confirm_lock"}
+
+
+@pytest.fixture
+def async_payment(payment_factory):
+    payment = payment_factory(backend=AsyncPlugin.slug)
+    payment._processor = AsyncPlugin(payment)
+    return payment
+
+
+def test_async_processor_used_from_sync_code(async_payment):
+    result = async_payment.prepare_transaction(None)
+    assert result.content == b"prepared"
+    assert async_payment.status == ps.PREPARED
+
+
+def test_async_processor_used_from_async_code(async_payment):
+    result = async_to_sync(async_payment.aprepare_transaction)(None)
+    assert result.content == b"prepared"
+    assert Payment.objects.get(pk=async_payment.pk).status == ps.PREPARED
+
+
+def test_async_fetch_and_update_status(async_payment):
+    report = async_to_sync(async_payment.afetch_and_update_status)()
+    assert report["saved"]
+    assert Payment.objects.get(pk=async_payment.pk).status == ps.PRE_AUTH
+
+
+def test_sync_processor_through_adapter(
+    payment_factory, settings, live_server, requests_mock
+):
+    os.environ["_PAYWALL_URL"] = live_server.url
+    settings.GETPAID_BACKEND_SETTINGS = {
+        "getpaid.backends.dummy": {"confirmation_method": cm.PULL}
+    }
+    payment = payment_factory(external_id=uuid.uuid4())
+    payment.confirm_prepared()
+
+    url_get_status = reverse("paywall:get_status", kwargs={"pk": payment.external_id})
+    requests_mock.get(url_get_status, json={"payment_status": ps.FAILED})
+    async_to_sync(payment.afetch_and_update_status)()
+    assert payment.status == ps.FAILED
+
+
+def test_async_callback_view(payment_factory, rf):
+    payment = payment_factory()
+    payment.confirm_prepared()
+    payment.save()
+
+    request = rf.post(
+        "",
+        content_type="application/json",
+        data=json.dumps({"new_status": ps.PRE_AUTH}),
+    )
+    response = async_to_sync(callback_async)(request, pk=payment.pk)
+    assert response.content == b"OK"
+    assert Payment.objects.get(pk=payment.pk).status == ps.PRE_AUTH
+
+
+def test_async_queued_callback_is_not_registered(payment_factory, rf, settings):
+    settings.GETPAID = {"QUEUE_CALLBACKS": True, "CALLBACK_DEDUPLICATION_TTL": 60}
+    payment = payment_factory()
+    payment.confirm_prepared()
+    payment.save()
+    request = rf.post(
+        "",
+        content_type="application/json",
+        data=json.dumps({"new_status": ps.PRE_AUTH}),
+    )
+
+    response = async_to_sync(callback_async)(request, pk=payment.pk)
+
+    assert response.content == b"OK"
+    assert QueuedCallback.objects.count() == 1
+    assert not CallbackFingerprint.objects.exists()
+    process_callbacks()
+    assert CallbackFingerprint.objects.count() == 1
@@ -0,0 +1,424 @@
+import hmac
+import json
+import uuid
+from datetime import timedelta
+from io import StringIO
+
+import pytest
+import swapper
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.timezone import now
+
+from getpaid.backends.dummy.processor import PaymentProcessor
+from getpaid.callbacks import (
+    claim_callbacks,
+    get_callback_fingerprint,
+    get_payment_pk,
+    process_callbacks,
+    register_callback_fingerprint,
+)
+from getpaid.management.commands import getpaid_process_callbacks as process_command
+from getpaid.models import CallbackFingerprint, PaywallLogEntry, QueuedCallback
+from getpaid.paywall_log import paywall_log
+from getpaid.types import PaymentStatus as ps
+
+pytestmark = pytest.mark.django_db
+
+Payment = swapper.load_model("getpaid", "Payment")
+
+
+@pytest.fixture
+def queue_callbacks(settings):
+    settings.GETPAID = {"QUEUE_CALLBACKS": True}
+
+
+def _post_callback(client, pk, status):
+    return client.post(
+        reverse("getpaid:callback", kwargs={"pk": pk}),
+        data=json.dumps({"new_status": status}),
+        content_type="application/json",
+        HTTP_X_SIGNATURE="abc",
+    )
+
+
+def test_callback_is_queued_without_touching_payment(
+    client, payment_factory, queue_callbacks, django_assert_num_queries
+):
+    payment = payment_factory()
+    payment.confirm_prepared()
+    payment.save()
+
+    # payment's existence is checked, then the callback is stored
+    with django_assert_num_queries(2):
+        response = _post_callback(client, payment.pk, ps.PRE_AUTH)
+
+    assert response.status_code == 200
+    entry = QueuedCallback.objects.get()
+    assert entry.payment_id == payment.pk
+    assert json.loads(entry.meta)["HTTP_X_SIGNATURE"] == "abc"
+    assert Payment.objects.get(pk=payment.pk).status == ps.PREPARED
+
+
+def test_queued_callbacks_are_processed(client, payment_factory, queue_callbacks):
+    payment = payment_factory()
+    payment.confirm_prepared()
+    payment.save()
+    gone = payment_factory()
+    _post_callback(client, payment.pk, ps.PRE_AUTH)
+    _post_callback(client, gone.pk, ps.PAID)
+    Payment.objects.filter(pk=gone.pk).delete()
+
+    assert process_callbacks() == {"processed": 1, "failed": 1}
+
+    assert Payment.objects.get(pk=payment.pk).status == ps.PRE_AUTH
+    failed = QueuedCallback.objects.get()
+    assert failed.attempts == 1
+    assert "DoesNotExist" in failed.last_error
+    assert failed.next_attempt_on > now()
+    # retried later
+    assert process_callbacks() == {"processed": 0, "failed": 0}
+
+
+def test_callback_for_unknown_payment_is_not_queued(client, queue_callbacks):
+    response = _post_callback(client, uuid.uuid4(), ps.PAID)
+
+    assert response.status_code == 404
+    assert not QueuedCallback.objects.exists()
+
+
+def test_claimed_callbacks_are_hidden_until_timeout(
+    client, payment_factory, queue_callbacks
+):
+    payment = payment_factory()
+    _post_callback(client, payment.pk, ps.PAID)
+
+    assert [e.attempts for e in claim_callbacks(claim_timeout=60)] == [1]
+    assert claim_callbacks() == []
+    # worker crashed - the callback is taken again after timeout
+    QueuedCallback.objects.update(next_attempt_on=now())
+    assert [e.attempts for e in claim_callbacks(max_attempts=2)] == [2]
+    QueuedCallback.objects.update(next_attempt_on=now())
+    assert claim_callbacks(max_attempts=2) == []
+    assert QueuedCallback.objects.get().next_attempt_on is None
+
+
+def test_failed_callbacks_are_retried_until_limit(
+    client, payment_factory, queue_callbacks
+):
+    payment = payment_factory()
+    _post_callback(client, payment.pk, "unknown_status")
+
+    out = StringIO()
+    for _ in range(3):
+        call_command(
+            "getpaid_process_callbacks", max_attempts=2, retry_delay=0, stdout=out
+        )
+
+    entry = QueuedCallback.objects.get()
+    assert entry.attempts == 2
+    assert entry.next_attempt_on is None
+    QueuedCallback.objects.update(received_on=now() - timedelta(days=31))
+    call_command("getpaid_prune", stdout=out)
+    assert not QueuedCallback.objects.exists()
+
+
+def test_loop_backs_off_after_failures(
+    client, payment_factory, queue_callbacks, monkeypatch
+):
+    payment = payment_factory()
+    _post_callback(client, payment.pk, "unknown_status")
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        if len(sleeps) == 4:
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(process_command.time, "sleep", sleep)
+
+    with pytest.raises(KeyboardInterrupt):
+        call_command(
+            "getpaid_process_callbacks",
+            loop=True,
+            max_attempts=3,
+            retry_delay=0,
+            stdout=StringIO(),
+        )
+
+    # slower after each failed batch, back to normal once the queue is empty
+    assert sleeps == [2, 4, 8, 1]
+
+
+@pytest.fixture
+def deduplicate(settings):
+    settings.GETPAID = {"CALLBACK_DEDUPLICATION_TTL": 60}
+
+
+def test_duplicated_callback_is_short_circuited(client, payment_factory, deduplicate):
+    payment = payment_factory()
+    payment.confirm_prepared()
+    payment.save()
+    _post_callback(client, payment.pk, ps.PRE_AUTH)
+    assert Payment.objects.get(pk=payment.pk).status == ps.PRE_AUTH
+
+    with CaptureQueriesContext(connection) as context:
+        response = _post_callback(client, payment.pk, ps.PRE_AUTH)
+    assert response.status_code == 200
+    assert not any(Payment._meta.db_table in q["sql"] for q in context)
+    assert CallbackFingerprint.objects.count() == 1
+
+
+def test_fingerprint_ignores_json_formatting(rf):
+    first = rf.post("", data='{"a": 1, "b": 2}', content_type="application/json")
+    second = rf.post("", data='{"b":2,"a":1}', content_type="application/json")
+    pk = uuid.uuid4()
+    assert get_callback_fingerprint(first, pk) == get_callback_fingerprint(second, pk)
+    assert get_callback_fingerprint(first, pk) != get_callback_fingerprint(
+        first, uuid.uuid4()
+    )
+    assert get_callback_fingerprint(first, pk, "a") != get_callback_fingerprint(
+        first, pk, "b"
+    )
+
+
+def test_failed_callback_can_be_delivered_again(client, payment_factory, deduplicate):
+    payment = payment_factory()
+    payment.confirm_prepared()
+    payment.save()
+    with pytest.raises(ValueError):
+        _post_callback(client, payment.pk, "unknown_status")
+    assert not CallbackFingerprint.objects.exists()
+
+
+def test_fingerprint_is_registered_after_handling(
+    client, payment_factory, deduplicate, monkeypatch
+):
+    payment = payment_factory()
+    payment.confirm_prepared()
+    payment.save()
+    handle = Payment.handle_paywall_callback
+    seen = []
+
+    def handle_and_check(self, request, **kwargs):
+        seen.append(CallbackFingerprint.objects.exists())
+        return handle(self, request, **kwargs)
+
+    monkeypatch.setattr(Payment, "handle_paywall_callback", handle_and_check)
+    _post_callback(client, payment.pk, ps.PRE_AUTH)
+
+    assert seen == [False]
+    fingerprint = CallbackFingerprint.objects.get().fingerprint
+    request = RequestFactory().post(
+        "",
+        data=json.dumps({"new_status": ps.PRE_AUTH}),
+        content_type="application/json",
+    )
+    assert fingerprint == get_callback_fingerprint(request, payment.pk, payment.backend)
+
+
+def test_queued_callback_fingerprint_is_registered_when_processed(
+    client, payment_factory, settings
+):
+    settings.GETPAID = {"QUEUE_CALLBACKS": True, "CALLBACK_DEDUPLICATION_TTL": 60}
+    payment = payment_factory()
+    payment.confirm_prepared()
+    payment.save()
+    _post_callback(client, payment.pk, ps.PRE_AUTH)
+    _post_callback(client, payment.pk, ps.PRE_AUTH)
+
+    # not handled yet - a failure must still allow redelivery
+    assert not CallbackFingerprint.objects.exists()
+    assert QueuedCallback.objects.count() == 2
+
+    assert process_callbacks() == {"processed": 2, "failed": 0}
+
+    assert Payment.objects.get(pk=payment.pk).status == ps.PRE_AUTH
+    assert CallbackFingerprint.objects.count() == 1
+    _post_callback(client, payment.pk, ps.PRE_AUTH)
+    assert not QueuedCallback.objects.exists()
+
+
+def test_failed_queued_callback_is_not_registered(client, payment_factory, settings):
+    settings.GETPAID = {"QUEUE_CALLBACKS": True, "CALLBACK_DEDUPLICATION_TTL": 60}
+    payment = payment_factory()
+    _post_callback(client, payment.pk, "unknown_status")
+
+    assert process_callbacks() == {"processed": 0, "failed": 1}
+
+    assert not CallbackFingerprint.objects.exists()
+
+
+def test_expired_fingerprints(payment_factory, deduplicate):
+    old = now() - timedelta(seconds=120)
+    CallbackFingerprint.objects.create(fingerprint="a", received_on=old)
+    CallbackFingerprint.objects.create(fingerprint="b", received_on=old)
+
+    assert register_callback_fingerprint("a", ttl=60)
+    call_command("getpaid_prune", stdout=StringIO())
+    assert list(CallbackFingerprint.objects.values_list("pk", flat=True)) == ["a"]
+
+
+def _post_external(client, url, external_id, status):
+    return client.post(
+        url,
+        data=json.dumps({"paymentId": external_id, "new_status": status}),
+        content_type="application/json",
+    )
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        reverse("getpaid:callback-external", kwargs={"backend": "dummy"}),
+        reverse("getpaid:dummy:callback"),
+    ],
+)
+def test_callback_by_external_id(client, payment_factory, url):
+    payment = payment_factory(external_id="ext-1")
+    payment.confirm_prepared()
+    payment.save()
+    _post_external(client, url, "ext-1", ps.PRE_AUTH)
+
+    with CaptureQueriesContext(connection) as ctx:
+        response = _post_external(client, url, "ext-1", ps.PAID)
+
+    assert response.status_code == 200
+    assert Payment.objects.get(pk=payment.pk).status == ps.PAID
+    # pk comes from cache, only the payment itself is fetched
+    selects = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith("SELECT")]
+    assert len(selects) == 1
+    assert "external_id" not in selects[0].split("WHERE")[1]
+
+
+def test_callback_by_unknown_external_id(client, payment_factory):
+    payment = payment_factory(external_id="ext-1")
+    url = reverse("getpaid:callback-external", kwargs={"backend": "dummy"})
+    _post_external(client, url, "ext-1", ps.FAILED)
+    Payment.objects.filter(pk=payment.pk).delete()
+
+    assert _post_external(client, url, "ext-2", ps.PAID).status_code == 404
+    # stale cache entry is dropped
+    assert _post_external(client, url, "ext-1", ps.PAID).status_code == 404
+    assert get_payment_pk("getpaid.backends.dummy", "ext-1") is None
+    other = reverse("getpaid:callback-external", kwargs={"backend": "nope"})
+    assert _post_external(client, other, "ext-1", ps.PAID).status_code == 404
+
+
+@pytest.fixture
+def signed_callbacks(settings, monkeypatch):
+    monkeypatch.setattr(PaymentProcessor, "signature_header", "X-Signature")
+    settings.GETPAID_BACKEND_SETTINGS = {
+        "getpaid.backends.dummy": {
+            **settings.GETPAID_BACKEND_SETTINGS["getpaid.backends.dummy"],
+            "signature_keys": ["new", "old"],
+        }
+    }
+
+
+def _post_signed(client, url, body, key):
+    body = json.dumps(body).encode()
+    return client.post(
+        url,
+        data=body,
+        content_type="application/json",
+        HTTP_X_SIGNATURE=hmac.new(key, body, "sha256").hexdigest(),
+    )
+
+
+def test_forged_callback_is_rejected_before_db(
+    client, payment_factory, signed_callbacks, django_assert_num_queries
+):
+    payment = payment_factory(external_id="ext-1")
+    urls = [
+        reverse("getpaid:callback-external", kwargs={"backend": "dummy"}),
+        reverse(
+            "getpaid:callback-backend", kwargs={"backend": "dummy", "pk": payment.pk}
+        ),
+    ]
+    body = {"paymentId": "ext-1", "new_status": ps.FAILED}
+
+    for url in urls:
+        with django_assert_num_queries(0):
+            assert _post_signed(client, url, body, b"bad").status_code == 403
+            assert _post_external(client, url, "ext-1", ps.FAILED).status_code == 403
+    assert Payment.objects.get(pk=payment.pk).status == ps.NEW
+
+
+@pytest.mark.parametrize("key", [b"new", b"old"])
+def test_signed_callback_is_accepted(client, payment_factory, signed_callbacks, key):
+    payment = payment_factory()
+    payment.confirm_prepared()
+    payment.save()
+    url = reverse(
+        "getpaid:callback-backend", kwargs={"backend": "dummy", "pk": payment.pk}
+    )
+
+    response = _post_signed(client, url, {"new_status": ps.PRE_AUTH}, key)
+
+    assert response.status_code == 200
+    assert Payment.objects.get(pk=payment.pk).status == ps.PRE_AUTH
+
+
+def test_callback_without_backend_is_verified_after_loading(
+    client, payment_factory, signed_callbacks
+):
+    payment = payment_factory()
+    payment.confirm_prepared()
+    payment.save()
+    url = reverse("getpaid:callback", kwargs={"pk": payment.pk})
+
+    response = _post_signed(client, url, {"new_status": ps.PRE_AUTH}, b"bad")
+    assert response.status_code == 403
+    assert Payment.objects.get(pk=payment.pk).status == ps.PREPARED
+
+    response = _post_signed(client, url, {"new_status": ps.PRE_AUTH}, b"new")
+    assert response.status_code == 200
+
+
+def test_queued_callback_is_verified(
+    client, payment_factory, signed_callbacks, queue_callbacks
+):
+    payment = payment_factory()
+    payment.confirm_prepared()
+    payment.save()
+    url = reverse("getpaid:callback", kwargs={"pk": payment.pk})
+    _post_signed(client, url, {"new_status": ps.PRE_AUTH}, b"bad")
+
+    assert process_callbacks() == {"processed": 0, "failed": 1}
+    assert Payment.objects.get(pk=payment.pk).status == ps.PREPARED
+
+
+def test_queued_callback_by_stale_external_id(client, payment_factory, queue_callbacks):
+    url = reverse("getpaid:callback-external", kwargs={"backend": "dummy"})
+    gone = payment_factory(external_id="ext-1")
+    assert get_payment_pk(gone.backend, "ext-1") == gone.pk
+    Payment.objects.filter(pk=gone.pk).delete()
+
+    assert _post_external(client, url, "ext-1", ps.PAID).status_code == 404
+    assert not QueuedCallback.objects.exists()
+
+    payment = payment_factory(external_id="ext-1")
+    assert _post_external(client, url, "ext-1", ps.PAID).status_code == 200
+    assert QueuedCallback.objects.get().payment_id == payment.pk
+
+
+def test_stale_external_id_is_logged_once(client, payment_factory, settings):
+    settings.GETPAID = {"PAYWALL_LOG": True}
+    url = reverse("getpaid:callback-external", kwargs={"backend": "dummy"})
+    gone = payment_factory(external_id="ext-1")
+    get_payment_pk(gone.backend, "ext-1")
+    Payment.objects.filter(pk=gone.pk).delete()
+    payment = payment_factory(external_id="ext-1")
+    payment.confirm_prepared()
+    payment.save()
+    paywall_log.flush()
+
+    assert _post_external(client, url, "ext-1", ps.PRE_AUTH).status_code == 200
+    assert paywall_log.flush() == 1
+    entry = PaywallLogEntry.objects.get()
+    assert entry.payment_id == payment.pk
+    assert entry.error == ""
@@ -0,0 +1,96 @@
+import os
+import threading
+
+import pytest
+
+from getpaid.clients import ClientPool, client_pool
+
+from .tools import Plugin
+
+pytestmark = pytest.mark.django_db
+
+
+class Client:
+    def __init__(self, **kwargs):
+        self.params = kwargs
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ClientPlugin(Plugin):
+    slug = "client_plugin"
+    client_class = Client
+
+    def get_client_params(self):
+        return {"api_key": "secret"}
+
+
+@pytest.fixture
+def pooling(settings):
+    settings.GETPAID = {"POOL_CLIENTS": True}
+
+
+def test_processors_share_pooled_client(payment_factory, pooling):
+    client_pool.clear()
+    first = ClientPlugin(payment_factory(backend=ClientPlugin.slug))
+    second = ClientPlugin(payment_factory(backend=ClientPlugin.slug))
+    assert first.client is second.client
+    assert first.client.params == {"api_key": "secret"}
+
+
+def test_pooling_is_opt_in(payment_factory):
+    first = ClientPlugin(payment_factory(backend=ClientPlugin.slug))
+    second = ClientPlugin(payment_factory(backend=ClientPlugin.slug))
+    assert first.client is not second.client
+
+
+def test_pooling_can_be_disabled(payment_factory, pooling, settings):
+    settings.GETPAID_BACKEND_SETTINGS = {ClientPlugin.slug: {"POOL_CLIENTS": False}}
+    first = ClientPlugin(payment_factory(backend=ClientPlugin.slug))
+    second = ClientPlugin(payment_factory(backend=ClientPlugin.slug))
+    assert first.client is not second.client
+
+
+def test_pool_evicts_least_recently_used():
+    pool = ClientPool(max_size=1, keepalive=60)
+    first = pool.get("a", Client, {})
+    second = pool.get("b", Client, {})
+    assert len(pool) == 1
+    assert pool.get("b", Client, {}) is second
+    # may still be used by a processor
+    assert not first.closed
+
+
+def test_pool_drops_idle_clients():
+    pool = ClientPool(max_size=5, keepalive=-1)
+    first = pool.get("a", Client, {})
+    assert pool.get("a", Client, {}) is not first
+    assert not first.closed
+
+
+def test_pool_forgets_clients_after_fork():
+    pool = ClientPool(max_size=5, keepalive=60)
+    first = pool.get("a", Client, {})
+    pool._pid = os.getpid() + 1  # pretend we're in a forked child
+    assert pool.get("a", Client, {}) is not first
+    assert not first.closed
+
+
+def test_client_is_built_outside_lock():
+    pool = ClientPool(max_size=5, keepalive=60)
+
+    class SlowClient(Client):
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            # other backends stay available while this one connects
+            other = threading.Thread(
+                target=lambda: built.append(pool.get("b", Client, {}))
+            )
+            other.start()
+            other.join(timeout=5)
+
+    built = []
+    pool.get("a", SlowClient, {})
+    assert len(built) == 1
@@ -0,0 +1,75 @@
+import pytest
+from django.core.exceptions import ImproperlyConfigured
+
+from getpaid.conf import BackendConfig, backend_configs
+from getpaid.registry import registry
+
+from .tools import Plugin
+
+pytestmark = pytest.mark.django_db
+
+
+def test_get_setting_precedence():
+    config = BackendConfig(
+        "backend",
+        {"A": "backend", "B": None},
+        {"A": "global", "B": "global", "C": "global"},
+    )
+    assert config.get_setting("A") == "backend"
+    assert config.get_setting("A", "default") == "backend"
+    assert config.get_setting("B") == "global"
+    assert config.get_setting("B", "default") == "global"
+    assert config.get_setting("C") == "global"
+    assert config.get_setting("C", "default") == "default"
+    assert config.get_setting("D") is None
+
+
+def test_signature_keys():
+    assert BackendConfig("backend", {}, {}).signature_keys == ()
+    assert BackendConfig("backend", {"second_key": "k"}, {}).signature_keys == (b"k",)
+    config = BackendConfig(
+        "backend", {"signature_keys": ["new", b"old"], "second_key": "k"}, {}
+    )
+    assert config.signature_keys == (b"new", b"old")
+
+
+def test_config_is_shared_and_read_only(payment_factory):
+    first = payment_factory().processor
+    second = payment_factory().processor
+    assert first.backend_config is second.backend_config
+    with pytest.raises(TypeError):
+        first.config["paywall_method"] = "POST"
+
+
+def test_config_rebuilt_on_settings_change(payment_factory, settings):
+    settings.GETPAID_BACKEND_SETTINGS = {"getpaid.backends.dummy": {"key": "old"}}
+    assert payment_factory().processor.get_setting("key") == "old"
+    settings.GETPAID_BACKEND_SETTINGS = {"getpaid.backends.dummy": {"key": "new"}}
+    assert payment_factory().processor.get_setting("key") == "new"
+
+
+def test_invalid_config_fails_on_register(settings):
+    settings.GETPAID_BACKEND_SETTINGS = {
+        Plugin.slug: {"POST_FORM_CLASS": "getpaid.nonexistent.Form"}
+    }
+    with pytest.raises(ImproperlyConfigured):
+        registry.register(Plugin)
+
+
+def test_processor_validates_config(settings):
+    class StrictPlugin(Plugin):
+        slug = "strict_plugin"
+
+        @classmethod
+        def validate_config(cls, config):
+            if not config.get_setting("api_key"):
+                raise ImproperlyConfigured("api_key is required")
+
+    with pytest.raises(ImproperlyConfigured):
+        registry.register(StrictPlugin)
+
+    settings.GETPAID_BACKEND_SETTINGS = {StrictPlugin.slug: {"api_key": "key"}}
+    registry.register(StrictPlugin)
+    registry.unregister(StrictPlugin.slug)
+    assert StrictPlugin.slug not in registry
+    backend_configs.clear()
@@ -0,0 +1,108 @@
+from datetime import timedelta
+
+import pytest
+import swapper
+from django.utils.timezone import now
+
+from getpaid.models import PaymentTransition
+from getpaid.types import FraudStatus as fs
+from getpaid.types import PaymentStatus as ps
+
+pytestmark = pytest.mark.django_db
+
+Payment = swapper.load_model("getpaid", "Payment")
+
+
+@pytest.fixture
+def history_enabled(settings):
+    settings.GETPAID = {"TRANSITION_HISTORY": True}
+
+
+def test_transitions_are_written_on_save(
+    history_enabled, payment_factory, django_assert_num_queries
+):
+    payment = payment_factory()
+    payment.confirm_prepared()
+    payment.confirm_lock()
+    assert not PaymentTransition.objects.exists()
+
+    # savepoint, update, insert, release
+    with django_assert_num_queries(4):
+        payment.save()
+
+    records = list(
+        PaymentTransition.objects.filter(payment_id=payment.pk).values_list(
+            "field", "name", "source", "target", "backend"
+        )
+    )
+    assert records == [
+        ("status", "confirm_prepared", ps.NEW, ps.PREPARED, payment.backend),
+        ("status", "confirm_lock", ps.PREPARED, ps.PRE_AUTH, payment.backend),
+    ]
+
+
+def test_fraud_transitions_are_recorded(history_enabled, payment_factory):
+    payment = payment_factory()
+    payment._AbstractPayment___mark_for_check()
+    payment.save()
+    record = PaymentTransition.objects.get()
+    assert (record.field, record.target) == ("fraud_status", fs.CHECK)
+
+
+def test_disabled_by_default(payment_factory):
+    payment = payment_factory()
+    payment.confirm_prepared()
+    payment.save()
+    assert not PaymentTransition.objects.exists()
+
+
+def test_bulk_transition_is_recorded(history_enabled, payment_factory):
+    payments = [payment_factory() for _ in range(3)]
+    Payment.objects.bulk_transition("fail")
+    assert PaymentTransition.objects.filter(
+        name="fail", source=ps.NEW, target=ps.FAILED
+    ).count() == len(payments)
+
+
+def _record(payment, source, target, created_on, backend="dummy"):
+    return PaymentTransition(
+        payment_id=payment.pk,
+        backend=backend,
+        field="status",
+        name="test",
+        source=source,
+        target=target,
+        created_on=created_on,
+    )
+
+
+def test_dwell_times_and_funnel(payment_factory):
+    start = now() - timedelta(hours=1)
+    payments = [payment_factory() for _ in range(3)]
+    records = []
+    for i, payment in enumerate(payments):
+        prepared_on = start + timedelta(minutes=i)
+        records.append(_record(payment, ps.NEW, ps.PREPARED, prepared_on))
+        if i < 2:
+            # stay in PREPARED for 10 and 20 minutes
+            left_on = prepared_on + timedelta(minutes=10 * (i + 1))
+            records.append(_record(payment, ps.PREPARED, ps.PRE_AUTH, left_on))
+    PaymentTransition.objects.bulk_create(records)
+
+    stats = PaymentTransition.objects.dwell_times(ps.PREPARED)
+    assert stats == [
+        {
+            "backend": "dummy",
+            "count": 2,
+            "average": timedelta(minutes=15),
+            "maximum": timedelta(minutes=20),
+        }
+    ]
+
+    funnel = PaymentTransition.objects.between(start=start).funnel(
+        [ps.PREPARED, ps.PRE_AUTH, ps.PAID], group_by=["backend"]
+    )
+    assert funnel == [
+        {"backend": "dummy", "states": {ps.PREPARED: 3, ps.PRE_AUTH: 2, ps.PAID: 0}}
+    ]
+    assert PaymentTransition.objects.between(end=start).funnel([ps.PREPARED]) == []
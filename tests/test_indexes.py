@@ -0,0 +1,78 @@
+"""
+Query plans of the queries getpaid runs most often.
+
+Each test runs ``EXPLAIN`` for a hot query and checks that the database
+walks one of the indexes declared in ``AbstractPayment.Meta.indexes``
+instead of scanning the whole table. Plans are only checked on SQLite (used
+by the test suite) and PostgreSQL, as their output names the index used.
+Tables are tiny here, so PostgreSQL is told to avoid sequential scans.
+"""
+import pytest
+import swapper
+from django.db import connection
+
+from getpaid.types import FraudStatus as fs
+from getpaid.types import PaymentStatus as ps
+
+pytestmark = [
+    pytest.mark.django_db,
+    pytest.mark.skipif(
+        connection.vendor not in ("sqlite", "postgresql"),
+        reason="query plan format is database specific",
+    ),
+]
+
+Payment = swapper.load_model("getpaid", "Payment")
+Order = swapper.load_model("getpaid", "Order")
+
+
+@pytest.fixture(autouse=True)
+def no_seqscan():
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SET enable_seqscan = off")
+
+
+def assert_uses_index(queryset, *names):
+    plan = queryset.explain()
+    assert any(name in plan for name in names), plan
+
+
+def test_order_payments_lookup(payment_factory):
+    order = payment_factory().order
+    # AbstractOrder.is_ready_for_payment
+    assert_uses_index(
+        order.payments.exclude(status=ps.FAILED), "getpaid_payment_order_idx"
+    )
+
+
+def test_polling_of_unfinished_payments(payment_factory):
+    payment_factory()
+    queryset = Payment.objects.filter(
+        backend="getpaid.backends.dummy", status__in=ps.active
+    ).order_by("created_on")
+    # SQLite can't match bound IN parameters against the partial index
+    assert_uses_index(
+        queryset, "getpaid_payment_active_idx", "getpaid_payment_status_idx"
+    )
+
+
+def test_status_filter(payment_factory):
+    payment_factory()
+    assert_uses_index(
+        Payment.objects.filter(status=ps.PREPARED), "getpaid_payment_status_idx"
+    )
+
+
+def test_fraud_review(payment_factory):
+    payment_factory()
+    queryset = Payment.objects.filter(fraud_status=fs.CHECK).order_by("created_on")
+    assert_uses_index(queryset, "getpaid_payment_fraud_idx")
+
+
+def test_external_id_lookup(payment_factory):
+    payment_factory()
+    queryset = Payment.objects.filter(
+        external_id="abc", backend="getpaid.backends.dummy"
+    )
+    assert_uses_index(queryset, "getpaid_payment_ext_idx")
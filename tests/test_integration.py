@@ -97,6 +97,38 @@ def test_rest_flow_begin(payment_factory, settings, live_server, requests_mock,
     assert payment.status == ps.PREPARED
 
 
+def test_post_flow_for_rest(payment_factory, settings, live_server, monkeypatch):
+    os.environ["_PAYWALL_URL"] = live_server.url
+    settings.GETPAID_BACKEND_SETTINGS = _prep_conf(api_method=bm.POST)
+    payment = payment_factory(external_id=uuid.uuid4())
+    # REST clients don't need templates nor forms
+    monkeypatch.setattr(TemplateResponse, "__init__", None)
+    monkeypatch.setattr(payment.processor, "get_form", None)
+
+    result = payment.prepare_transaction_for_rest(None)
+
+    assert result["status_code"] == 200
+    assert result["result"] is None
+    assert result["intent"]["method"] == "POST"
+    assert result["target_url"] == result["intent"]["target_url"]
+    fields = {f["name"]: f["value"] for f in result["form"]["fields"]}
+    assert fields["ext_id"] == str(payment.pk)
+    assert payment.status == ps.PREPARED
+
+
+def test_rest_flow_for_rest(payment_factory, settings, live_server, requests_mock):
+    os.environ["_PAYWALL_URL"] = live_server.url
+    settings.GETPAID_BACKEND_SETTINGS = _prep_conf(api_method=bm.REST)
+    payment = payment_factory(external_id=uuid.uuid4())
+    requests_mock.post(str(url_api_register), json={"url": str(url_post_payment)})
+
+    result = payment.prepare_transaction_for_rest(None)
+
+    assert result["status_code"] == 302
+    assert result["target_url"] == str(url_post_payment)
+    assert payment.status == ps.PREPARED
+
+
 # PULL flow
 def test_pull_flow_paid(payment_factory, settings, live_server, requests_mock, rf):
     os.environ["_PAYWALL_URL"] = live_server.url
@@ -0,0 +1,209 @@
+import json
+
+import pytest
+import swapper
+from django.db import connection
+from django.urls import reverse
+from django_fsm import ConcurrentTransition
+
+from getpaid import callbacks, locking
+from getpaid.callbacks import process_callbacks
+from getpaid.exceptions import PaymentLocked
+from getpaid.managers import get_payment_queryset
+from getpaid.types import PaymentStatus as ps
+
+pytestmark = pytest.mark.django_db
+
+Payment = swapper.load_model("getpaid", "Payment")
+Order = swapper.load_model("getpaid", "Order")
+
+
+@pytest.fixture
+def locking_settings(settings):
+    settings.GETPAID = {"TRANSITION_RETRY_DELAY": 0}
+    return settings.GETPAID
+
+
+def _prepared(payment_factory):
+    payment = payment_factory()
+    payment.confirm_prepared()
+    payment.save()
+    return payment
+
+
+@pytest.mark.parametrize("mode", [locking.LOCK, locking.SKIP_LOCKED, locking.NOWAIT])
+def test_lock_queryset(mode):
+    # options unsupported by the database fall back to plain lock
+    assert locking.lock_queryset(Payment.objects.all(), mode).query.select_for_update
+    assert not locking.lock_queryset(
+        Payment.objects.all(), locking.OPTIMISTIC
+    ).query.select_for_update
+
+
+@pytest.mark.parametrize("mode", [locking.LOCK, locking.SKIP_LOCKED, locking.NOWAIT])
+def test_lock_queryset_locks_only_payments(monkeypatch, mode):
+    for feature in (
+        "has_select_for_update",
+        "has_select_for_update_of",
+        "has_select_for_update_skip_locked",
+        "has_select_for_update_nowait",
+    ):
+        monkeypatch.setattr(connection.features, feature, True)
+    queryset = get_payment_queryset(Payment, "callback")
+
+    sql = str(locking.lock_queryset(queryset, mode).query)
+
+    assert Order._meta.db_table in sql
+    lock = sql[sql.index("FOR UPDATE") :]
+    assert Payment._meta.db_table in lock
+    assert Order._meta.db_table not in lock
+
+
+def test_unknown_mode(settings):
+    settings.GETPAID = {"TRANSITION_LOCKING": "pessimistic"}
+    with pytest.raises(ValueError):
+        locking.get_locking_mode()
+
+
+def test_concurrent_update_is_retried(payment_factory, locking_settings):
+    payment = _prepared(payment_factory)
+    stale = Payment.objects.get(pk=payment.pk)
+    other = Payment.objects.get(pk=payment.pk)
+    other.confirm_lock()
+    other.save()
+
+    report = stale.store_status_report(
+        {"callback": "confirm_payment", "amount": payment.amount_required}
+    )
+
+    assert report["saved"]
+    assert stale.status == ps.PARTIAL
+    assert stale.amount_paid == payment.amount_required
+    assert Payment.objects.get(pk=payment.pk).status == ps.PARTIAL
+
+
+def test_retries_are_bounded(payment_factory, locking_settings):
+    locking_settings["TRANSITION_RETRIES"] = 2
+    payment = payment_factory()
+    calls = []
+
+    def conflict(payment):
+        calls.append(payment)
+        raise ConcurrentTransition
+
+    with pytest.raises(ConcurrentTransition):
+        locking.run_transition(Payment.objects.all(), payment.pk, conflict, payment)
+    assert len(calls) == 3
+    assert calls[0] is payment
+    assert calls[1] is not payment
+
+
+@pytest.mark.parametrize("mode", [locking.LOCK, locking.SKIP_LOCKED])
+def test_locking_mode_loads_payment(payment_factory, locking_settings, mode):
+    locking_settings["TRANSITION_LOCKING"] = mode
+    payment = payment_factory()
+
+    used, result = locking.run_transition(
+        Payment.objects.all(), payment.pk, lambda p: p.status, payment
+    )
+
+    assert used is not payment
+    assert used.pk == payment.pk
+    assert result == ps.NEW
+
+
+def test_locked_callback_gets_busy_response(
+    client, payment_factory, locking_settings, monkeypatch
+):
+    locking_settings["TRANSITION_LOCKING"] = locking.SKIP_LOCKED
+    locking_settings["TRANSITION_RETRIES"] = 1
+    # pretend the row is locked by someone else
+    monkeypatch.setattr(locking, "lock_queryset", lambda qs, mode: qs.none())
+    payment = _prepared(payment_factory)
+
+    response = client.post(
+        reverse("getpaid:callback", kwargs={"pk": payment.pk}),
+        data=json.dumps({"new_status": ps.PAID}),
+        content_type="application/json",
+    )
+
+    assert response.status_code == 503
+    assert Payment.objects.get(pk=payment.pk).status == ps.PREPARED
+    with pytest.raises(PaymentLocked):
+        locking.load_payment(Payment.objects.all(), payment.pk, locking.SKIP_LOCKED)
+
+
+def test_locked_callback_is_handled(client, payment_factory, locking_settings):
+    locking_settings["TRANSITION_LOCKING"] = locking.LOCK
+    payment = _prepared(payment_factory)
+
+    response = client.post(
+        reverse("getpaid:callback", kwargs={"pk": payment.pk}),
+        data=json.dumps({"new_status": ps.PAID}),
+        content_type="application/json",
+    )
+
+    assert response.status_code == 200
+    assert Payment.objects.get(pk=payment.pk).status == ps.PAID
+
+
+def test_missing_payment_callback(client, locking_settings):
+    response = client.post(
+        reverse(
+            "getpaid:callback", kwargs={"pk": "6c7b4d8e-0000-4000-8000-000000000000"}
+        ),
+        data="{}",
+        content_type="application/json",
+    )
+    assert response.status_code == 404
+
+
+def _queue_callback(client, payment, status):
+    client.post(
+        reverse("getpaid:callback", kwargs={"pk": payment.pk}),
+        data=json.dumps({"new_status": status}),
+        content_type="application/json",
+    )
+
+
+def test_queued_callback_conflict_is_retried(
+    client, payment_factory, locking_settings, monkeypatch
+):
+    locking_settings["QUEUE_CALLBACKS"] = True
+    payment = _prepared(payment_factory)
+    _queue_callback(client, payment, ps.PAID)
+    build_request = callbacks.build_request
+
+    def build_after_concurrent_change(entry):
+        # payments are already loaded by the worker at this point
+        other = Payment.objects.get(pk=entry.payment_id)
+        other.confirm_lock()
+        other.save()
+        return build_request(entry)
+
+    monkeypatch.setattr(callbacks, "build_request", build_after_concurrent_change)
+
+    assert process_callbacks() == {"processed": 1, "failed": 0}
+    assert Payment.objects.get(pk=payment.pk).status == ps.PAID
+
+
+def test_queued_callback_is_locked(
+    client, payment_factory, locking_settings, monkeypatch
+):
+    locking_settings.update(
+        {"QUEUE_CALLBACKS": True, "TRANSITION_LOCKING": locking.LOCK}
+    )
+    payment = _prepared(payment_factory)
+    _queue_callback(client, payment, ps.PAID)
+    load_payment = locking.load_payment
+    loaded = []
+
+    def spy(queryset, pk, mode):
+        loaded.append((pk, mode))
+        return load_payment(queryset, pk, mode)
+
+    monkeypatch.setattr(locking, "load_payment", spy)
+
+    assert process_callbacks() == {"processed": 1, "failed": 0}
+    assert loaded == [(payment.pk, locking.LOCK)]
+    assert Payment.objects.get(pk=payment.pk).status == ps.PAID
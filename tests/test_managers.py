@@ -0,0 +1,126 @@
+import json
+
+import pytest
+import swapper
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from getpaid.managers import get_payment_queryset
+from getpaid.signals import post_bulk_transition
+from getpaid.types import PaymentStatus as ps
+
+pytestmark = pytest.mark.django_db
+
+Payment = swapper.load_model("getpaid", "Payment")
+Order = swapper.load_model("getpaid", "Order")
+
+
+def _selects_from(queries, model):
+    table = f'FROM "{model._meta.db_table}"'
+    return [
+        q["sql"] for q in queries if q["sql"].startswith("SELECT") and table in q["sql"]
+    ]
+
+
+def test_profiles_load_order(payment_factory):
+    payment = payment_factory()
+    for profile in ("callback", "redirect", "admin"):
+        queryset = Payment.objects.for_profile(profile)
+        assert "order" in queryset.query.select_related
+        assert queryset.get(pk=payment.pk).order == payment.order
+
+
+def test_unknown_profile():
+    with pytest.raises(ValueError):
+        Payment.objects.for_profile("nope")
+
+
+def test_get_payment_queryset_without_profiles(payment_factory):
+    class PlainPayment:
+        class _default_manager:
+            @staticmethod
+            def all():
+                return Order.objects.all()
+
+    assert get_payment_queryset(PlainPayment, "callback").model is Order
+
+
+def test_redirect_needs_one_query(client, payment_factory, django_assert_num_queries):
+    payment = payment_factory()
+    url = reverse("getpaid:payment-success", kwargs={"pk": payment.pk})
+
+    with django_assert_num_queries(1):
+        response = client.get(url)
+
+    assert response.status_code == 302
+    assert response.url == payment.order.get_absolute_url()
+
+
+def test_callback_loads_payment_with_order(client, payment_factory):
+    payment = payment_factory()
+    payment.confirm_prepared()
+    payment.save()
+
+    with CaptureQueriesContext(connection) as ctx:
+        response = client.post(
+            reverse("getpaid:callback", kwargs={"pk": payment.pk}),
+            data=json.dumps({"new_status": ps.PAID}),
+            content_type="application/json",
+        )
+
+    assert response.status_code == 200
+    # order is updated by a post_transition handler of the example project
+    assert len(_selects_from(ctx.captured_queries, Payment)) == 1
+    assert _selects_from(ctx.captured_queries, Order) == []
+    assert Order.objects.get(pk=payment.order_id).status == "P"
+
+
+def test_bulk_transition(payment_factory, django_assert_num_queries):
+    new = [payment_factory() for _ in range(3)]
+    prepared = payment_factory()
+    prepared.confirm_prepared()
+    prepared.save()
+    paid = payment_factory()
+    paid.confirm_prepared()
+    paid.confirm_payment()
+    paid.save()
+
+    with django_assert_num_queries(1):
+        assert Payment.objects.bulk_transition("fail") == 4
+
+    statuses = dict(Payment.objects.values_list("pk", "status"))
+    assert {statuses[p.pk] for p in [*new, prepared]} == {ps.FAILED}
+    assert statuses[paid.pk] == ps.PARTIAL
+
+
+def test_bulk_transition_values_and_notifications(payment_factory):
+    payments = [payment_factory(description="old") for _ in range(5)]
+    received = []
+
+    def listener(sender, **kwargs):
+        received.append(kwargs)
+
+    post_bulk_transition.connect(listener)
+    try:
+        count = Payment.objects.filter(
+            pk__in=[p.pk for p in payments[:3]]
+        ).bulk_transition(
+            "confirm_prepared", notify=True, batch_size=2, description="new"
+        )
+    finally:
+        post_bulk_transition.disconnect(listener)
+
+    assert count == 3
+    assert {pk for r in received for pk in r["pks"]} == {p.pk for p in payments[:3]}
+    assert [len(r["pks"]) for r in received] == [2, 1]
+    assert received[0]["name"] == "confirm_prepared"
+    assert received[0]["source"] == [ps.NEW]
+    assert received[0]["target"] == ps.PREPARED
+    assert Payment.objects.filter(description="new", status=ps.PREPARED).count() == 3
+
+
+@pytest.mark.parametrize("name", ["mark_as_paid", "get_processor", "missing"])
+def test_bulk_transition_rejects(name):
+    with pytest.raises(ValueError):
+        Payment.objects.bulk_transition(name)
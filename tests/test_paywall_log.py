@@ -0,0 +1,159 @@
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import timedelta
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.core.signals import request_finished
+from django.db import connection
+from django.db.transaction import atomic
+from django.urls import reverse, reverse_lazy
+from django.utils.timezone import now
+
+from getpaid import paywall_log as paywall_log_module
+from getpaid.models import PaywallLogEntry
+from getpaid.paywall_log import paywall_log
+from getpaid.types import PaymentStatus as ps
+
+pytestmark = pytest.mark.django_db
+
+url_api_register = reverse_lazy("paywall:api_register")
+
+
+@pytest.fixture
+def log_enabled(settings):
+    settings.GETPAID = {
+        "PAYWALL_LOG": True,
+        "PAYWALL_LOG_BUFFER_SIZE": 3,
+        "PAYWALL_LOG_FLUSH_INTERVAL": 60,
+        "PAYWALL_LOG_MAX_PAYLOAD": 10,
+    }
+    paywall_log.flush()
+    yield
+    paywall_log.flush()
+
+
+def test_log_disabled_by_default(payment_factory, client):
+    payment = payment_factory()
+    client.post(
+        reverse("getpaid:callback", kwargs={"pk": payment.pk}),
+        data=json.dumps({"new_status": ps.FAILED}),
+        content_type="application/json",
+    )
+    assert len(paywall_log) == 0
+
+
+def test_log_is_buffered(payment_factory, live_server, requests_mock, log_enabled):
+    os.environ["_PAYWALL_URL"] = live_server.url
+    requests_mock.post(str(url_api_register), json={"url": "http://example.com/"})
+
+    for _ in range(2):
+        payment_factory(external_id=uuid.uuid4()).prepare_transaction(None)
+    assert len(paywall_log) == 2
+    assert not PaywallLogEntry.objects.exists()
+
+    payment_factory(external_id=uuid.uuid4()).prepare_transaction(None)
+    # never written on caller's path
+    assert len(paywall_log) == 3
+    assert not PaywallLogEntry.objects.exists()
+
+    request_finished.send(sender=None)
+    assert len(paywall_log) == 0
+    entry = PaywallLogEntry.objects.filter(action="prepare_transaction").first()
+    assert entry.direction == PaywallLogEntry.OUTGOING
+    assert entry.status_code == 302
+    assert entry.response_data == "http://exa...[truncated]"
+
+
+def test_callback_is_logged(payment_factory, client, log_enabled):
+    payment = payment_factory()
+    payment.confirm_prepared()
+    payment.save()
+    client.post(
+        reverse("getpaid:callback", kwargs={"pk": payment.pk}),
+        data=json.dumps({"new_status": ps.FAILED}),
+        content_type="application/json",
+    )
+    assert paywall_log.flush() == 1
+
+    entry = PaywallLogEntry.objects.get()
+    assert entry.direction == PaywallLogEntry.INCOMING
+    assert entry.payment_id == payment.pk
+    assert entry.backend == payment.backend
+    assert entry.response_data == "OK"
+
+
+def test_records_survive_rollback(payment_factory, log_enabled):
+    payment = payment_factory()
+    with pytest.raises(ValueError):
+        with atomic():
+            paywall_log.record("out", "charge", payment_id=payment.pk)
+            raise ValueError
+    assert len(paywall_log) == 1
+
+
+def test_stale_records_are_due(log_enabled, settings):
+    paywall_log.record("out", "charge")
+    assert not paywall_log.is_due()
+    assert paywall_log.flush_if_due() == 0
+
+    settings.GETPAID = {**settings.GETPAID, "PAYWALL_LOG_FLUSH_INTERVAL": 0}
+    assert paywall_log.is_due()
+    assert paywall_log.flush_if_due() == 1
+
+
+def test_prune_log(log_enabled):
+    PaywallLogEntry.objects.create(
+        direction="in", action="callback", created_on=now() - timedelta(days=10)
+    )
+    PaywallLogEntry.objects.create(direction="in", action="callback")
+
+    call_command("getpaid_prune", log_days=5, stdout=StringIO())
+    assert PaywallLogEntry.objects.count() == 1
+
+
+def test_commands_flush_the_log(log_enabled):
+    paywall_log.record("out", "charge")
+
+    call_command("getpaid_process_callbacks", stdout=StringIO())
+
+    assert len(paywall_log) == 0
+    assert PaywallLogEntry.objects.filter(action="charge").exists()
+
+
+def test_background_flush_closes_only_its_connection(log_enabled, monkeypatch):
+    closed = []
+    monkeypatch.setattr(
+        paywall_log_module.connections,
+        "close_all",
+        lambda: closed.append("all"),
+    )
+    thread = threading.Thread(target=paywall_log._flush_in_background)
+    thread.start()
+    thread.join()
+
+    assert closed == []
+    assert connection.connection is not None
+    assert PaywallLogEntry.objects.count() == 0
+
+
+def test_exit_waits_for_background_flush(log_enabled):
+    paywall_log.record("out", "charge")
+    locked = threading.Event()
+
+    def background_flush():
+        with paywall_log._flush_lock:
+            locked.set()
+            time.sleep(0.1)
+
+    thread = threading.Thread(target=background_flush)
+    thread.start()
+    locked.wait()
+    paywall_log_module._flush_at_exit()
+
+    assert not thread.is_alive()
+    assert PaywallLogEntry.objects.filter(action="charge").exists()
@@ -0,0 +1,71 @@
+import re
+
+import pytest
+from django.template import Context, Template
+
+from getpaid.post_forms import HiddenInputsPostForm, PaymentHiddenInputsPostForm
+from getpaid.processor import BaseProcessor
+from getpaid.utils import load_template
+
+pytestmark = pytest.mark.django_db
+
+FIELDS = {f"field_{i}": f'value <{i}> & "quoted"' for i in range(20)}
+
+
+def _inputs(html):
+    return re.findall(r'<input type="hidden" name="([^"]*)" value="([^"]*)"', html)
+
+
+def test_renders_like_form():
+    fast = str(HiddenInputsPostForm(FIELDS))
+    slow = PaymentHiddenInputsPostForm(FIELDS).as_p()
+
+    assert "value &lt;1&gt; &amp; &quot;quoted&quot;" in fast
+    assert _inputs(fast) == _inputs(slow)
+    assert len(_inputs(fast)) == len(FIELDS)
+
+
+def test_renders_in_templates():
+    form = HiddenInputsPostForm({"a": "1", "b": None})
+    html = Template("{{ form }}|{{ form.as_p }}").render(Context({"form": form}))
+
+    inputs = (
+        '<input type="hidden" name="a" value="1">'
+        '<input type="hidden" name="b" value="">'
+    )
+    assert html == f"{inputs}|{inputs}"
+    assert form.fields["a"].initial == "1"
+
+
+def test_post_form_class_setting(settings, payment_factory):
+    # dummy backend opts in
+    payment = payment_factory()
+    assert isinstance(payment.processor.get_form(FIELDS), HiddenInputsPostForm)
+
+    settings.GETPAID = {
+        "POST_FORM_CLASS": "getpaid.post_forms.PaymentHiddenInputsPostForm"
+    }
+    payment = payment_factory()
+    assert isinstance(payment.processor.get_form(FIELDS), PaymentHiddenInputsPostForm)
+
+
+def test_base_processor_keeps_regular_form():
+    assert BaseProcessor.post_form_class is None
+
+
+def test_iterates_like_form():
+    form = HiddenInputsPostForm({"a": "1", "b": "2"})
+    html = Template(
+        "{% for field in form %}{{ field }}{% endfor %}|"
+        "{% for field in form.hidden_fields %}{{ field.name }}{% endfor %}"
+    ).render(Context({"form": form}))
+
+    assert _inputs(html) == [("a", "1"), ("b", "2")]
+    assert html.endswith("|ab")
+    assert form["a"].value() == "1"
+    assert not form.visible_fields()
+
+
+def test_template_is_cached():
+    template = load_template(("getpaid_dummy/payment_post_form.html",))
+    assert load_template(("getpaid_dummy/payment_post_form.html",)) is template
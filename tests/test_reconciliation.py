@@ -0,0 +1,100 @@
+import os
+import uuid
+from io import StringIO
+
+import pytest
+import swapper
+from django.core.management import call_command
+from django.urls import reverse
+
+from getpaid.reconciliation import StatusReconciler
+from getpaid.registry import registry
+from getpaid.types import ConfirmationMethod as cm
+from getpaid.types import PaymentStatus as ps
+
+from .tools import Plugin
+
+pytestmark = pytest.mark.django_db
+
+Payment = swapper.load_model("getpaid", "Payment")
+
+
+class BatchPlugin(Plugin):
+    slug = "batch_plugin"
+    calls = 0
+
+    @classmethod
+    def fetch_payment_statuses(cls, payments, **kwargs):
+        cls.calls += 1
+        return {p.pk: {"callback": "confirm_lock"} for p in payments}
+
+
+def _prepared(payment_factory, **kwargs):
+    payment = payment_factory(external_id=uuid.uuid4(), **kwargs)
+    payment.confirm_prepared()
+    payment.save()
+    return payment
+
+
+@pytest.fixture
+def pull_flow(settings, live_server):
+    os.environ["_PAYWALL_URL"] = live_server.url
+    settings.GETPAID_BACKEND_SETTINGS = {
+        "getpaid.backends.dummy": {"confirmation_method": cm.PULL}
+    }
+
+
+def test_reconcile_single_fetches(payment_factory, pull_flow, requests_mock):
+    paid = _prepared(payment_factory)
+    failed = _prepared(payment_factory)
+    done = payment_factory()
+    done.fail()
+    done.save()
+    for payment, status in [(paid, ps.PAID), (failed, ps.FAILED)]:
+        url = reverse("paywall:get_status", kwargs={"pk": payment.external_id})
+        requests_mock.get(url, json={"payment_status": status})
+
+    result = StatusReconciler(batch_size=1, max_workers=2).run()
+
+    assert result == {"checked": 2, "updated": 2, "skipped": 0, "errors": 0}
+    assert Payment.objects.get(pk=paid.pk).status == ps.PARTIAL
+    assert Payment.objects.get(pk=failed.pk).status == ps.FAILED
+
+
+def test_reconcile_uses_batch_hook(payment_factory):
+    payments = [_prepared(payment_factory, backend=BatchPlugin.slug) for _ in range(3)]
+    BatchPlugin.calls = 0
+    registry.register(BatchPlugin)
+    try:
+        result = StatusReconciler(backends=[BatchPlugin.slug]).run()
+    finally:
+        registry.unregister(BatchPlugin.slug)
+
+    assert BatchPlugin.calls == 1
+    assert result["updated"] == 3
+    assert set(Payment.objects.values_list("status", flat=True)) == {ps.PRE_AUTH}
+
+
+def test_reconcile_skips_rows_changed_meanwhile(payment_factory):
+    payment = _prepared(payment_factory)
+    reconciler = StatusReconciler()
+    batch = next(reconciler.iter_batches())
+    Payment.objects.filter(pk=payment.pk).update(status=ps.FAILED)
+
+    result = {"checked": 1, "updated": 0, "skipped": 0, "errors": 0}
+    reconciler.apply(batch, {payment.pk: {"callback": "confirm_lock"}}, result)
+
+    assert result["skipped"] == 1
+    assert Payment.objects.get(pk=payment.pk).status == ps.FAILED
+
+
+def test_reconcile_command(payment_factory, pull_flow, requests_mock):
+    payment = _prepared(payment_factory)
+    url = reverse("paywall:get_status", kwargs={"pk": payment.external_id})
+    requests_mock.get(url, status_code=500)
+    out = StringIO()
+
+    call_command("getpaid_reconcile", stdout=out)
+
+    assert "errors 1" in out.getvalue()
+    assert Payment.objects.get(pk=payment.pk).status == ps.PREPARED
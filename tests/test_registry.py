@@ -1,9 +1,13 @@
+from unittest import mock
+
 from django.conf import settings
+from django.template import Context, Template
 from django.test import TestCase
+from django.urls import reverse
 
 from getpaid import FraudStatus, PaymentStatus
 from getpaid.processor import BaseProcessor
-from getpaid.registry import registry
+from getpaid.registry import EMPTY_CATALOG, registry
 
 from .tools import Plugin
 
@@ -29,10 +33,97 @@ class TestRegistry(TestCase):
         assert len(choices) == 1
         assert choices[0][0] == Plugin.slug
 
+    def test_get_backends(self):
+        backends = registry.get_backends("eur")
+        assert registry[dummy] in backends
+        assert Plugin in backends
+        assert registry.get_backends("XYZ") == []
+
+    def test_index_follows_registration(self):
+        class OtherPlugin(Plugin):
+            accepted_currencies = ["GBP"]
+            slug = "other_plugin"
+
+        registry.register(OtherPlugin)
+        try:
+            assert registry.get_choices("GBP") == [
+                (OtherPlugin.slug, OtherPlugin.display_name)
+            ]
+            assert ("GBP", "GBP") in registry.get_all_supported_currency_choices()
+        finally:
+            registry.unregister(OtherPlugin.slug)
+        assert registry.get_choices("GBP") == []
+
+    def test_catalog(self):
+        catalog = registry.get_catalog("usd")
+        assert catalog["backends"] == [
+            {
+                "name": Plugin.slug,
+                "slug": Plugin.slug,
+                "display_name": Plugin.display_name,
+                "logo_url": Plugin.logo_url,
+                "currencies": ["EUR", "USD"],
+            }
+        ]
+        assert registry.get_catalog("USD") is catalog
+        assert registry.get_catalog("XYZ")["backends"] == []
+
+    def test_unsupported_currencies_are_not_cached(self):
+        registry.get_catalog("USD")
+        cached = len(registry._catalogs)
+        for currency in ("XYZ", "ABC", "not a currency"):
+            assert registry.get_catalog(currency) is EMPTY_CATALOG
+        assert len(registry._catalogs) == cached
+
+    def test_catalog_version_follows_registration(self):
+        class OtherPlugin(Plugin):
+            accepted_currencies = ["GBP"]
+            slug = "other_plugin"
+
+        version = registry.get_catalog()["version"]
+        registry.register(OtherPlugin)
+        try:
+            assert registry.get_catalog()["version"] != version
+        finally:
+            registry.unregister(OtherPlugin.slug)
+        assert registry.get_catalog()["version"] == version
+
+    def test_catalog_endpoint(self):
+        url = reverse("getpaid:backend-catalog")
+        response = self.client.get(url, {"currency": "USD"})
+        assert response.status_code == 200
+        assert response.json() == registry.get_catalog("USD")
+        assert "max-age=300" in response["Cache-Control"]
+        etag = response["ETag"]
+
+        response = self.client.get(url, {"currency": "USD"}, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+
+    def test_catalog_template_tag(self):
+        template = Template(
+            "{% load getpaid %}{% get_backend_catalog 'usd' as catalog %}"
+            "{% for backend in catalog.backends %}{{ backend.slug }}{% endfor %}"
+        )
+        assert template.render(Context()) == Plugin.slug
+
     def test_url(self):
         # dummy plugin contains at least one example endpoint
         assert len(registry.urls) > 0
 
+    def test_urls_are_cached(self):
+        registry.invalidate_urls()
+        with mock.patch("getpaid.registry.importable", return_value=False) as probe:
+            registry.urls
+            registry.urls
+            assert probe.call_count == len(list(registry))
+
+            registry.register(Plugin)
+            registry.urls
+            assert probe.call_count == 2 * len(list(registry))
+        registry.invalidate_urls()
+
     def test_choices(self):
         fraud_choices = FraudStatus.CHOICES
         assert type(fraud_choices) == tuple
@@ -0,0 +1,139 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+import pytest
+import swapper
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError
+from django.utils.timezone import localdate, now
+
+from getpaid.archive import archive_payments
+from getpaid.models import PaymentRollup
+from getpaid.rollups import rebuild_rollups
+from getpaid.types import PaymentStatus as ps
+
+pytestmark = pytest.mark.django_db
+
+Payment = swapper.load_model("getpaid", "Payment")
+
+
+@pytest.fixture
+def rollups_enabled(settings):
+    settings.GETPAID = {"PAYMENT_ROLLUPS": True}
+
+
+def _rollups():
+    return {
+        (r.day, r.backend, r.currency, r.status): (
+            r.count,
+            r.amount_required,
+            r.amount_paid,
+            r.amount_refunded,
+        )
+        for r in PaymentRollup.objects.all()
+        if r.count
+    }
+
+
+def _rebuilt():
+    incremental = _rollups()
+    call_command("getpaid_rebuild_rollups", stdout=StringIO())
+    return incremental, _rollups()
+
+
+def test_rollups_follow_transitions(rollups_enabled, payment_factory):
+    first = payment_factory(amount_required=Decimal("10"))
+    second = payment_factory(amount_required=Decimal("5"))
+    second.confirm_prepared()
+    second.save()
+    second.confirm_payment()
+    second.save()
+
+    today = localdate()
+    assert PaymentRollup.objects.get(status=ps.NEW).count == 1
+    assert PaymentRollup.objects.get(status=ps.PARTIAL).amount_paid == Decimal("5")
+    incremental, rebuilt = _rebuilt()
+    assert incremental == rebuilt
+    assert {key[0] for key in rebuilt} == {today}
+
+    Payment.objects.get(pk=first.pk).delete()
+    incremental, rebuilt = _rebuilt()
+    assert incremental == rebuilt
+    assert PaymentRollup.objects.filter(status=ps.NEW).count() == 0
+
+
+def test_disabled_by_default(payment_factory):
+    payment_factory()
+    assert not PaymentRollup.objects.exists()
+
+
+def test_bulk_transition_rebuilds_day(rollups_enabled, payment_factory):
+    for _ in range(3):
+        payment_factory()
+
+    Payment.objects.bulk_transition("fail")
+
+    assert PaymentRollup.objects.get(status=ps.FAILED).count == 3
+    assert not PaymentRollup.objects.filter(status=ps.NEW).exists()
+
+
+def test_archived_payments_are_counted(rollups_enabled, settings, payment_factory):
+    settings.GETPAID["PAYMENT_ARCHIVE"] = True
+    payment = payment_factory(custom=False)
+    payment.fail()
+    payment.save()
+    Payment.objects.filter(pk=payment.pk).update(created_on=now() - timedelta(days=200))
+    call_command("getpaid_rebuild_rollups", stdout=StringIO())
+    before = _rollups()
+
+    assert sum(archive_payments(now() - timedelta(days=180))) == 1
+    incremental, rebuilt = _rebuilt()
+
+    assert before == incremental == rebuilt
+
+
+def test_totals(rollups_enabled, payment_factory):
+    payment_factory(amount_required=Decimal("10"))
+    payment_factory(amount_required=Decimal("5"))
+    PaymentRollup.objects.create(
+        day=localdate() - timedelta(days=10),
+        backend="getpaid.backends.dummy",
+        currency="EUR",
+        status=ps.NEW,
+        count=1,
+        amount_required=Decimal("1"),
+    )
+
+    (recent,) = PaymentRollup.objects.between(start=localdate()).totals()
+    (overall,) = PaymentRollup.objects.totals(group_by=("backend",))
+
+    assert recent["total_count"] == 2
+    assert recent["total_required"] == Decimal("15")
+    assert overall["total_count"] == 3
+
+
+def test_rebuild_command_rejects_bad_day():
+    with pytest.raises(CommandError):
+        call_command("getpaid_rebuild_rollups", day=["yesterday"])
+
+
+def test_rebuild_gives_up_after_conflicts(payment_factory):
+    payment_factory()
+    with mock.patch.object(
+        PaymentRollup.objects, "bulk_create", side_effect=IntegrityError
+    ) as bulk_create:
+        with pytest.raises(IntegrityError):
+            rebuild_rollups()
+    assert bulk_create.call_count == 2
+
+
+def test_partially_loaded_payments(rollups_enabled, payment_factory):
+    payment = payment_factory()
+    loaded = Payment.objects.only("id", "status", "fraud_status").get(pk=payment.pk)
+    loaded.fail()
+    loaded.save()
+    incremental, rebuilt = _rebuilt()
+    assert incremental == rebuilt
+    assert {key[3] for key in incremental} == {ps.FAILED}
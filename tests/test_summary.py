@@ -0,0 +1,130 @@
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+import pytest
+import swapper
+from django import forms
+from django.core.management import call_command
+from django.db import IntegrityError
+
+from getpaid.models import OrderPaymentSummary
+from getpaid.summary import rebuild_order_summaries
+from getpaid.types import PaymentStatus as ps
+
+pytestmark = pytest.mark.django_db
+
+Payment = swapper.load_model("getpaid", "Payment")
+
+
+@pytest.fixture
+def summary_enabled(settings):
+    settings.GETPAID = {"ORDER_PAYMENT_SUMMARY": True}
+
+
+def _expected(order):
+    payments = list(Payment.objects.filter(order=order))
+    return {
+        "payment_count": len(payments),
+        "failed_count": sum(p.status == ps.FAILED for p in payments),
+        "amount_locked": sum(p.amount_locked for p in payments),
+        "amount_paid": sum(p.amount_paid for p in payments),
+        "amount_refunded": sum(p.amount_refunded for p in payments),
+    }
+
+
+def _actual(order):
+    summary = OrderPaymentSummary.objects.get(order=order)
+    return {name: getattr(summary, name) for name in _expected(order)}
+
+
+def test_summary_follows_transitions(summary_enabled, order_factory, payment_factory):
+    order = order_factory()
+    first = payment_factory(order=order)
+    first.fail()
+    first.save()
+    second = payment_factory(order=order)
+    second.confirm_lock(amount=Decimal("10"))
+    second.save()
+    second.confirm_payment()
+    second.save()
+    assert _actual(order) == _expected(order)
+    assert _actual(order)["payment_count"] == 2
+    assert _actual(order)["failed_count"] == 1
+    assert _actual(order)["amount_paid"] == Decimal("10")
+
+    Payment.objects.get(pk=second.pk).delete()
+    assert _actual(order) == _expected(order)
+
+
+def test_is_ready_for_payment_reads_summary(
+    summary_enabled, order_factory, payment_factory, django_assert_num_queries
+):
+    order = order_factory()
+    payment = payment_factory(order=order)
+
+    with django_assert_num_queries(1):
+        with pytest.raises(forms.ValidationError):
+            order.is_ready_for_payment()
+
+    payment.fail()
+    payment.save()
+    order.refresh_from_db()
+    assert order.is_ready_for_payment()
+
+
+def test_disabled_by_default(payment_factory):
+    payment_factory()
+    assert not OrderPaymentSummary.objects.exists()
+
+
+def test_bulk_paths_rebuild(summary_enabled, order_factory, payment_factory):
+    order = order_factory()
+    for _ in range(3):
+        payment_factory(order=order)
+
+    Payment.objects.filter(order=order).bulk_transition("fail")
+
+    assert _actual(order)["failed_count"] == 3
+
+
+def test_rebuild_command(settings, order_factory, payment_factory):
+    order = order_factory()
+    payment_factory(order=order)
+    out = StringIO()
+
+    call_command("getpaid_rebuild_summaries", stdout=out)
+
+    assert "Rebuilt 1 " in out.getvalue()
+    assert _actual(order) == _expected(order)
+
+
+def test_rebuild_gives_up_after_conflicts(order_factory, payment_factory):
+    payment_factory()
+    with mock.patch.object(
+        OrderPaymentSummary.objects, "bulk_create", side_effect=IntegrityError
+    ) as bulk_create:
+        with pytest.raises(IntegrityError):
+            rebuild_order_summaries()
+    assert bulk_create.call_count == 2
+
+
+@pytest.mark.parametrize("enabled", [False, True])
+def test_partially_loaded_payments(settings, order_factory, payment_factory, enabled):
+    settings.GETPAID = {"ORDER_PAYMENT_SUMMARY": enabled, "PAYMENT_ROLLUPS": enabled}
+    order = order_factory()
+    payment = payment_factory(order=order)
+
+    loaded = Payment.objects.only("id", "status", "fraud_status").get(pk=payment.pk)
+    loaded.fail()
+    loaded.save()
+    if enabled:
+        assert _actual(order) == _expected(order)
+        assert _actual(order)["failed_count"] == 1
+    deferred = Payment.objects.defer("amount_paid").get(pk=payment.pk)
+    deferred.delete()
+
+    # rebuilt summaries drop orders left without payments
+    assert not OrderPaymentSummary.objects.filter(
+        order=order, payment_count__gt=0
+    ).exists()
@@ -0,0 +1,21 @@
+from django.test import override_settings
+
+from getpaid.post_forms import PaymentHiddenInputsPostForm
+from getpaid.utils import import_by_path
+
+
+def test_import_by_path_is_cached():
+    path = "getpaid.post_forms.PaymentHiddenInputsPostForm"
+    import_by_path.cache_clear()
+
+    assert import_by_path(path) is PaymentHiddenInputsPostForm
+    assert import_by_path(path) is PaymentHiddenInputsPostForm
+    assert import_by_path.cache_info().hits == 1
+
+
+def test_import_cache_cleared_on_setting_changed():
+    import_by_path("getpaid.post_forms.PaymentHiddenInputsPostForm")
+    assert import_by_path.cache_info().currsize > 0
+
+    with override_settings(GETPAID={}):
+        assert import_by_path.cache_info().currsize == 0